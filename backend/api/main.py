@@ -1,10 +1,14 @@
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any, List, Optional
+import json
 import os
+import sqlite3
 
-from ..core.database import init_db, get_all_traces
-from ..core.evermem_client import memory_os
+from ..core.database import init_db, list_traces as query_traces, iter_traces, start_replicator, stop_replicator, replication_status
+from ..core.evermem_client import IdempotencyConflict, memory_os, next_cursor
+from ..core.metrics import instrument
 from ..schemas.memory_cells import EvidenceCell, DecisionCell, RequirementCell
 
 def parse_origins(v: str) -> List[str]:
@@ -34,70 +38,147 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument(app, "decision_memory")
 
 @app.on_event("startup")
 def startup():
+    # 迁移已是最新时 init_db 只读一次版本号；Memory 存储在后台加载（索引快照 + 变更日志），不阻塞开始服务；
+    # 加载期间到达的异步请求经 memory_ready 在线程池中等待
     init_db()
+    memory_os.warm_up()
+    start_replicator()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # 先停 outbox 复制（会尽力推送剩余积压），再 flush 后台写队列，保证未送达的 cell 不丢
+    stop_replicator()
+    if memory_os.initialized:
+        # close 同时写入索引快照，下次冷启动直接加载
+        memory_os.close()
+        await memory_os.aclose()
 
 async def verify_token(x_api_key: str = Header(None)):
     if x_api_key != API_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
     return x_api_key
 
+async def memory_ready():
+    """异步接口的依赖：等 Memory 存储加载完成（warm_up 仍在进行时不占住事件循环）。"""
+    await memory_os.ready()
+
 @app.get("/health")
 def health():
-    return {"status": "healthy", "track": "Memory Genesis Track 1", "mode": "MOCK" if memory_os.is_mock else "REAL"}
+    try:
+        replication = replication_status()
+    except sqlite3.Error:
+        replication = None
+    # evermem：熔断状态（closed/open/half_open）与降级期间待补发的本地 cell 数
+    return {"status": "healthy", "track": "Memory Genesis Track 1", "mode": "MOCK" if memory_os.is_mock else "REAL",
+            "replication": replication, "evermem": memory_os.status()}
 
-@app.post("/api/v1/evidence")
-async def create_evidence(payload: EvidenceCell, token: str = Depends(verify_token)):
+# 写接口支持 Idempotency-Key 头：客户端重试同一请求时返回首次创建的 id，不重复写入；
+# 键按接口（cell 类型）划分，同一个键换了请求体返回 422
+@app.post("/api/v1/evidence", dependencies=[Depends(memory_ready)])
+async def create_evidence(payload: EvidenceCell, idempotency_key: Optional[str] = Header(None), token: str = Depends(verify_token)):
     data = payload.model_dump() if hasattr(payload, 'model_dump') else payload.dict()
-    evidence_id = memory_os.commit_cell("Evidence", data, tags={"type": "evidence", "domain": "enterprise"})
+    try:
+        evidence_id = await memory_os.acommit_cell("Evidence", data, tags={"type": "evidence", "domain": "enterprise"},
+                                                   idempotency_key=idempotency_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return {"evidence_id": evidence_id}
 
-@app.get("/api/v1/evidence/search")
-async def search_evidence(tags: str = "", token: str = Depends(verify_token)):
+@app.get("/api/v1/evidence/search", dependencies=[Depends(memory_ready)])
+async def search_evidence(
+    response: Response,
+    tags: str = "",
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    cursor: Optional[str] = None,
+    token: str = Depends(verify_token),
+):
     query_tags = {"type": "evidence"}
     if tags:
         for t in tags.split(","):
             if ":" in t:
                 k, v = t.split(":", 1)
                 query_tags[k] = v
-    return memory_os.recall_by_tags(query_tags)
+    try:
+        cells = await memory_os.arecall_by_tags(query_tags, limit=limit, before=before, after=after, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 响应体保持为列表，下一页游标放在响应头中
+    cursor_out = next_cursor(cells, limit)
+    if cursor_out:
+        response.headers["X-Next-Cursor"] = cursor_out
+    return cells
 
-@app.post("/api/v1/decision")
-async def create_decision(payload: DecisionCell, token: str = Depends(verify_token)):
+@app.post("/api/v1/decision", dependencies=[Depends(memory_ready)])
+async def create_decision(payload: DecisionCell, idempotency_key: Optional[str] = Header(None), token: str = Depends(verify_token)):
     if not payload.citations or len(payload.citations) == 0:
         raise HTTPException(status_code=400, detail="Decision must cite at least one evidence.")
     data = payload.model_dump() if hasattr(payload, 'model_dump') else payload.dict()
-    decision_id = memory_os.commit_cell("Decision", data, tags={"type": "decision"}, citations=payload.citations)
+    try:
+        decision_id = await memory_os.acommit_cell("Decision", data, tags={"type": "decision"}, citations=payload.citations,
+                                                   idempotency_key=idempotency_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return {"decision_id": decision_id}
 
-@app.post("/api/v1/requirement/version")
-async def create_requirement(payload: RequirementCell, token: str = Depends(verify_token)):
+@app.post("/api/v1/requirement/version", dependencies=[Depends(memory_ready)])
+async def create_requirement(payload: RequirementCell, idempotency_key: Optional[str] = Header(None), token: str = Depends(verify_token)):
     if not payload.derived_from or len(payload.derived_from) == 0:
         raise HTTPException(status_code=400, detail="Requirement must be derived from a decision or evidence.")
     data = payload.model_dump() if hasattr(payload, 'model_dump') else payload.dict()
-    req_id = memory_os.commit_cell("Requirement", data, tags={"type": "requirement"}, citations=payload.derived_from)
+    try:
+        req_id = await memory_os.acommit_cell("Requirement", data, tags={"type": "requirement"}, citations=payload.derived_from,
+                                              idempotency_key=idempotency_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return {"requirement_id": req_id}
 
-@app.get("/api/v1/trace_graph")
-async def get_trace_graph(token: str = Depends(verify_token)):
-    all_types = ["evidence", "decision", "requirement", "outcome"]
-    nodes = []
-    edges = []
-    for t in all_types:
-        cells = memory_os.recall_by_tags({"type": t})
-        for cell in cells:
-            nodes.append({
-                "id": cell['id'],
-                "label": cell['type'],
-                "summary": cell['data'].get('summary', cell['data'].get('rationale', cell['type'])),
-                "timestamp": cell['timestamp']
-            })
-            for ref in cell.get('citations', []):
-                edges.append({"source": ref, "target": cell['id'], "type": "cites"})
-    return {"nodes": nodes, "edges": edges}
+@app.get("/api/v1/trace_graph", dependencies=[Depends(memory_ready)])
+async def get_trace_graph(
+    response: Response,
+    since_version: Optional[int] = Query(None, ge=0),
+    epoch: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    token: str = Depends(verify_token),
+):
+    # 援引图随 commit 增量维护；轮询方可用 ETag 或 since_version + epoch（取自上次响应）只取变更部分
+    graph = await memory_os.aget_graph()
+    snapshot = graph.snapshot(since_version, epoch)
+    etag = f'W/"graph-{snapshot["epoch"]}-{snapshot["version"]}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return snapshot
 
 @app.get("/api/v1/traces")
-async def list_traces(token: str = Depends(verify_token)):
-    return get_all_traces()
+def list_traces(
+    response: Response,
+    step: Optional[str] = None,
+    status: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    include_payload: bool = False,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    token: str = Depends(verify_token),
+):
+    filters = dict(step=step, status=status, min_score=min_score, max_score=max_score, before=before, after=after, cursor=cursor)
+    try:
+        if format == "ndjson":
+            # 导出模式：不分页，逐行流式输出
+            rows = iter_traces(include_payload=include_payload, **filters)
+            return StreamingResponse((json.dumps(r, ensure_ascii=False) + "\n" for r in rows), media_type="application/x-ndjson")
+        rows, next_page = query_traces(limit=limit, include_payload=include_payload, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_page:
+        response.headers["X-Next-Cursor"] = next_page
+    return rows
@@ -1,14 +1,20 @@
-from fastapi import FastAPI
+import os
+from typing import Optional
+from fastapi import FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from fastapi.responses import StreamingResponse
+from .schemas.research import DiagnoseIn, PlanIn
+from .batch import arun_batch, spool_body, shutdown_pool
 from .logic import (
     diagnose_client, build_research_plan,
     generate_b2b_discovery_questions,
     generate_qual_interview_guide,
     generate_quant_survey,
-    sql_metric_templates
+    sql_metric_templates,
+    b2b_questions_key, qual_guide_key, quant_survey_key
 )
+from .response_cache import ResponseCache, serialize, json_response
+from .core.metrics import instrument
 
 app = FastAPI(title="User Research Agent (Conversion OS)", version="0.2.0")
 app.add_middleware(
@@ -18,23 +24,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument(app, "research")
 
-class DiagnoseIn(BaseModel):
-    industry: str = Field(..., description="行业，如美妆/营养保健品/SaaS等")
-    market: str = Field(..., description="目标市场，如北美/欧洲/东南亚/国内等")
-    company_stage: str = Field(..., description="公司阶段")
-    growth_driver: List[str] = Field(..., description="增长驱动方式（可多选）")
-    biz_positioning: str = Field(..., description="本次服务业务在公司内部定位")
-    business_form: Optional[str] = Field(default=None, description="具体业务形态（可选）")
-    core_problem: str = Field(..., description="核心问题描述（尽量包含事实/数据）")
-    funnel_hint: Optional[Dict[str, Any]] = Field(default=None, description="可选：漏斗指标提示（任意结构）")
-    constraints: Optional[str] = Field(default=None, description="约束：合规/预算/周期等")
-    target_goal: str = Field(..., description="本次目标（首单转化/复购/退款率/线索等）")
+# 生成器结果按归一化输入缓存为 JSON 字节；SQL 模板与输入无关，启动时序列化一次
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+SQL_TEMPLATES_BODY, SQL_TEMPLATES_ETAG = serialize({"templates": sql_metric_templates()})
 
-class PlanIn(BaseModel):
-    diagnose: Dict[str, Any]
-    timeline: str = Field(default="2-4周", description="期望交付周期")
-    budget_level: str = Field(default="中", description="预算档位：低/中/高")
+@app.on_event("shutdown")
+def on_shutdown():
+    shutdown_pool()
 
 @app.get("/health")
 def health():
@@ -48,18 +47,37 @@ def api_diagnose(payload: DiagnoseIn):
 def api_plan(payload: PlanIn):
     return build_research_plan(payload.diagnose, timeline=payload.timeline, budget_level=payload.budget_level)
 
+@app.post("/api/batch/diagnose_plan")
+async def api_batch_diagnose_plan(request: Request, timeline: str = "2-4周", budget_level: str = "中"):
+    """
+    批量诊断+研究计划：请求体为 JSONL（每行一个 DiagnoseIn），响应按输入顺序流式返回 JSONL。
+    每行结果带 line（输入行号）与 ok；失败的记录给出 error，不中断整个批次。
+    """
+    source = await spool_body(request.stream())
+    stream = arun_batch(source, timeline=timeline, budget_level=budget_level)
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
 @app.post("/api/b2b_questions")
-def api_b2b_questions(payload: DiagnoseIn):
-    return {"questions": generate_b2b_discovery_questions(payload.model_dump())}
+def api_b2b_questions(payload: DiagnoseIn, if_none_match: Optional[str] = Header(None)):
+    inp = payload.model_dump()
+    body, etag = response_cache.get_or_build(("b2b_questions", b2b_questions_key(inp)),
+                                             lambda: {"questions": generate_b2b_discovery_questions(inp)})
+    return json_response(body, etag, if_none_match)
 
 @app.post("/api/qual_guide")
-def api_qual_guide(payload: DiagnoseIn):
-    return {"qual_guide": generate_qual_interview_guide(payload.model_dump())}
+def api_qual_guide(payload: DiagnoseIn, if_none_match: Optional[str] = Header(None)):
+    inp = payload.model_dump()
+    body, etag = response_cache.get_or_build(("qual_guide", qual_guide_key(inp)),
+                                             lambda: {"qual_guide": generate_qual_interview_guide(inp)})
+    return json_response(body, etag, if_none_match)
 
 @app.post("/api/quant_survey")
-def api_quant(payload: DiagnoseIn):
-    return {"quant_survey": generate_quant_survey(payload.model_dump())}
+def api_quant(payload: DiagnoseIn, if_none_match: Optional[str] = Header(None)):
+    inp = payload.model_dump()
+    body, etag = response_cache.get_or_build(("quant_survey", quant_survey_key(inp)),
+                                             lambda: {"quant_survey": generate_quant_survey(inp)})
+    return json_response(body, etag, if_none_match)
 
 @app.get("/api/sql_templates")
-def api_sql_templates():
-    return {"templates": sql_metric_templates()}
+def api_sql_templates(if_none_match: Optional[str] = Header(None)):
+    return json_response(SQL_TEMPLATES_BODY, SQL_TEMPLATES_ETAG, if_none_match)
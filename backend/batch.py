@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .logic import diagnose_client, build_research_plan, diagnose_rules, sync_diagnose_rules
+from .schemas.research import DiagnoseIn
+
+# 进程池大小（0 表示不开进程池，在线程里串行处理）、每个任务包含的记录数、每个 worker 最多排队的任务数。
+# 在途任务数有上限，输入按需读取，因此内存占用与批量大小无关；API 的请求体超过 BATCH_SPOOL_MAX_MEMORY 字节后落盘。
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+BATCH_CHUNK_SIZE = 64
+BATCH_INFLIGHT_PER_WORKER = 2
+BATCH_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+Chunk = List[Tuple[int, str]]
+
+def process_record(line_no: int, line: str, timeline: str = "2-4周", budget_level: str = "中") -> str:
+    """处理一行 DiagnoseIn JSON，返回一行结果 JSON；任何错误都写进该行结果，不影响其他记录。"""
+    out: Dict[str, Any] = {"line": line_no}
+    try:
+        record = json.loads(line)
+        if isinstance(record, dict) and "id" in record:
+            out["id"] = record["id"]
+        diagnose = diagnose_client(DiagnoseIn.model_validate(record).model_dump())
+        plan = build_research_plan(diagnose, timeline=timeline, budget_level=budget_level)
+        out.update(ok=True, diagnose=diagnose, plan=plan)
+    except json.JSONDecodeError as e:
+        out.update(ok=False, error=f"invalid JSON: {e}")
+    except ValidationError as e:
+        out.update(ok=False, error="validation failed", details=json.loads(e.json(include_url=False)))
+    except Exception as e:
+        out.update(ok=False, error=f"{type(e).__name__}: {e}")
+    return json.dumps(out, ensure_ascii=False)
+
+def _process_chunk(chunk: Chunk, timeline: str, budget_level: str, rules: Optional[Tuple[str, List[Dict[str, Any]]]] = None) -> List[str]:
+    # 进程池的 worker 是长驻的，看不到父进程之后替换的规则；每个任务带上当前规则版本，过期时在 worker 内重建
+    if rules is not None:
+        sync_diagnose_rules(*rules)
+    return [process_record(n, line, timeline, budget_level) for n, line in chunk]
+
+def _chunks(lines: Iterable[str], chunk_size: int) -> Iterator[Chunk]:
+    chunk: Chunk = []
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        chunk.append((n, line))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def spool_body(stream: AsyncIterator[bytes]) -> IO[bytes]:
+    """
+    在响应开始前把请求体完整读入临时文件（超过 BATCH_SPOOL_MAX_MEMORY 自动落盘）。
+    StreamingResponse 会在推送响应的同时监听 receive() 上的断开事件，响应开始后再读请求体会丢失数据。
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MAX_MEMORY)
+    async for data in stream:
+        spool.write(data)
+    spool.seek(0)
+    return spool
+
+def run_batch(lines: Iterable[str], timeline: str = "2-4周", budget_level: str = "中",
+              workers: Optional[int] = None, chunk_size: int = BATCH_CHUNK_SIZE) -> Iterator[str]:
+    """同步版本（CLI 使用）：按输入顺序逐行产出结果 JSON（不含换行）。"""
+    workers = BATCH_WORKERS if workers is None else workers
+    chunks = _chunks(lines, chunk_size)
+    if workers <= 0:
+        for chunk in chunks:
+            yield from _process_chunk(chunk, timeline, budget_level)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+        for chunk in chunks:
+            window.append(pool.submit(_process_chunk, chunk, timeline, budget_level, diagnose_rules()))
+            if len(window) >= workers * BATCH_INFLIGHT_PER_WORKER:
+                yield from window.popleft().result()
+        while window:
+            yield from window.popleft().result()
+
+async def arun_batch(source: IO[bytes], timeline: str = "2-4周", budget_level: str = "中",
+                     chunk_size: int = BATCH_CHUNK_SIZE) -> AsyncIterator[str]:
+    """异步版本（API 使用）：逐行读取 spool_body 的结果，在共享进程池中处理，按输入顺序产出 JSONL 行（含换行）；结束后关闭 source。"""
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    limit = max(BATCH_WORKERS, 1) * BATCH_INFLIGHT_PER_WORKER
+    window = deque()
+    try:
+        for chunk in _chunks((raw.decode("utf-8", errors="replace") for raw in source), chunk_size):
+            rules = diagnose_rules() if pool is not None else None
+            window.append(loop.run_in_executor(pool, _process_chunk, chunk, timeline, budget_level, rules))
+            while len(window) >= limit:
+                for line in await window.popleft():
+                    yield line + "\n"
+        while window:
+            for line in await window.popleft():
+                yield line + "\n"
+    finally:
+        source.close()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """API 共享的进程池（首次使用时创建）；BATCH_WORKERS=0 时返回 None，由默认线程池执行。"""
+    global _pool
+    if BATCH_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
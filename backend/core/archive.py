@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Union
+
+from .citation_graph import GRAPH_TYPES
+from .local_store import LocalCellStore
+
+# Memory 归档：gzip 压缩的 NDJSON，每行一条记录，按变更日志（cell_log.seq，即写入顺序）流式写出/读入。
+#   {"kind": "header", "format": ..., "since": <上次检查点 seq 或 null>, "exported_at": ...}
+#   {"kind": "cell", "cell": <cell 载荷，content 保持编码后的形态>}
+#   {"kind": "edge", "source": <被援引 id>, "target": <援引方 id>, "type": "cites"}   # 紧随援引方 cell
+#   {"kind": "checkpoint", "seq": <最后一个 cell 的 seq>, "id": <其 id>, "cells": n, "edges": m}  # 末行，缺失说明文件不完整
+# 增量导出从检查点 seq 之后继续（检查点属于导出它的存储）：检查点之后写入、时间戳却更早的 cell 同样会导出。
+# 全量归档加上依次的增量归档即可重建存储。/1 格式（检查点为 cell id）的归档仍可导入。
+ARCHIVE_FORMAT = "research-os-memory/2"
+_READABLE_FORMATS = ("research-os-memory/1", ARCHIVE_FORMAT)
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = 1000
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+def export_archive(store: LocalCellStore, path: str, since: Union[int, str, None] = None,
+                   batch_size: int = EXPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    把 since（检查点 seq）之后写入的 cell 及其援引边写入 path（.ndjson.gz），返回 {checkpoint, cells, edges}。
+    since 为 cell id 时（/1 格式的旧检查点）从该 cell 在变更日志中的位置继续，已导出过的 cell 可能重复出现，导入时跳过。
+    逐批读取，内存占用与 batch_size 成正比；先写临时文件再改名，中途失败不会留下半个归档。
+    没有新 cell 时检查点保持不变。
+    """
+    after = 0
+    if isinstance(since, str):
+        after = store.log_seq(since)
+        if after is None:
+            raise ValueError(f"Unknown checkpoint id: {since!r}")
+    elif since:
+        after = since
+
+    cells = edges = 0
+    checkpoint, last_id = after, None
+    tmp = path + ".tmp"
+    try:
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as out:
+            out.write(_line({"kind": "header", "format": ARCHIVE_FORMAT, "since": since,
+                             "exported_at": datetime.now().isoformat()}))
+            for seq, payload in store.iter_log(after, batch_size):
+                out.write(_line({"kind": "cell", "cell": payload}))
+                cells += 1
+                checkpoint, last_id = seq, payload['id']
+                # 边与 trace_graph 一致：只导出图内类型 cell 的援引
+                if str(payload['type']).lower() in GRAPH_TYPES:
+                    for ref in payload.get('citations') or []:
+                        out.write(_line({"kind": "edge", "source": ref, "target": payload['id'], "type": "cites"}))
+                        edges += 1
+            out.write(_line({"kind": "checkpoint", "seq": checkpoint, "id": last_id, "cells": cells, "edges": edges}))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {"checkpoint": checkpoint, "cells": cells, "edges": edges}
+
+def read_archive(path: str) -> Iterable[Dict[str, Any]]:
+    """逐行产出归档记录；格式不符或缺少末行检查点时抛 ValueError。"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "null")
+        if not isinstance(header, dict) or header.get("kind") != "header" or header.get("format") not in _READABLE_FORMATS:
+            raise ValueError(f"{path} is not a {ARCHIVE_FORMAT} archive")
+        yield header
+        last = header
+        for line in f:
+            last = json.loads(line)
+            yield last
+        if last.get("kind") != "checkpoint":
+            raise ValueError(f"{path} is truncated (no checkpoint record)")
+
+def import_archive(store: LocalCellStore, path: str, batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    把归档中的 cell 分批写入 store（每批一个事务，已存在的 id 跳过），返回 {checkpoint, cells}。
+    边由 cell 的 citations 推出，不单独导入。多个归档按导出顺序依次导入。
+    """
+    batch, cells, checkpoint = [], 0, None
+    for record in read_archive(path):
+        kind = record.get("kind")
+        if kind == "cell":
+            batch.append(record["cell"])
+            if len(batch) >= batch_size:
+                store.add_many(batch)
+                cells += len(batch)
+                batch = []
+        elif kind == "checkpoint":
+            checkpoint = record.get("seq", record.get("id"))
+    if batch:
+        store.add_many(batch)
+        cells += len(batch)
+    return {"checkpoint": checkpoint, "cells": cells}
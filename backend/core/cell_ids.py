@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+# 类 ULID 的 cell id：11 位微秒时间戳 + 15 位随机数，Crockford base32，共 26 个字符。
+# 字典序即时间序；同一微秒内随机部分递增（单调），因此并发或背靠背提交不会撞号。
+# 时间取微秒而非 ULID 的毫秒，与 cell 的 timestamp 字段精度一致。
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {c: i for i, c in enumerate(_ALPHABET)}
+_TIME_CHARS, _RANDOM_CHARS = 11, 15
+_RANDOM_MAX = (1 << 75) - 1
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, rem = divmod(value, 32)
+        chars.append(_ALPHABET[rem])
+    return "".join(reversed(chars))
+
+def _seed() -> int:
+    # 最高位留空，同一微秒内有足够的递增空间
+    return int.from_bytes(os.urandom(10), "big") >> 6
+
+class CellIdGenerator:
+    """进程内单调递增的 id 分配器（线程安全）。时钟回拨时沿用上一个微秒继续递增。"""
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_us = 0
+        self._last_random = 0
+
+    def new_id(self) -> str:
+        with self._lock:
+            us = int(self._clock() * 1_000_000)
+            if us <= self._last_us:
+                us, random = self._last_us, self._last_random + 1
+                if random > _RANDOM_MAX:
+                    us, random = us + 1, _seed()
+            else:
+                random = _seed()
+            self._last_us, self._last_random = us, random
+        return _encode(us, _TIME_CHARS) + _encode(random, _RANDOM_CHARS)
+
+_generator = CellIdGenerator()
+
+def new_id() -> str:
+    return _generator.new_id()
+
+def is_sortable(cell_id: str) -> bool:
+    """是否为本模块分配的时间有序 id（旧版 "<type>_<timestamp>" 格式返回 False）。"""
+    return len(cell_id) == _TIME_CHARS + _RANDOM_CHARS and all(c in _DECODE for c in cell_id)
+
+def timestamp_of(cell_id: str) -> Optional[str]:
+    """从时间有序 id 还原 ISO 时间戳（与 cell 的 timestamp 字段同格式）；其他格式返回 None。"""
+    if not is_sortable(cell_id):
+        return None
+    us = 0
+    for c in cell_id[:_TIME_CHARS]:
+        us = us * 32 + _DECODE[c]
+    return datetime.fromtimestamp(us // 1_000_000).replace(microsecond=us % 1_000_000).isoformat(timespec="microseconds")
@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpenError(Exception):
+    """熔断打开期间不发远端请求，直接走本地降级。"""
+
+def is_outage(e: Exception) -> bool:
+    """连接/超时错误与 5xx、408、429 视为远端不可用；其他 4xx 说明服务在线，不计入熔断。"""
+    if isinstance(e, httpx.HTTPStatusError):
+        status = e.response.status_code
+        return status >= 500 or status in (408, 429)
+    return isinstance(e, (httpx.TransportError, CircuitOpenError))
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后打开；打开 reset_timeout 秒后进入半开，只放行一个探测请求：
+    成功则关闭，失败则重新打开。状态切换时调用 on_change(old, new)。
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0,
+                 on_change: Optional[Callable[[str, str], None]] = None, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._on_change = on_change
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _transition(self, new: str):
+        old, self._state = self._state, new
+        if new == OPEN:
+            self._opened_at = self._clock()
+            self.trips += 1
+        if old != new and self._on_change is not None:
+            self._on_change(old, new)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._transition(OPEN)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = max(0.0, self.reset_timeout - (self._clock() - self._opened_at)) if self._state == OPEN else 0.0
+            return {"state": self._state, "consecutive_failures": self._failures, "trips": self.trips,
+                    "retry_in_seconds": round(retry_in, 3)}
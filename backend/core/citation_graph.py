@@ -0,0 +1,94 @@
+import bisect
+import threading
+import uuid
+from typing import List, Dict, Any, Optional
+
+# trace_graph 展示的 cell 类型（与 /api/v1/trace_graph 一致）
+GRAPH_TYPES = ("evidence", "decision", "requirement", "outcome")
+
+class CitationGraph:
+    """
+    增量维护的援引图（邻接表）。每新增一个节点或一条边，version 加一；
+    snapshot(since_version, epoch) 只返回该版本之后新增的节点/边，轮询开销与变更量成正比。
+    epoch 在每个实例创建时随机生成，用于区分进程重启后的版本号。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._nodes: List[Dict[str, Any]] = []
+        self._node_versions: List[int] = []
+        self._edges: List[Dict[str, Any]] = []
+        self._edge_versions: List[int] = []
+        self._node_ids = set()
+        self._cites: Dict[str, List[str]] = {}
+        self._cited_by: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def add_cell(self, cell: Dict[str, Any]):
+        """cell 为已解码的召回形态；非 GRAPH_TYPES 或已存在的 cell 忽略。"""
+        if str(cell.get('type', '')).lower() not in GRAPH_TYPES:
+            return
+        data = cell.get('data') or {}
+        with self._lock:
+            if cell['id'] in self._node_ids:
+                return
+            self._node_ids.add(cell['id'])
+            self.version += 1
+            self._nodes.append({
+                "id": cell['id'],
+                "label": cell['type'],
+                "summary": data.get('summary', data.get('rationale', cell['type'])),
+                "timestamp": cell['timestamp']
+            })
+            self._node_versions.append(self.version)
+            for ref in cell.get('citations') or []:
+                self.version += 1
+                self._edges.append({"source": ref, "target": cell['id'], "type": "cites"})
+                self._edge_versions.append(self.version)
+                self._cites.setdefault(cell['id'], []).append(ref)
+                self._cited_by.setdefault(ref, []).append(cell['id'])
+
+    def state(self) -> Dict[str, Any]:
+        """可序列化的图状态（不含 epoch：恢复后的实例使用新的 epoch，旧 ETag 一律失效）。"""
+        with self._lock:
+            return {"version": self.version, "nodes": list(self._nodes), "node_versions": list(self._node_versions),
+                    "edges": list(self._edges), "edge_versions": list(self._edge_versions)}
+
+    def restore(self, state: Dict[str, Any]):
+        """从 state() 的结果恢复（用于空图）。"""
+        with self._lock:
+            self.version = state["version"]
+            self._nodes, self._node_versions = list(state["nodes"]), list(state["node_versions"])
+            self._edges, self._edge_versions = list(state["edges"]), list(state["edge_versions"])
+            self._node_ids = {n['id'] for n in self._nodes}
+            self._cites, self._cited_by = {}, {}
+            for e in self._edges:
+                self._cites.setdefault(e['target'], []).append(e['source'])
+                self._cited_by.setdefault(e['source'], []).append(e['target'])
+
+    def cites(self, cell_id: str) -> List[str]:
+        return list(self._cites.get(cell_id, []))
+
+    def cited_by(self, cell_id: str) -> List[str]:
+        return list(self._cited_by.get(cell_id, []))
+
+    def snapshot(self, since_version: Optional[int] = None, epoch: Optional[str] = None) -> Dict[str, Any]:
+        """
+        since_version 为空时返回全量；否则返回该版本之后新增的节点/边（delta=True）。
+        版本号只在同一 epoch 内可比：epoch 不符（服务重启、由另一个 worker 应答）或 since_version 超过当前版本时退回全量。
+        """
+        with self._lock:
+            delta = since_version is not None and epoch == self.epoch and 0 <= since_version <= self.version
+            start = since_version if delta else 0
+            node_from = bisect.bisect_right(self._node_versions, start)
+            edge_from = bisect.bisect_right(self._edge_versions, start)
+            return {
+                "version": self.version,
+                "epoch": self.epoch,
+                "delta": delta,
+                "nodes": self._nodes[node_from:],
+                "edges": self._edges[edge_from:]
+            }
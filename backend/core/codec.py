@@ -0,0 +1,168 @@
+import base64
+import json
+import os
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # 列在 requirements.txt 中；极简环境未安装时不注册 msgpack 编码
+    msgpack = None
+
+# cell 正文（data）的编码：每种编码把 data 编成字节，cell 载荷中 content 为其文本形态，encoding 字段标明格式；
+# 缺省 encoding 的旧 cell 按 json 解码。二进制编码的文本形态是 base64，只在载荷（HTTP/归档）里使用，
+# 本地存储直接保存原始字节（见 raw / text）。
+DEFAULT_ENCODING = os.getenv("EVERMEM_CELL_ENCODING", "json")
+
+# name -> (encode: data -> bytes, decode: bytes -> data, binary)
+_CODECS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any], bool]] = {}
+
+def register_codec(name: str, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any], binary: bool = True):
+    _CODECS[name] = (encode, decode, binary)
+
+def available_codecs() -> Tuple[str, ...]:
+    return tuple(_CODECS)
+
+def _compact_json(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+register_codec("json", lambda data: json.dumps(data).encode("utf-8"), json.loads, binary=False)
+register_codec("zlib", lambda data: zlib.compress(_compact_json(data), 6),
+               lambda raw: json.loads(zlib.decompress(raw).decode("utf-8")))
+if msgpack is not None:
+    register_codec("msgpack", lambda data: msgpack.packb(data, use_bin_type=True),
+                   lambda raw: msgpack.unpackb(raw, raw=False))
+
+def resolve(encoding: Optional[str]) -> str:
+    """校验编码名；为空时取 DEFAULT_ENCODING。"""
+    encoding = encoding or DEFAULT_ENCODING
+    if encoding not in _CODECS:
+        raise ValueError(f"Unknown cell encoding {encoding!r}; available: {', '.join(_CODECS)}")
+    return encoding
+
+def raw(encoding: Optional[str], content: str) -> bytes:
+    """载荷中的文本形态 -> 原始字节。"""
+    return base64.b64decode(content) if _CODECS[resolve(encoding or "json")][2] else content.encode("utf-8")
+
+def text(encoding: Optional[str], body: bytes) -> str:
+    """原始字节 -> 载荷中的文本形态。"""
+    return base64.b64encode(body).decode("ascii") if _CODECS[resolve(encoding or "json")][2] else body.decode("utf-8")
+
+def encode(data: Any, encoding: str = None) -> Tuple[str, str]:
+    """返回 (encoding, content)，content 为文本形态。"""
+    encoding = resolve(encoding)
+    return encoding, text(encoding, _CODECS[encoding][0](data))
+
+def decode(encoding: Optional[str], content: Union[str, bytes]) -> Any:
+    """content 可以是文本形态（载荷）或原始字节（本地存储）。"""
+    encoding = resolve(encoding or "json")
+    return _CODECS[encoding][1](raw(encoding, content) if isinstance(content, str) else content)
+
+class _Deferred:
+    """一份待解码的正文；多个 LazyCell 副本共享，只解码一次。"""
+    __slots__ = ("encoding", "content", "value", "done")
+
+    def __init__(self, encoding: str, content: Union[str, bytes]):
+        self.encoding = encoding
+        self.content = content
+        self.value = None
+        self.done = False
+
+    def get(self) -> Any:
+        if not self.done:
+            self.value = decode(self.encoding, self.content)
+            self.content = None
+            self.done = True
+        return self.value
+
+class LazyCell(dict):
+    """
+    召回形态的 cell，"data" 在第一次被访问时才解码；只读 id/tags/timestamp 的路径不付解码成本。
+    遍历、比较、序列化等整体访问会先解码。copy() 得到的副本共享同一份解码结果。
+    """
+    def __init__(self, fields: Dict[str, Any], deferred: Optional[_Deferred] = None):
+        super().__init__(fields)
+        self._deferred = deferred
+        if deferred is not None and deferred.done:
+            dict.__setitem__(self, "data", deferred.value)
+
+    @classmethod
+    def from_content(cls, fields: Dict[str, Any], encoding: str, content: Union[str, bytes]) -> "LazyCell":
+        return cls(fields, _Deferred(encoding, content))
+
+    @property
+    def decoded(self) -> bool:
+        return dict.__contains__(self, "data")
+
+    def _materialize(self):
+        if self._deferred is not None and not dict.__contains__(self, "data"):
+            dict.__setitem__(self, "data", self._deferred.get())
+
+    def __missing__(self, key):
+        if key == "data" and self._deferred is not None:
+            self._materialize()
+            return dict.__getitem__(self, "data")
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key == "data":
+            self._materialize()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key) -> bool:
+        return (key == "data" and self._deferred is not None) or dict.__contains__(self, key)
+
+    def __setitem__(self, key, value):
+        if key == "data":
+            self._deferred = None
+        dict.__setitem__(self, key, value)
+
+    def pop(self, key, *default):
+        self._materialize()
+        if key == "data":
+            self._deferred = None
+        return dict.pop(self, key, *default)
+
+    def copy(self) -> "LazyCell":
+        fields = {k: v for k, v in dict.items(self) if k != "data" or self._deferred is None}
+        return LazyCell(fields, self._deferred)
+
+    def __iter__(self):
+        self._materialize()
+        return dict.__iter__(self)
+
+    def __len__(self) -> int:
+        self._materialize()
+        return dict.__len__(self)
+
+    def keys(self):
+        self._materialize()
+        return dict.keys(self)
+
+    def items(self):
+        self._materialize()
+        return dict.items(self)
+
+    def values(self):
+        self._materialize()
+        return dict.values(self)
+
+    def __eq__(self, other) -> bool:
+        self._materialize()
+        if isinstance(other, LazyCell):
+            other._materialize()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other) -> bool:
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        self._materialize()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        # 序列化（pickle/deepcopy）时退化为普通 dict
+        self._materialize()
+        return (dict, (dict(dict.items(self)),))
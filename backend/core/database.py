@@ -1,125 +1,347 @@
 import sqlite3
 import json
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from .evermem_client import memory_os
+from typing import List, Dict, Any, Optional, Iterator
+from .evermem_client import memory_os, encode_cursor, decode_cursor
+from . import outbox, snapshot_store
+from .migrations import migrate
+from .metrics import SQLITE_SECONDS, timed
 
 DB_PATH = "research_os.db"
 
+# WAL 允许读写并发；synchronous=NORMAL 在 WAL 下只在 checkpoint 时 fsync
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
+# 列表接口默认不返回的大字段
+TRACE_SUMMARY_COLUMNS = "trace_id, step_name, status, error_msg, score, timestamp"
+TRACE_FULL_COLUMNS = "trace_id, step_name, input_data, output_data, status, error_msg, score, timestamp"
+
+# 未指定 lineage 的快照归入默认需求线（与 Memory 中的 domain:mre 对应）
+DEFAULT_LINEAGE = "mre"
+
+_local = threading.local()
+
+def get_connection() -> sqlite3.Connection:
+    """每个线程复用一条已调优的连接；DB_PATH 变化时（如测试中）重新打开。"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(DB_PATH, timeout=5.0)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+        _local.path = DB_PATH
+    return conn
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+_replicator = outbox.OutboxReplicator(get_connection, memory_os)
+
+def start_replicator():
+    """启动后台线程，把 outbox 中的 cell 复制到 Memory。"""
+    _replicator.start()
+
+def stop_replicator():
+    _replicator.stop()
+
+def drain_outbox(client=None) -> int:
+    """在当前线程同步推送所有到期的 outbox 条目（脚本/测试/无后台线程时使用）。"""
+    total = 0
+    while True:
+        shipped = outbox.replicate_once(get_connection(), client or memory_os)
+        if not shipped:
+            return total
+        total += shipped
+
+def replication_status() -> Dict[str, Any]:
+    return outbox.stats(get_connection())
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """在当前线程的连接上开启一个事务，正常退出提交，异常回滚。"""
+    conn = get_connection()
+    with conn:
+        yield conn
+
+def _schema_v1(cursor: sqlite3.Cursor):
+    """基线：引入版本号之前的表结构（幂等）。"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS traces (
+            trace_id TEXT PRIMARY KEY,
+            step_name TEXT,
+            input_data TEXT,
+            output_data TEXT,
+            status TEXT,
+            error_msg TEXT,
+            score REAL,
+            timestamp DATETIME
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_traces_timestamp ON traces(timestamp, trace_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_traces_step ON traces(step_name, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_traces_status ON traces(status, timestamp)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS requirement_snapshots (
+            version_id TEXT PRIMARY KEY,
+            parent_version_id TEXT,
+            persona_json TEXT,
+            hypotheses_json TEXT,
+            prd_markdown TEXT,
+            iteration_count INTEGER,
+            timestamp DATETIME
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_parent ON requirement_snapshots(parent_version_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_timestamp ON requirement_snapshots(timestamp)')
+    snapshot_store.init_schema(cursor)
+    outbox.init_schema(cursor)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot_heads (
+            lineage TEXT PRIMARY KEY,
+            version_id TEXT NOT NULL,
+            updated_at DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS evolution_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version_id TEXT,
+            change_type TEXT,
+            target_requirement TEXT,
+            reasoning TEXT,
+            evidence_metric TEXT,
+            timestamp DATETIME
+        )
+    ''')
+
+# 按 PRAGMA user_version 依次执行；新的表结构变更追加在末尾，不修改已发布的步骤
+SCHEMA_MIGRATIONS = (_schema_v1,)
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS traces (
-                trace_id TEXT PRIMARY KEY,
-                step_name TEXT,
-                input_data TEXT,
-                output_data TEXT,
-                status TEXT,
-                error_msg TEXT,
-                score REAL,
-                timestamp DATETIME
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS requirement_snapshots (
-                version_id TEXT PRIMARY KEY,
-                parent_version_id TEXT,
-                persona_json TEXT,
-                hypotheses_json TEXT,
-                prd_markdown TEXT,
-                iteration_count INTEGER,
-                timestamp DATETIME
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS evolution_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                version_id TEXT,
-                change_type TEXT,
-                target_requirement TEXT,
-                reasoning TEXT,
-                evidence_metric TEXT,
-                timestamp DATETIME
-            )
-        ''')
-        conn.commit()
+    migrate(get_connection(), SCHEMA_MIGRATIONS)
+
+def _trace_row(trace: Dict[str, Any], timestamp: str) -> tuple:
+    return (
+        trace['trace_id'], trace['step_name'],
+        json.dumps(trace['input_data']), json.dumps(trace['output_data']),
+        trace['status'], trace.get('error_msg'), trace.get('score', 1.0),
+        timestamp
+    )
+
+def _trace_cell(trace: Dict[str, Any]) -> Dict[str, Any]:
+    return {"cell_type": "Trace", "data": trace, "tags": {"type": "trace", "step": trace['step_name'], "domain": "mre"}}
 
 def save_trace(trace: Dict[str, Any]):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
+    save_traces_bulk([trace])
+
+@timed(SQLITE_SECONDS, op="save_traces_bulk")
+def save_traces_bulk(traces: List[Dict[str, Any]]):
+    """一次事务批量写入多条 trace，同一事务内登记 outbox，由后台复制到 Memory。"""
+    if not traces:
+        return
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.executemany('''
             INSERT INTO traces (trace_id, step_name, input_data, output_data, status, error_msg, score, timestamp)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            trace['trace_id'], trace['step_name'],
-            json.dumps(trace['input_data']), json.dumps(trace['output_data']),
-            trace['status'], trace.get('error_msg'), trace.get('score', 1.0),
-            datetime.now().isoformat()
-        ))
-        conn.commit()
-    memory_os.commit_cell(
-        cell_type="Trace",
-        data=trace,
-        tags={"type": "trace", "step": trace['step_name'], "domain": "mre"}
-    )
+        ''', [_trace_row(t, now) for t in traces])
+        outbox.enqueue(conn, memory_os, [_trace_cell(t) for t in traces])
+    _replicator.wake()
 
+@timed(SQLITE_SECONDS, op="save_snapshot")
 def save_snapshot(snapshot: Dict[str, Any]):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
+    """
+    写入快照并在同一事务内把所属 lineage 的 head 指针移到该版本。
+    正文（persona/hypotheses/PRD）以相对父版本的压缩 delta 存入 snapshot_blobs，定期写完整 checkpoint。
+    """
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.execute('''
             INSERT INTO requirement_snapshots (version_id, parent_version_id, persona_json, hypotheses_json, prd_markdown, iteration_count, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, NULL, NULL, NULL, ?, ?)
         ''', (
             snapshot['version_id'], snapshot.get('parent_version_id'),
-            json.dumps(snapshot['persona']), json.dumps(snapshot['hypotheses']),
-            snapshot['prd_markdown'], snapshot.get('iteration_count', 0),
-            datetime.now().isoformat()
+            snapshot.get('iteration_count', 0), now
         ))
-        conn.commit()
-    memory_os.commit_cell(
-        cell_type="Requirement",
-        data=snapshot,
-        tags={"type": "requirement", "ver": snapshot['version_id'], "domain": "mre"}
+        snapshot_store.write_doc(conn, DB_PATH, snapshot['version_id'], snapshot.get('parent_version_id'), snapshot)
+        conn.execute('''
+            INSERT INTO snapshot_heads (lineage, version_id, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(lineage) DO UPDATE SET version_id = excluded.version_id, updated_at = excluded.updated_at
+        ''', (snapshot.get('lineage', DEFAULT_LINEAGE), snapshot['version_id'], now))
+        outbox.enqueue(conn, memory_os, [{
+            "cell_type": "Requirement",
+            "data": snapshot,
+            "tags": {"type": "requirement", "ver": snapshot['version_id'], "domain": "mre"}
+        }])
+    snapshot_store.cache_doc(DB_PATH, snapshot['version_id'], snapshot)
+    _replicator.wake()
+
+def _evolution_row(log: Dict[str, Any], timestamp: str) -> tuple:
+    return (
+        log['version_id'], log['change_type'], log.get('target_requirement'),
+        log['reasoning'], json.dumps(log.get('evidence_metric')),
+        timestamp
     )
 
+def _evolution_cell(log: Dict[str, Any]) -> Dict[str, Any]:
+    return {"cell_type": "Evolution", "data": log, "tags": {"type": "evolution", "ref": log['version_id'], "domain": "mre"}}
+
 def save_evolution_log(log: Dict[str, Any]):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
+    save_evolution_logs_bulk([log])
+
+@timed(SQLITE_SECONDS, op="save_evolution_logs_bulk")
+def save_evolution_logs_bulk(logs: List[Dict[str, Any]]):
+    if not logs:
+        return
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.executemany('''
             INSERT INTO evolution_logs (version_id, change_type, target_requirement, reasoning, evidence_metric, timestamp)
             VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            log['version_id'], log['change_type'], log.get('target_requirement'),
-            log['reasoning'], json.dumps(log.get('evidence_metric')),
-            datetime.now().isoformat()
-        ))
-        conn.commit()
-    memory_os.commit_cell(
-        cell_type="Evolution",
-        data=log,
-        tags={"type": "evolution", "ref": log['version_id'], "domain": "mre"}
-    )
+        ''', [_evolution_row(log, now) for log in logs])
+        outbox.enqueue(conn, memory_os, [_evolution_cell(log) for log in logs])
+    _replicator.wake()
+
+def _snapshot_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    res = dict(row)
+    if res['persona_json'] is None:
+        # delta 布局：正文从 snapshot_blobs 透明重建，保持与旧版相同的返回字段
+        doc = snapshot_store.read_doc(get_connection(), DB_PATH, res['version_id']) or {}
+        res['persona_json'] = json.dumps(doc.get('persona'))
+        res['hypotheses_json'] = json.dumps(doc.get('hypotheses'))
+        res['prd_markdown'] = doc.get('prd_markdown')
+    res['persona'] = json.loads(res['persona_json'])
+    res['hypotheses'] = json.loads(res['hypotheses_json'])
+    return res
 
-def get_latest_snapshot():
-    memories = memory_os.recall_by_tags({"type": "requirement", "domain": "mre"})
+@timed(SQLITE_SECONDS, op="get_latest_snapshot")
+def get_latest_snapshot(lineage: str = DEFAULT_LINEAGE):
+    # 先查 head 指针（两次主键查找），没有 head 的旧数据再回退到 Memory / 时间索引
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+        SELECT s.* FROM snapshot_heads h JOIN requirement_snapshots s ON s.version_id = h.version_id
+        WHERE h.lineage = ?
+    ''', (lineage,))
+    row = cursor.fetchone()
+    if row:
+        return _snapshot_from_row(row)
+    memories = memory_os.recall_by_tags({"type": "requirement", "domain": "mre"}, limit=1)
     if memories:
         return memories[0]['data']
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM requirement_snapshots ORDER BY timestamp DESC LIMIT 1')
-        row = cursor.fetchone()
-        if row:
-            res = dict(row)
-            res['persona'] = json.loads(res['persona_json'])
-            res['hypotheses'] = json.loads(res['hypotheses_json'])
-            return res
-        return None
+    cursor.execute('SELECT * FROM requirement_snapshots ORDER BY timestamp DESC LIMIT 1')
+    row = cursor.fetchone()
+    if row:
+        return _snapshot_from_row(row)
+    return None
+
+@timed(SQLITE_SECONDS, op="get_snapshot_history")
+def get_snapshot_history(version_id: Optional[str] = None, limit: Optional[int] = None,
+                         lineage: str = DEFAULT_LINEAGE) -> List[Dict[str, Any]]:
+    """
+    沿 parent_version_id 回溯版本链（单条递归 CTE），从 version_id（默认 lineage 的 head）开始，
+    由新到旧最多返回 limit 个版本。
+    """
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    if version_id is None:
+        head = cursor.execute('SELECT version_id FROM snapshot_heads WHERE lineage = ?', (lineage,)).fetchone()
+        if head is None:
+            return []
+        version_id = head['version_id']
+    cursor.execute('''
+        WITH RECURSIVE chain(version_id, parent_version_id, depth) AS (
+            SELECT version_id, parent_version_id, 0 FROM requirement_snapshots WHERE version_id = ?
+            UNION ALL
+            SELECT s.version_id, s.parent_version_id, c.depth + 1
+            FROM requirement_snapshots s JOIN chain c ON s.version_id = c.parent_version_id
+            WHERE c.depth + 1 < ?
+        )
+        SELECT s.* FROM chain c JOIN requirement_snapshots s ON s.version_id = c.version_id
+        ORDER BY c.depth
+    ''', (version_id, limit if limit is not None else 2 ** 31))
+    return [_snapshot_from_row(row) for row in cursor.fetchall()]
 
+@timed(SQLITE_SECONDS, op="get_all_traces")
 def get_all_traces():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('SELECT * FROM traces ORDER BY timestamp DESC')
+    return [dict(row) for row in cursor.fetchall()]
+
+def _trace_query(columns: str, step: Optional[str] = None, status: Optional[str] = None,
+                 min_score: Optional[float] = None, max_score: Optional[float] = None,
+                 before: Optional[str] = None, after: Optional[str] = None,
+                 cursor: Optional[str] = None) -> tuple:
+    clauses, params = [], []
+    if step is not None:
+        clauses.append("step_name = ?"); params.append(step)
+    if status is not None:
+        clauses.append("status = ?"); params.append(status)
+    if min_score is not None:
+        clauses.append("score >= ?"); params.append(min_score)
+    if max_score is not None:
+        clauses.append("score <= ?"); params.append(max_score)
+    if before is not None:
+        clauses.append("timestamp < ?"); params.append(before)
+    if after is not None:
+        clauses.append("timestamp > ?"); params.append(after)
+    if cursor:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+        clauses.append("(timestamp < ? OR (timestamp = ? AND trace_id < ?))")
+        params += [cursor_ts, cursor_ts, cursor_id]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return f"SELECT {columns} FROM traces {where} ORDER BY timestamp DESC, trace_id DESC", params
+
+@timed(SQLITE_SECONDS, op="list_traces")
+def list_traces(limit: int = 100, include_payload: bool = False, **filters) -> tuple:
+    """
+    按时间倒序分页列出 trace，支持 step/status/score 区间/时间窗口过滤与 keyset 游标。
+    默认不返回 input_data/output_data；返回 (rows, next_cursor)。
+    """
+    sql, params = _trace_query(TRACE_FULL_COLUMNS if include_payload else TRACE_SUMMARY_COLUMNS, **filters)
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(f"{sql} LIMIT ?", params + [limit])
+    rows = [dict(row) for row in cursor.fetchall()]
+    next_page = None
+    if len(rows) == limit:
+        next_page = encode_cursor({"timestamp": rows[-1]['timestamp'], "id": rows[-1]['trace_id']})
+    return rows, next_page
+
+def iter_traces(include_payload: bool = True, batch_size: int = 500, **filters) -> Iterator[Dict[str, Any]]:
+    """
+    流式导出：分批 fetchmany，内存占用与总行数无关。
+    参数在调用时即校验（非法游标立刻抛 ValueError），行在迭代时才读取。
+    """
+    sql, params = _trace_query(TRACE_FULL_COLUMNS if include_payload else TRACE_SUMMARY_COLUMNS, **filters)
+    return _stream_rows(sql, params, batch_size)
+
+def _stream_rows(sql: str, params: list, batch_size: int) -> Iterator[Dict[str, Any]]:
+    # 使用独立连接，允许生成器在不同线程上被迭代（如 StreamingResponse 的线程池）
+    conn = sqlite3.connect(DB_PATH, timeout=5.0, check_same_thread=False)
+    try:
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM traces ORDER BY timestamp DESC')
-        return [dict(row) for row in cursor.fetchall()]
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        conn.close()
@@ -1,74 +1,728 @@
+import asyncio
+import atexit
+import base64
+import hashlib
 import json
 import os
+import threading
+import time
 import httpx
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from . import cell_ids, codec, metrics
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, is_outage
+from .logs import get_logger
+from .citation_graph import CitationGraph, GRAPH_TYPES
+from .local_store import LocalCellStore
+from .recall_cache import RecallCache
+from .write_behind import WriteBehindQueue
+
+log = get_logger("evermem")
+
+# 连接超时要短：EverMem 宕机时尽快失败并降级；读超时覆盖正常的慢召回
+HTTP_CONNECT_TIMEOUT = float(os.getenv("EVERMEM_CONNECT_TIMEOUT", "1.0"))
+HTTP_READ_TIMEOUT = float(os.getenv("EVERMEM_READ_TIMEOUT", "5.0"))
+HTTP_TIMEOUT = httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+# 熔断：连续失败 BREAKER_THRESHOLD 次后打开，打开期间直接走本地存储，BREAKER_RESET 秒后半开探测
+BREAKER_THRESHOLD = int(os.getenv("EVERMEM_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("EVERMEM_BREAKER_RESET", "10"))
+# 恢复后补发本地缓冲 cell 的批大小
+REPLAY_BATCH_SIZE = 100
+# REAL 模式召回缓存：条目上限与 TTL（秒，兜底其他进程的写入）；大小为 0 时关闭
+RECALL_CACHE_SIZE = int(os.getenv("EVERMEM_RECALL_CACHE_SIZE", "512"))
+RECALL_CACHE_TTL = float(os.getenv("EVERMEM_RECALL_CACHE_TTL", "5"))
+# 进程内共享的连接池上限（keep-alive 复用 TCP/TLS 连接）
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30.0)
+# 后台写队列容量与队列满时的最长等待（背压），超时后退化为同步提交
+WRITE_BEHIND_CAPACITY = int(os.getenv("EVERMEM_QUEUE_SIZE", "1000"))
+WRITE_BEHIND_PUT_TIMEOUT = 1.0
+# REAL 模式下援引图与远端重新对齐的间隔（秒）：其他 worker/实例提交的 cell 经此补入
+GRAPH_RESYNC_INTERVAL = float(os.getenv("EVERMEM_GRAPH_RESYNC", "30"))
+
+def encode_cursor(cell: Dict[str, Any]) -> str:
+    """
+    把一条召回结果编码为 keyset 游标。时间有序 id（且时间戳由 id 决定）直接用 id 作游标；
+    旧格式 id 或自带时间戳的 cell 编码 timestamp + id。
+    """
+    if cell_ids.timestamp_of(cell['id']) == cell['timestamp']:
+        return cell['id']
+    raw = json.dumps([cell['timestamp'], cell['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """返回 (timestamp, id)。"""
+    if cell_ids.is_sortable(cursor):
+        return cell_ids.timestamp_of(cursor), cursor
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, cell_id = json.loads(raw)
+        return str(timestamp), str(cell_id)
+    except Exception:
+        raise ValueError(f"Invalid recall cursor: {cursor!r}")
+
+class IdempotencyConflict(ValueError):
+    """同一个幂等键再次提交时，内容与首次提交不同。"""
+
+def _fingerprint(payload: Dict[str, Any], data: Dict[str, Any]) -> str:
+    """请求内容的指纹（与正文编码无关），用于识别复用幂等键的不同请求。"""
+    body = json.dumps([payload['type'], data, payload['tags'], payload['citations']], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+def next_cursor(cells: List[Dict[str, Any]], limit: Optional[int]) -> Optional[str]:
+    """满页时返回下一页游标，否则返回 None。"""
+    if limit and len(cells) >= limit:
+        return encode_cursor(cells[-1])
+    return None
 
 class EverMemClient:
     """
     统一 Memory 接口：支持 HTTP 真实模式与 Mock 模式
+    REAL 模式下同步/异步调用各复用一个带连接池的 httpx 客户端；
+    FastAPI 路由应使用 acommit_cell / arecall_by_tags，避免阻塞事件循环。
+    多个 cell 用 commit_cells 一次往返提交；开启 write_behind 后 REAL 模式提交进入后台队列。
+    远端连续失败时熔断，打开期间直接读写本地存储；恢复后把降级期间的提交补发到远端。
     """
-    def __init__(self, base_url: str = None):
+    def __init__(self, base_url: str = None, transport: httpx.BaseTransport = None, write_behind: bool = None, store_path: str = None,
+                 encoding: str = None):
         self.base_url = base_url or os.getenv("EVERMEM_URL")
-        self._mock_storage = []
+        # 新提交 cell 的正文编码（json / zlib / msgpack），见 codec
+        self.encoding = codec.resolve(encoding)
+        self._transport = transport
+        # MOCK 模式及 REAL 降级时的本地存储；配置 EVERMEM_STORE_PATH 后落盘，重启不丢
+        self._local = LocalCellStore(store_path or os.getenv("EVERMEM_STORE_PATH") or ":memory:")
+        # 援引图随 commit 增量更新；首次访问时从已有存储补齐历史
+        self.graph = CitationGraph()
+        self._graph_ready = False
+        self._graph_synced_at = 0.0
+        self._lock = threading.Lock()
+        self._http: Optional[httpx.Client] = None
+        self._ahttp: Optional[httpx.AsyncClient] = None
+        self._ahttp_loop: Optional[asyncio.AbstractEventLoop] = None
         self.is_mock = self.base_url is None
-        if self.is_mock:
-            print("[EverMemOS] Running in MOCK mode.")
+        if write_behind is None:
+            write_behind = os.getenv("EVERMEM_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+        # 已入队但尚未送达的 cell，recall 时合并进结果，保证读己之写
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._write_queue: Optional[WriteBehindQueue] = None
+        if write_behind and not self.is_mock:
+            self._write_queue = WriteBehindQueue(self._ship_batch, capacity=WRITE_BEHIND_CAPACITY)
+            atexit.register(self.flush)
+        self._mode = "mock" if self.is_mock else "real"
+        self._breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET, on_change=self._on_breaker_change)
+        # 降级期间落在本地、待 EverMem 恢复后补发的 cell（持久化在本地存储的 cell_unsynced 表）
+        self._replay_lock = threading.Lock()
+        self._replay_thread: Optional[threading.Thread] = None
+        self._replay_needed = not self.is_mock and self._local.unsynced_count() > 0
+        self._recall_cache: Optional[RecallCache] = None
+        if not self.is_mock and RECALL_CACHE_SIZE > 0:
+            self._recall_cache = RecallCache(RECALL_CACHE_SIZE, RECALL_CACHE_TTL)
+        log.info("client_started", mode=self._mode, base_url=self.base_url, encoding=self.encoding)
+
+    # ---------- transport ----------
+    def _client(self) -> httpx.Client:
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    self._http = httpx.Client(base_url=self.base_url, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS, transport=self._transport)
+        return self._http
+
+    def _aclient(self) -> httpx.AsyncClient:
+        # AsyncClient 的连接池绑定创建它的事件循环，循环变化时（如测试中的临时 loop）重建
+        loop = asyncio.get_running_loop()
+        if self._ahttp is None or self._ahttp_loop is not loop:
+            self._ahttp = httpx.AsyncClient(base_url=self.base_url, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS, transport=self._transport)
+            self._ahttp_loop = loop
+        return self._ahttp
+
+    def status(self) -> Dict[str, Any]:
+        """供 /health 展示：模式、熔断状态、待补发的本地 cell 数与召回缓存命中情况。"""
+        return {"mode": self._mode.upper(), "circuit": self._breaker.snapshot(),
+                "unsynced_cells": 0 if self.is_mock else self._local.unsynced_count(),
+                "recall_cache": self._recall_cache.stats() if self._recall_cache is not None else None}
+
+    # ---------- circuit breaker ----------
+    def _guard(self):
+        if not self._breaker.allow():
+            raise CircuitOpenError("EverMem circuit is open")
+
+    def _record(self, error: Exception = None):
+        """记录一次远端调用结果；只有连接失败/超时/5xx 计入熔断。"""
+        if error is not None and is_outage(error):
+            self._breaker.record_failure()
+            return
+        self._breaker.record_success()
+        if self._replay_needed:
+            self._start_replay()
+
+    def _on_breaker_change(self, old: str, new: str):
+        metrics.EVERMEM_CIRCUIT_STATE.set(metrics.CIRCUIT_STATES.index(new))
+        if new == "open":
+            log.warning("circuit_opened", previous=old, retry_in=self._breaker.reset_timeout)
+        else:
+            log.info("circuit_" + new, previous=old)
+
+    def _fallback(self, op: str, error: Exception, **fields):
+        metrics.EVERMEM_FALLBACKS.inc(op=op)
+        if isinstance(error, CircuitOpenError):
+            # 熔断打开期间每次调用都会走到这里，只做采样记录
+            log.debug(op + "_fallback", circuit="open", sampled=True, **fields)
         else:
-            print(f"[EverMemOS] Running in REAL mode: {self.base_url}")
+            log.warning(op + "_fallback", error=str(error), **fields)
 
-    def commit_cell(self, cell_type: str, data: Dict[str, Any], tags: Dict[str, str], citations: List[str] = None) -> str:
+    def _buffer_local(self, payloads: List[Dict[str, Any]]):
+        """REAL 模式降级：落到本地存储并登记待补发。"""
+        self._local.add_many(payloads, unsynced=True)
+        self._replay_needed = True
+
+    def _start_replay(self):
+        if self._replay_lock.locked():
+            return
+        self._replay_thread = threading.Thread(target=self.replay_local, name="evermem-replay", daemon=True)
+        self._replay_thread.start()
+
+    def replay_local(self, batch_size: int = REPLAY_BATCH_SIZE) -> int:
+        """
+        把降级期间缓冲在本地的 cell 按写入顺序补发到 EverMem，返回补发条数。
+        远端再次失败时停止，等下一次成功调用后重试；同一时刻只有一个补发在跑。
+        """
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        shipped = 0
+        try:
+            self._replay_needed = False
+            while True:
+                batch = self._local.unsynced(batch_size)
+                if not batch:
+                    break
+                try:
+                    self._post_batch(batch)
+                except Exception as e:
+                    self._replay_needed = True
+                    log.warning("replay_interrupted", shipped=shipped, error=str(e))
+                    break
+                self._local.mark_synced([p['id'] for p in batch])
+                shipped += len(batch)
+        finally:
+            self._replay_lock.release()
+        if shipped:
+            log.info("replay_done", shipped=shipped)
+        return shipped
+
+    def flush(self):
+        """等待后台写队列中的 cell 全部送达（或降级落地）。"""
+        if self._write_queue is not None:
+            self._write_queue.flush()
+
+    def close(self):
+        if self._write_queue is not None:
+            self._write_queue.close()
+            self._write_queue = None
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+        self.save_snapshot()
+
+    def save_snapshot(self) -> bool:
+        """
+        把本地存储的热索引写入索引快照，下次启动一次顺序读即可恢复（关闭时自动调用）。
+        MOCK 模式下援引图以本地存储为准，已加载的图随快照一起保存。
+        """
+        extras = {"graph": self.graph.state()} if self.is_mock and self._graph_ready else None
+        return self._local.save_snapshot(extras)
+
+    async def aclose(self):
+        if self._ahttp is not None and self._ahttp_loop is asyncio.get_running_loop():
+            await self._ahttp.aclose()
+        self._ahttp = None
+        self._ahttp_loop = None
+
+    # ---------- commit ----------
+    @staticmethod
+    def new_cell_id() -> str:
+        """
+        本地分配 cell id；同一批次内的 cell 可先拿到 id 再互相援引。
+        id 单调递增且按字典序即时间序（见 cell_ids），未指定 timestamp 的 cell 时间戳由 id 决定。
+        """
+        return cell_ids.new_id()
+
+    def _build_cell(self, cell_type: str, data: Dict[str, Any], tags: Dict[str, str], citations: List[str] = None,
+                    cell_id: str = None, timestamp: str = None) -> Dict[str, Any]:
         citations = citations or []
-        cell_id = f"{cell_type.lower()}_{datetime.now().timestamp()}"
+        cell_id = cell_id or self.new_cell_id()
+        timestamp = timestamp or cell_ids.timestamp_of(cell_id)
         flat_tags = [f"{k}:{v}" for k, v in tags.items()]
         flat_tags.append(f"type:{cell_type.lower()}")
+        encoding, content = codec.encode(data, self.encoding)
 
-        cell_payload = {
+        return {
             "id": cell_id,
             "type": cell_type,
-            "content": json.dumps(data),
+            "encoding": encoding,
+            "content": content,
             "tags": flat_tags,
             "citations": citations,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp or datetime.now().isoformat()
         }
 
+    def _build_cells(self, cells: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            self._build_cell(c['cell_type'], c['data'], c.get('tags') or {}, c.get('citations'), c.get('cell_id'), c.get('timestamp'))
+            for c in cells
+        ]
+
+    def _claim(self, payloads: List[Dict[str, Any]], keys: List[Optional[str]],
+               datas: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str], List[Tuple[str, str]]]:
+        """
+        按幂等键去重：返回需要真正提交的 cell、（与输入同序的）最终 id，以及本次新登记的 (键, id)。
+        键按 cell 类型划分；已被占用时沿用首次提交分配的 id，本次的 cell 丢弃，内容与首次不同时抛 IdempotencyConflict。
+        键登记在本地存储，配置 EVERMEM_STORE_PATH 后跨进程、跨重启生效；写入失败时调用方用 _release 撤销本次登记。
+        """
+        if not any(keys):
+            return payloads, [p['id'] for p in payloads], []
+        fresh, ids, claims = [], [], []
+        for p, key, data in zip(payloads, keys, datas):
+            if not key:
+                fresh.append(p)
+                ids.append(p['id'])
+                continue
+            scoped = f"{p['type'].lower()}:{key}"
+            fingerprint = _fingerprint(p, data)
+            cell_id, first = self._local.claim_idempotency_key(scoped, p['id'], fingerprint)
+            if cell_id == p['id']:
+                fresh.append(p)
+                claims.append((scoped, cell_id))
+            elif first is not None and first != fingerprint:
+                self._release(claims)
+                raise IdempotencyConflict(f"Idempotency key {key!r} was already used for a different {p['type']} request")
+            else:
+                metrics.EVERMEM_COMMITS_DEDUPLICATED.inc(type=p['type'])
+                log.debug("commit_deduplicated", cell_type=p['type'], cell_id=cell_id, sampled=True)
+            ids.append(cell_id)
+        return fresh, ids, claims
+
+    def _release(self, claims: List[Tuple[str, str]]):
+        if claims:
+            self._local.release_idempotency_keys(claims)
+
+    def commit_cell(self, cell_type: str, data: Dict[str, Any], tags: Dict[str, str], citations: List[str] = None, cell_id: str = None,
+                    idempotency_key: str = None) -> str:
+        """
+        提交一个 cell，返回 id。idempotency_key 由调用方提供（如请求的 Idempotency-Key 头）：
+        同一个键重复提交（重试、重放）只会写入一次，之后都返回首次的 id；键按 cell 类型划分，
+        同一类型下复用键提交不同内容时抛 IdempotencyConflict，写入失败时键被撤销、可用同一个键重试。
+        """
+        start = time.perf_counter()
+        cell_payload = self._build_cell(cell_type, data, tags, citations, cell_id)
+        fresh, ids, claims = self._claim([cell_payload], [idempotency_key], [data])
+        if not fresh:
+            return ids[0]
+
+        try:
+            if self.is_mock:
+                self._store_mock(cell_payload)
+            elif self._enqueue([cell_payload]):
+                self._ship_batch([cell_payload])
+        except BaseException:
+            self._release(claims)
+            raise
+
+        self._track([cell_payload])
+        metrics.EVERMEM_COMMIT_SECONDS.observe(time.perf_counter() - start, mode=self._mode, op="commit_cell")
+        log.debug("cell_committed", cell_type=cell_type, cell_id=cell_payload['id'], sampled=True)
+        return cell_payload['id']
+
+    async def acommit_cell(self, cell_type: str, data: Dict[str, Any], tags: Dict[str, str], citations: List[str] = None, cell_id: str = None,
+                           idempotency_key: str = None) -> str:
+        start = time.perf_counter()
+        cell_payload = self._build_cell(cell_type, data, tags, citations, cell_id)
+        fresh, ids, claims = self._claim([cell_payload], [idempotency_key], [data])
+        if not fresh:
+            return ids[0]
+
+        try:
+            if self.is_mock:
+                self._store_mock(cell_payload)
+            elif self._enqueue([cell_payload], block=False):
+                await self._aship_batch([cell_payload])
+        except BaseException:
+            self._release(claims)
+            raise
+
+        self._track([cell_payload])
+        metrics.EVERMEM_COMMIT_SECONDS.observe(time.perf_counter() - start, mode=self._mode, op="commit_cell")
+        log.debug("cell_committed", cell_type=cell_type, cell_id=cell_payload['id'], sampled=True)
+        return cell_payload['id']
+
+    def commit_cells(self, cells: List[Dict[str, Any]]) -> List[str]:
+        """
+        批量提交：cells 中每项为 {cell_type, data, tags, citations?, cell_id?, idempotency_key?}，一次往返写入。
+        返回与输入同序的 cell id 列表（幂等键重复的项返回首次提交的 id）。
+        """
+        start = time.perf_counter()
+        payloads, ids, claims = self._claim(self._build_cells(cells), [c.get('idempotency_key') for c in cells],
+                                            [c['data'] for c in cells])
+        try:
+            if self.is_mock:
+                for p in payloads:
+                    self._store_mock(p)
+            else:
+                overflow = self._enqueue(payloads)
+                if overflow:
+                    self._ship_batch(overflow)
+        except BaseException:
+            self._release(claims)
+            raise
+        self._track(payloads)
+        metrics.EVERMEM_COMMIT_SECONDS.observe(time.perf_counter() - start, mode=self._mode, op="commit_cells")
+        log.debug("cells_committed", count=len(payloads), sampled=True)
+        return ids
+
+    async def acommit_cells(self, cells: List[Dict[str, Any]]) -> List[str]:
+        start = time.perf_counter()
+        payloads, ids, claims = self._claim(self._build_cells(cells), [c.get('idempotency_key') for c in cells],
+                                            [c['data'] for c in cells])
+        try:
+            if self.is_mock:
+                for p in payloads:
+                    self._store_mock(p)
+            else:
+                overflow = self._enqueue(payloads, block=False)
+                if overflow:
+                    await self._aship_batch(overflow)
+        except BaseException:
+            self._release(claims)
+            raise
+        self._track(payloads)
+        metrics.EVERMEM_COMMIT_SECONDS.observe(time.perf_counter() - start, mode=self._mode, op="commit_cells")
+        log.debug("cells_committed", count=len(payloads), sampled=True)
+        return ids
+
+    def ship_cells(self, cells: List[Dict[str, Any]]) -> List[str]:
+        """
+        不做降级的批量提交（供 outbox 复制使用）：远端失败或返回非 2xx 时直接抛异常，由调用方重试。
+        cells 应带上 cell_id/timestamp，保证重试幂等。
+        """
+        payloads = self._build_cells(cells)
         if self.is_mock:
-            self._mock_storage.append(cell_payload)
+            self._local.add_many(payloads)
         else:
+            self._post_batch(payloads)
+        self._track(payloads)
+        return [p['id'] for p in payloads]
+
+    def _track(self, payloads: List[Dict[str, Any]]):
+        for p in payloads:
+            metrics.EVERMEM_CELLS_COMMITTED.inc(type=p['type'])
+            if self._recall_cache is not None:
+                self._recall_cache.invalidate(p['tags'])
+            if p['type'].lower() in GRAPH_TYPES:
+                self.graph.add_cell(self._decode(p))
+
+    def _enqueue(self, payloads: List[Dict[str, Any]], block: bool = True) -> List[Dict[str, Any]]:
+        """
+        交给后台写队列，返回未能入队、需要调用方直接提交的 cell（未开启队列时即全部）。
+        block=False 供事件循环线程使用：队列满时不等待。
+        """
+        if self._write_queue is None:
+            return payloads
+        with self._lock:
+            for p in payloads:
+                self._pending[p['id']] = p
+        for i, p in enumerate(payloads):
+            queued = self._write_queue.put(p, timeout=WRITE_BEHIND_PUT_TIMEOUT) if block else self._write_queue.put_nowait(p)
+            if not queued:
+                log.warning("write_behind_full", overflow=len(payloads) - i)
+                with self._lock:
+                    for rest in payloads[i:]:
+                        self._pending.pop(rest['id'], None)
+                return payloads[i:]
+        return []
+
+    def _post_batch(self, payloads: List[Dict[str, Any]]):
+        """
+        一次往返提交（单个 cell 走 /commit）；非 2xx 抛异常，熔断打开时抛 CircuitOpenError。
+        旧版服务端没有批量接口（404/405）时逐个提交（仍复用连接池）。
+        """
+        self._guard()
+        try:
+            resp = self._client().post("/commit", json=payloads[0]) if len(payloads) == 1 else \
+                self._client().post("/commit_batch", json={"cells": payloads})
+            if len(payloads) > 1 and resp.status_code in (404, 405):
+                for p in payloads:
+                    self._client().post("/commit", json=p).raise_for_status()
+            else:
+                resp.raise_for_status()
+        except Exception as e:
+            self._record(e)
+            raise
+        self._record()
+
+    async def _apost_batch(self, payloads: List[Dict[str, Any]]):
+        self._guard()
+        try:
+            resp = await self._aclient().post("/commit", json=payloads[0]) if len(payloads) == 1 else \
+                await self._aclient().post("/commit_batch", json={"cells": payloads})
+            if len(payloads) > 1 and resp.status_code in (404, 405):
+                for p in payloads:
+                    (await self._aclient().post("/commit", json=p)).raise_for_status()
+            else:
+                resp.raise_for_status()
+        except Exception as e:
+            self._record(e)
+            raise
+        self._record()
+
+    def _ship_batch(self, payloads: List[Dict[str, Any]]):
+        """带降级的提交：远端失败（含非 2xx）或熔断打开时落到本地存储，恢复后补发。"""
+        try:
+            self._post_batch(payloads)
+        except Exception as e:
+            self._fallback("commit", e, count=len(payloads))
+            self._buffer_local(payloads)
+        finally:
+            with self._lock:
+                for p in payloads:
+                    self._pending.pop(p['id'], None)
+
+    async def _aship_batch(self, payloads: List[Dict[str, Any]]):
+        try:
+            await self._apost_batch(payloads)
+        except Exception as e:
+            self._fallback("commit", e, count=len(payloads))
+            self._buffer_local(payloads)
+
+    # ---------- recall ----------
+    def recall_by_tags(self, query_tags: Dict[str, str], limit: Optional[int] = None, before: Optional[str] = None,
+                       after: Optional[str] = None, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按标签召回，时间倒序。limit 限制条数；before/after 为 ISO 时间戳（开区间）；
+        cursor 为上一页 next_cursor() 返回的游标。
+        """
+        start = time.perf_counter()
+        flat_query = [f"{k}:{v}" for k, v in query_tags.items()]
+        start_after = decode_cursor(cursor) if cursor else None
+
+        if not self.is_mock:
             try:
-                with httpx.Client() as client:
-                    client.post(f"{self.base_url}/commit", json=cell_payload, timeout=5.0)
+                results = self._recall_remote(flat_query, limit, before, after, cursor)
+                results = self._window(results, limit, before, after, start_after)
+                metrics.EVERMEM_RECALL_SECONDS.observe(time.perf_counter() - start, mode=self._mode)
+                return results
             except Exception as e:
-                print(f"[EverMemOS] HTTP Commit Error: {e}. Falling back to mock.")
-                self._mock_storage.append(cell_payload)
+                self._fallback("recall", e, tags=flat_query)
 
-        print(f"[EverMemOS] Committed {cell_type} Cell: {cell_id}")
-        return cell_id
+        results = self._local.query(flat_query, limit, before, after, start_after)
+        metrics.EVERMEM_RECALL_SECONDS.observe(time.perf_counter() - start, mode=self._mode)
+        return results
 
-    def recall_by_tags(self, query_tags: Dict[str, str]) -> List[Dict[str, Any]]:
+    async def arecall_by_tags(self, query_tags: Dict[str, str], limit: Optional[int] = None, before: Optional[str] = None,
+                              after: Optional[str] = None, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
         flat_query = [f"{k}:{v}" for k, v in query_tags.items()]
+        start_after = decode_cursor(cursor) if cursor else None
 
         if not self.is_mock:
             try:
-                with httpx.Client() as client:
-                    resp = client.get(f"{self.base_url}/recall", params={"tags": ",".join(flat_query)}, timeout=5.0)
-                    if resp.status_code == 200:
-                        return resp.json()
+                results = await self._arecall_remote(flat_query, limit, before, after, cursor)
+                results = self._window(results, limit, before, after, start_after)
+                metrics.EVERMEM_RECALL_SECONDS.observe(time.perf_counter() - start, mode=self._mode)
+                return results
             except Exception as e:
-                print(f"[EverMemOS] HTTP Recall Error: {e}. Falling back to mock.")
-
-        results = []
-        for cell in self._mock_storage:
-            if all(tag in cell['tags'] for tag in flat_query):
-                results.append({
-                    "id": cell['id'],
-                    "type": cell['type'],
-                    "data": json.loads(cell['content']),
-                    "tags": cell['tags'],
-                    "citations": cell.get('citations', []),
-                    "timestamp": cell['timestamp']
-                })
-        results.sort(key=lambda x: x['timestamp'], reverse=True)
+                self._fallback("recall", e, tags=flat_query)
+
+        results = self._local.query(flat_query, limit, before, after, start_after)
+        metrics.EVERMEM_RECALL_SECONDS.observe(time.perf_counter() - start, mode=self._mode)
         return results
 
-memory_os = EverMemClient()
+    def _recall_remote(self, flat_query: List[str], limit=None, before=None, after=None, cursor=None,
+                       cached: bool = True) -> List[Dict[str, Any]]:
+        """
+        远端召回并合并未送达的本地写入；失败、非 2xx 或熔断打开时抛异常。
+        cached=True 时先查召回缓存（命中不走网络），未命中的远端结果写回缓存。
+        """
+        key = RecallCache.key(flat_query, limit, before, after, cursor) if cached and self._recall_cache is not None else None
+        epoch = 0
+        if key is not None:
+            hit, epoch = self._recall_cache.get(key)
+            if hit is not None:
+                return self._merge_pending(hit, flat_query)
+        self._guard()
+        try:
+            resp = self._client().get("/recall", params=self._recall_params(flat_query, limit, before, after, cursor))
+            resp.raise_for_status()
+            results = resp.json()
+        except Exception as e:
+            self._record(e)
+            raise
+        self._record()
+        if key is not None:
+            self._recall_cache.put(key, results, epoch)
+        return self._merge_pending(results, flat_query)
+
+    async def _arecall_remote(self, flat_query: List[str], limit=None, before=None, after=None, cursor=None,
+                              cached: bool = True) -> List[Dict[str, Any]]:
+        key = RecallCache.key(flat_query, limit, before, after, cursor) if cached and self._recall_cache is not None else None
+        epoch = 0
+        if key is not None:
+            hit, epoch = self._recall_cache.get(key)
+            if hit is not None:
+                return self._merge_pending(hit, flat_query)
+        self._guard()
+        try:
+            resp = await self._aclient().get("/recall", params=self._recall_params(flat_query, limit, before, after, cursor))
+            resp.raise_for_status()
+            results = resp.json()
+        except Exception as e:
+            self._record(e)
+            raise
+        self._record()
+        if key is not None:
+            self._recall_cache.put(key, results, epoch)
+        return self._merge_pending(results, flat_query)
+
+    @staticmethod
+    def _recall_params(flat_query: List[str], limit, before, after, cursor) -> Dict[str, Any]:
+        params = {"tags": ",".join(flat_query), "limit": limit, "before": before, "after": after, "cursor": cursor}
+        return {k: v for k, v in params.items() if v is not None}
+
+    @staticmethod
+    def _window(results: List[Dict[str, Any]], limit, before, after, start_after) -> List[Dict[str, Any]]:
+        """对远端结果再做一次窗口裁剪，兼容不支持分页参数的服务端。"""
+        if before is None and after is None and start_after is None and limit is None:
+            return results
+        out = []
+        for cell in results:
+            ts = cell['timestamp']
+            if (before is not None and ts >= before) or (after is not None and ts <= after):
+                continue
+            # 结果按 (timestamp, id) 倒序，游标之前（含游标本身）的部分已返回过
+            if start_after is not None and (ts, cell['id']) >= tuple(start_after):
+                continue
+            out.append(cell)
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    # ---------- citation graph ----------
+    def get_graph(self) -> CitationGraph:
+        """
+        返回增量援引图。首次调用时按时间顺序导入已有的各类 cell；
+        REAL 模式下每隔 GRAPH_RESYNC_INTERVAL 秒重新从远端补齐（其他进程的提交），远端不可用时下次调用重试。
+        """
+        if self._graph_stale():
+            if self.is_mock:
+                self._load_graph_local()
+            else:
+                try:
+                    self._load_graph([self._recall_remote([f"type:{t}"], cached=False) for t in GRAPH_TYPES])
+                except Exception as e:
+                    self._fallback("graph_sync", e)
+                    self._load_graph([self._local.query([f"type:{t}"]) for t in GRAPH_TYPES], synced=False)
+        return self.graph
+
+    async def aget_graph(self) -> CitationGraph:
+        if self._graph_stale():
+            if self.is_mock:
+                self._load_graph_local()
+            else:
+                try:
+                    self._load_graph(await asyncio.gather(*(self._arecall_remote([f"type:{t}"], cached=False) for t in GRAPH_TYPES)))
+                except Exception as e:
+                    self._fallback("graph_sync", e)
+                    self._load_graph([self._local.query([f"type:{t}"]) for t in GRAPH_TYPES], synced=False)
+        return self.graph
+
+    def _load_graph_local(self):
+        """MOCK 模式：索引快照带有援引图时恢复，再补上快照之后写入的 cell；否则从本地存储全量导入。"""
+        state = self._local.snapshot_extras.pop("graph", None)
+        if state is not None and not len(self.graph):
+            self.graph.restore(state)
+            self._load_graph([self._local.cells_since(self._local.snapshot_seq, GRAPH_TYPES)])
+        else:
+            self._load_graph([self._local.query([f"type:{t}"]) for t in GRAPH_TYPES])
+
+    def _graph_stale(self) -> bool:
+        if not self._graph_ready:
+            return True
+        return not self.is_mock and time.monotonic() - self._graph_synced_at >= GRAPH_RESYNC_INTERVAL
+
+    def _load_graph(self, results: List[List[Dict[str, Any]]], synced: bool = True):
+        # add_cell 按 id 去重，重复导入只会补入新出现的节点/边（version 随之递增，ETag 失效）
+        cells = [c for cells in results for c in cells]
+        cells.sort(key=lambda c: c['timestamp'])
+        for cell in cells:
+            self.graph.add_cell(cell)
+        if synced:
+            self._graph_ready = True
+            self._graph_synced_at = time.monotonic()
+
+    def _merge_pending(self, results: List[Dict[str, Any]], flat_query: List[str]) -> List[Dict[str, Any]]:
+        with self._lock:
+            if not self._pending:
+                return results
+            query = set(flat_query)
+            pending = [p for p in self._pending.values() if query.issubset(p['tags'])]
+        seen = {r.get('id') for r in results}
+        extra = [self._decode(p) for p in pending if p['id'] not in seen]
+        if not extra:
+            return results
+        merged = results + extra
+        merged.sort(key=lambda x: (x['timestamp'], x['id']), reverse=True)
+        return merged
+
+    # ---------- mock storage ----------
+    @staticmethod
+    def _decode(cell_payload: Dict[str, Any]) -> Dict[str, Any]:
+        """载荷 -> 召回形态；data 在首次访问时按 encoding 解码。"""
+        return codec.LazyCell.from_content({
+            "id": cell_payload['id'],
+            "type": cell_payload['type'],
+            "tags": cell_payload['tags'],
+            "citations": cell_payload.get('citations', []),
+            "timestamp": cell_payload['timestamp']
+        }, cell_payload.get('encoding'), cell_payload['content'])
+
+    def _store_mock(self, cell_payload: Dict[str, Any]):
+        self._local.add(cell_payload)
+
+class LazyClient:
+    """
+    首次访问属性时才创建 EverMemClient：导入模块不打开本地存储、不加载索引，
+    冷启动时应用可以先开始监听，存储在第一个用到它的请求里加载。
+    """
+    def __init__(self, factory=EverMemClient):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_init_lock", threading.Lock())
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def warm_up(self) -> threading.Thread:
+        """在后台线程中创建客户端（加载本地存储）；期间到达的调用等待加载完成。"""
+        thread = threading.Thread(target=self._get, name="evermem-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    async def ready(self) -> EverMemClient:
+        """异步路由使用：客户端仍在加载时在线程池中等待，不阻塞事件循环。"""
+        if self._instance is None:
+            await asyncio.get_running_loop().run_in_executor(None, self._get)
+        return self._instance
+
+    def _get(self) -> EverMemClient:
+        if self._instance is None:
+            with self._init_lock:
+                if self._instance is None:
+                    object.__setattr__(self, "_instance", self._factory())
+        return self._instance
+
+    def __getattr__(self, name: str):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._get(), name, value)
+
+memory_os = LazyClient()
+metrics.EVERMEM_LOCAL_CELLS.set_function(lambda: {(): len(memory_os._local) if memory_os.initialized else 0})
@@ -0,0 +1,440 @@
+import json
+import marshal
+import mmap
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
+from .tag_index import TagIndex
+from . import codec
+from .codec import LazyCell
+from .logs import get_logger
+from .migrations import migrate
+from .segment_store import SegmentStore
+
+log = get_logger("local_store")
+
+# 热层：常驻内存的 cell（LRU），按条数与正文字节数双重限制；热索引本身只保存 id/tags/timestamp
+HOT_MAX_CELLS = int(os.getenv("EVERMEM_HOT_CELLS", "10000"))
+HOT_MAX_BYTES = int(os.getenv("EVERMEM_HOT_BYTES", str(64 * 1024 * 1024)))
+_IN_CHUNK = 500
+# 索引快照（<path>.index）：文件头 + marshal 序列化的 TagIndex 状态；marshal 格式随 Python 版本变化，版本不符时重建
+SNAPSHOT_MAGIC = b"EVMIDX01"
+_PYTHON = "%d.%d" % sys.version_info[:2]
+
+def _schema_v1(cursor: sqlite3.Cursor):
+    """基线：引入版本号之前的表结构（幂等，旧库按列补齐）。"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cells (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            citations TEXT NOT NULL,
+            timestamp TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cell_tags (
+            tag TEXT NOT NULL,
+            cell_id TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            PRIMARY KEY (tag, cell_id)
+        )
+    ''')
+    # 正文编码标记（见 codec）；旧库没有该列时补上，已有数据按 json 解码
+    if 'encoding' not in {row[1] for row in cursor.execute('PRAGMA table_info(cells)')}:
+        cursor.execute("ALTER TABLE cells ADD COLUMN encoding TEXT NOT NULL DEFAULT 'json'")
+    # 正文在段文件中的位置；旧数据（seg 为空）正文仍在 content 列
+    if 'seg' not in {row[1] for row in cursor.execute('PRAGMA table_info(cells)')}:
+        cursor.execute('ALTER TABLE cells ADD COLUMN seg INTEGER')
+        cursor.execute('ALTER TABLE cells ADD COLUMN seg_offset INTEGER')
+        cursor.execute('ALTER TABLE cells ADD COLUMN seg_length INTEGER')
+    # REAL 模式下因 EverMem 不可用而落在本地、待恢复后补发的 cell（按写入顺序）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cell_unsynced (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            cell_id TEXT NOT NULL UNIQUE
+        )
+    ''')
+    # 调用方提供的幂等键 -> 首次提交分配的 cell id
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cell_idempotency (
+            key TEXT PRIMARY KEY,
+            cell_id TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cells_timestamp ON cells(timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cells_timestamp_id ON cells(timestamp, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cell_tags_tag_ts ON cell_tags(tag, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cell_tags_cell ON cell_tags(cell_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cells_seg ON cells(seg)')
+
+def _schema_v2(cursor: sqlite3.Cursor):
+    """变更日志（启动时从索引快照之后补齐）与存储标识（校验快照是否属于本库）。"""
+    cursor.execute('''
+        CREATE TABLE cell_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            cell_id TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT INTO cell_log (cell_id) SELECT id FROM cells ORDER BY timestamp, id')
+    cursor.execute('CREATE TABLE store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    cursor.execute("INSERT INTO store_meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+
+def _schema_v3(cursor: sqlite3.Cursor):
+    """段文件中的正文改存编码后的原始字节（二进制编码不再经 base64）；此前写入的记录仍是文本形态，raw = 0。"""
+    cursor.execute('ALTER TABLE cells ADD COLUMN raw INTEGER NOT NULL DEFAULT 0')
+
+def _schema_v4(cursor: sqlite3.Cursor):
+    """幂等键按 cell 类型划分（键存为 "<type>:<key>"），并记录首次请求内容的指纹；旧键按其 cell 的类型补上前缀。"""
+    cursor.execute('ALTER TABLE cell_idempotency ADD COLUMN fingerprint TEXT')
+    cursor.execute('''
+        UPDATE cell_idempotency SET key = (SELECT lower(type) FROM cells WHERE cells.id = cell_idempotency.cell_id) || ':' || key
+        WHERE cell_id IN (SELECT id FROM cells)
+    ''')
+
+SCHEMA_MIGRATIONS = (_schema_v1, _schema_v2, _schema_v3, _schema_v4)
+
+class LocalCellStore:
+    """
+    本地持久化 Memory 存储（MOCK 模式及 REAL 模式降级时使用），分三层：
+    - 热索引：内存中的 TagIndex（id/tags/timestamp）。启动时从索引快照一次顺序读（mmap）恢复，
+      再按变更日志（cell_log）补上快照之后写入的 cell；没有可用快照时全量扫描 cells 表重建；
+    - 热层：最近使用的 cell（LRU，受 HOT_MAX_CELLS / HOT_MAX_BYTES 限制），召回命中时不访问磁盘；
+    - 冷层：元数据存 SQLite（cells 表 + 规范化的 cell_tags 表），正文追加写入 mmap 读取的段文件（SegmentStore），
+      封存的小段由后台压缩合并。热层淘汰的 cell 召回时从冷层读回，因此内存占用不随历史增长。
+    path 为 ":memory:" 时存到进程专属的临时目录，close() 或进程退出时删除（不跨重启保留，与旧版一致）。
+    """
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._tmpdir = None
+        db_path, segment_dir = path, f"{path}.segments"
+        if path == ":memory:":
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="evermem-")
+            db_path = os.path.join(self._tmpdir.name, "cells.db")
+            segment_dir = os.path.join(self._tmpdir.name, "segments")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._segments = SegmentStore(segment_dir)
+        self._index = TagIndex()
+        self._hot: "OrderedDict[str, LazyCell]" = OrderedDict()
+        self._hot_sizes: Dict[str, int] = {}
+        self._hot_bytes = 0
+        self._compacting = threading.Lock()
+        # 索引快照：snapshot_seq 为快照覆盖到的变更日志位置，snapshot_extras 为随快照保存的附加状态（如援引图）
+        self.snapshot_path = None if self._tmpdir is not None else f"{path}.index"
+        self.snapshot_seq = 0
+        self.snapshot_extras: Dict[str, Any] = {}
+        self.loaded_from_snapshot = False
+        self._seq = 0
+        self._init_schema()
+        self._store_id = self._conn.execute("SELECT value FROM store_meta WHERE key = 'store_id'").fetchone()[0]
+        self._load_index()
+
+    def _init_schema(self):
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # 临时存储不需要跨崩溃保留
+        self._conn.execute('PRAGMA synchronous=OFF' if self._tmpdir is not None else 'PRAGMA synchronous=NORMAL')
+        migrate(self._conn, SCHEMA_MIGRATIONS)
+
+    def _load_index(self):
+        state = self._read_snapshot()
+        if state is None:
+            self._seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM cell_log').fetchone()[0]
+            for cell_id, tags, timestamp in self._conn.execute('SELECT id, tags, timestamp FROM cells ORDER BY timestamp, id'):
+                self._index.add({"id": cell_id, "tags": json.loads(tags), "timestamp": timestamp})
+            return
+        self._index = TagIndex.from_state(state["index"])
+        self.snapshot_seq = self._seq = state["seq"]
+        self.snapshot_extras = state["extras"]
+        self.loaded_from_snapshot = True
+        # 补上快照之后（含其他进程）写入的 cell
+        rows = self._conn.execute('''
+            SELECT l.seq, c.id, c.tags, c.timestamp FROM cell_log l JOIN cells c ON c.id = l.cell_id
+            WHERE l.seq > ? ORDER BY l.seq
+        ''', (self._seq,))
+        for seq, cell_id, tags, timestamp in rows:
+            self._index.add({"id": cell_id, "tags": json.loads(tags), "timestamp": timestamp})
+            self._seq = seq
+
+    def _read_snapshot(self) -> Optional[Dict[str, Any]]:
+        """读取并校验索引快照（属于本库、同一 Python 版本、不超前于变更日志）；不可用时返回 None。"""
+        if self.snapshot_path is None or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                if view[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                    raise ValueError("bad magic")
+                header_end = view.find(b"\n", len(SNAPSHOT_MAGIC))
+                header = json.loads(view[len(SNAPSHOT_MAGIC):header_end])
+                max_seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM cell_log').fetchone()[0]
+                if header.get("python") != _PYTHON or header.get("store_id") != self._store_id or header.get("seq", 0) > max_seq:
+                    log.info("index_snapshot_skipped", path=self.snapshot_path, header=header)
+                    return None
+                with memoryview(view) as buf:
+                    index, extras = marshal.loads(buf[header_end + 1:])
+            return {"seq": header["seq"], "index": index, "extras": extras}
+        except Exception as e:
+            log.warning("index_snapshot_unreadable", path=self.snapshot_path, error=str(e))
+            return None
+
+    def save_snapshot(self, extras: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        把热索引（及调用方的附加状态）写入索引快照，下次启动时直接加载；临时存储不写。
+        先写临时文件再改名，写到一半崩溃不会破坏旧快照。
+        """
+        if self.snapshot_path is None:
+            return False
+        with self._lock:
+            header = {"python": _PYTHON, "store_id": self._store_id, "seq": self._seq, "cells": len(self._index)}
+            try:
+                body = marshal.dumps((self._index.state(), extras or {}))
+            except ValueError as e:
+                log.warning("index_snapshot_failed", error=str(e))
+                return False
+        tmp = f"{self.snapshot_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(SNAPSHOT_MAGIC + json.dumps(header).encode() + b"\n")
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        return True
+
+    def cells_since(self, seq: int, types: Iterable[str] = None) -> List[Dict[str, Any]]:
+        """变更日志位置 seq 之后写入的 cell（按写入顺序）；types 为小写类型名，限定类型。"""
+        types = [t.lower() for t in types] if types else None
+        with self._lock:
+            ids = [cell_id for cell_id, cell_type in self._conn.execute(
+                'SELECT c.id, c.type FROM cell_log l JOIN cells c ON c.id = l.cell_id WHERE l.seq > ? ORDER BY l.seq', (seq,))
+                if types is None or cell_type.lower() in types]
+            return [c.copy() for c in self._fetch(list(dict.fromkeys(ids)))]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, cell_id: str) -> bool:
+        return cell_id in self._index
+
+    def add(self, cell_payload: Dict[str, Any]):
+        self.add_many([cell_payload])
+
+    def add_many(self, cell_payloads: Iterable[Dict[str, Any]], unsynced: bool = False):
+        """在一个事务内写入多条 cell；已存在的 id 忽略。unsynced=True 时同时登记为待补发。"""
+        cell_payloads = list(cell_payloads)
+        with self._lock:
+            fresh = [p for p in cell_payloads if p['id'] not in self._index]
+            if unsynced:
+                with self._conn:
+                    self._conn.executemany('INSERT OR IGNORE INTO cell_unsynced (cell_id) VALUES (?)',
+                                           [(p['id'],) for p in cell_payloads])
+            if not fresh:
+                return
+            # 先追加正文再提交元数据：中途失败只会在段里留下无人引用的记录，压缩时丢弃
+            active = self._segments.active_number
+            bodies = [codec.raw(p.get('encoding'), p['content']) for p in fresh]
+            pointers = self._segments.append_many(bodies)
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO cells (id, type, content, tags, citations, timestamp, encoding, seg, seg_offset, seg_length, raw) '
+                    'VALUES (?, ?, \'\', ?, ?, ?, ?, ?, ?, ?, 1)',
+                    [(p['id'], p['type'], json.dumps(p['tags']), json.dumps(p.get('citations', [])), p['timestamp'],
+                      p.get('encoding') or 'json', *pointer) for p, pointer in zip(fresh, pointers)]
+                )
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO cell_tags (tag, cell_id, timestamp) VALUES (?, ?, ?)',
+                    [(tag, p['id'], p['timestamp']) for p in fresh for tag in set(p['tags'])]
+                )
+                self._conn.executemany('INSERT INTO cell_log (cell_id) VALUES (?)', [(p['id'],) for p in fresh])
+                self._seq = self._conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            for p, body in zip(fresh, bodies):
+                self._index.add({"id": p['id'], "tags": p['tags'], "timestamp": p['timestamp']})
+                # 写入时缓存（正文延迟解码，与调用方对象解耦），刚写入的 cell 召回时无需再访问 SQLite
+                self._remember(LazyCell.from_content({
+                    "id": p['id'],
+                    "type": p['type'],
+                    "tags": p['tags'],
+                    "citations": p.get('citations', []),
+                    "timestamp": p['timestamp']
+                }, p.get('encoding'), body), len(body))
+        if self._segments.active_number != active:
+            self._maybe_compact()
+
+    def query(self, flat_query: List[str], limit: Optional[int] = None, before: Optional[str] = None,
+              after: Optional[str] = None, start_after: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        """按时间倒序返回同时带有全部标签的 cell（data 首次访问时解码，同一 cell 只解码一次）；只取前 limit 条。"""
+        with self._lock:
+            ids = list(islice(self._index.iter_ids(flat_query, before, after, start_after), limit))
+            return [c.copy() for c in self._fetch(ids)]
+
+    def unsynced(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """按写入顺序返回待补发的 cell 载荷（content 保持编码后的形态）。"""
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT c.id, c.type, c.encoding, c.content, c.tags, c.citations, c.timestamp, c.seg, c.seg_offset, c.seg_length, c.raw
+                FROM cell_unsynced u JOIN cells c ON c.id = u.cell_id ORDER BY u.seq LIMIT ?
+            ''', (limit,)).fetchall()
+            return [self._payload(*row) for row in rows]
+
+    def iter_log(self, after_seq: int = 0, batch_size: int = 500) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        按变更日志（写入顺序）逐批产出 (seq, cell 载荷)（content 为文本形态），用于导出。
+        从 after_seq 之后开始：之后才写入的 cell 即使时间戳更早（如导入、补写）也不会漏掉。每批单独加锁查询，内存占用与批大小成正比。
+        """
+        while True:
+            with self._lock:
+                rows = self._conn.execute('''
+                    SELECT l.seq, c.id, c.type, c.encoding, c.content, c.tags, c.citations, c.timestamp, c.seg, c.seg_offset, c.seg_length, c.raw
+                    FROM cell_log l JOIN cells c ON c.id = l.cell_id WHERE l.seq > ? ORDER BY l.seq LIMIT ?
+                ''', (after_seq, batch_size)).fetchall()
+                batch = [(row[0], self._payload(*row[1:])) for row in rows]
+            yield from batch
+            if len(rows) < batch_size:
+                return
+            after_seq = rows[-1][0]
+
+    def log_seq(self, cell_id: str) -> Optional[int]:
+        """cell 在变更日志中的位置；不存在时返回 None。"""
+        with self._lock:
+            return self._conn.execute('SELECT MIN(seq) FROM cell_log WHERE cell_id = ?', (cell_id,)).fetchone()[0]
+
+    def claim_idempotency_key(self, key: str, cell_id: str, fingerprint: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """登记幂等键；返回该键首次登记的 (cell id, 指纹)，键是新的时即 (cell_id, fingerprint)。"""
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO cell_idempotency (key, cell_id, fingerprint) VALUES (?, ?, ?)',
+                               (key, cell_id, fingerprint))
+            return self._conn.execute('SELECT cell_id, fingerprint FROM cell_idempotency WHERE key = ?', (key,)).fetchone()
+
+    def release_idempotency_keys(self, claims: Iterable[Tuple[str, str]]):
+        """写入失败时撤销本次登记的 (key, cell_id)，客户端重试时按新请求处理。"""
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM cell_idempotency WHERE key = ? AND cell_id = ?', list(claims))
+
+    def unsynced_count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM cell_unsynced').fetchone()[0]
+
+    def mark_synced(self, ids: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM cell_unsynced WHERE cell_id = ?', [(i,) for i in ids])
+
+    def _fetch(self, ids: List[str]) -> List[Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for cell_id in ids:
+            cell = self._hot.get(cell_id)
+            if cell is None:
+                missing.append(cell_id)
+            else:
+                self._hot.move_to_end(cell_id)
+                found[cell_id] = cell
+        for start in range(0, len(missing), _IN_CHUNK):
+            chunk = missing[start:start + _IN_CHUNK]
+            rows = self._conn.execute(
+                'SELECT id, type, content, tags, citations, timestamp, encoding, seg, seg_offset, seg_length, raw '
+                f'FROM cells WHERE id IN ({",".join("?" * len(chunk))})',
+                chunk
+            ).fetchall()
+            for cell_id, cell_type, content, tags, citations, timestamp, encoding, seg, offset, length, is_raw in rows:
+                content = self._content(cell_id, content, seg, offset, length, is_raw)
+                found[cell_id] = self._remember(LazyCell.from_content({
+                    "id": cell_id,
+                    "type": cell_type,
+                    "tags": json.loads(tags),
+                    "citations": json.loads(citations),
+                    "timestamp": timestamp
+                }, encoding, content), len(content))
+        return [found[i] for i in ids if i in found]
+
+    def _content(self, cell_id: str, inline: str, seg: Optional[int], offset: Optional[int], length: Optional[int],
+                 is_raw: int) -> Union[str, bytes]:
+        """正文：段中的原始字节；旧数据（content 列或 raw = 0 的段记录）为文本形态。"""
+        if seg is None:
+            return inline
+        try:
+            body = self._segments.read((seg, offset, length))
+        except FileNotFoundError:
+            # 段在查询之后被其他进程的压缩删除：指针已切换，按最新指针重读（调用方已取完结果，不在旧的读事务里）
+            seg, offset, length, is_raw = self._conn.execute(
+                'SELECT seg, seg_offset, seg_length, raw FROM cells WHERE id = ?', (cell_id,)).fetchone()
+            body = self._segments.read((seg, offset, length))
+        return body if is_raw else body.decode("utf-8")
+
+    def _payload(self, cell_id, cell_type, encoding, content, tags, citations, timestamp, seg, offset, length, is_raw) -> Dict[str, Any]:
+        """一行 cells 记录 -> cell 载荷（content 为文本形态）。"""
+        content = self._content(cell_id, content, seg, offset, length, is_raw)
+        return {"id": cell_id, "type": cell_type, "encoding": encoding,
+                "content": content if isinstance(content, str) else codec.text(encoding, content),
+                "tags": json.loads(tags), "citations": json.loads(citations), "timestamp": timestamp}
+
+    def _remember(self, cell: LazyCell, size: int) -> LazyCell:
+        cell_id = cell['id']
+        if cell_id in self._hot:
+            self._hot_bytes -= self._hot_sizes[cell_id]
+        self._hot[cell_id] = cell
+        self._hot.move_to_end(cell_id)
+        self._hot_sizes[cell_id] = size
+        self._hot_bytes += size
+        while len(self._hot) > 1 and (len(self._hot) > HOT_MAX_CELLS or self._hot_bytes > HOT_MAX_BYTES):
+            evicted, _ = self._hot.popitem(last=False)
+            self._hot_bytes -= self._hot_sizes.pop(evicted)
+        return cell
+
+    def drop_hot(self):
+        """清空热层（之后的召回从冷层读取）。"""
+        with self._lock:
+            self._hot.clear()
+            self._hot_sizes.clear()
+            self._hot_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sealed = self._segments.sealed()
+            return {"cells": len(self._index), "hot_cells": len(self._hot), "hot_bytes": self._hot_bytes,
+                    "segments": len(sealed) + 1, "sealed_bytes": sum(size for _, size in sealed)}
+
+    # ---------- compaction ----------
+    def _maybe_compact(self):
+        if self._segments.plan_compaction() and not self._compacting.locked():
+            threading.Thread(target=self.compact, name="evermem-compaction", daemon=True).start()
+
+    def compact(self) -> int:
+        """
+        把封存的小段合并为一个新段并切换指针，返回合并掉的段数。
+        拷贝在锁外进行（封存段不可变），只有指针切换与删除旧段时持锁；同一时刻只有一个压缩在跑。
+        """
+        if not self._compacting.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                plan = self._segments.plan_compaction()
+                # 只合并拿到排他锁的段：其他进程仍在写入或映射的段留待下一轮
+                plan = self._segments.claim(plan) if plan else []
+                if not plan:
+                    return 0
+                live = [(cell_id, (seg, offset, length)) for cell_id, seg, offset, length in self._conn.execute(
+                    f'SELECT id, seg, seg_offset, seg_length FROM cells WHERE seg IN ({",".join("?" * len(plan))})', plan)]
+            moved = self._segments.merge(live)
+            with self._lock:
+                with self._conn:
+                    self._conn.executemany('UPDATE cells SET seg = ?, seg_offset = ?, seg_length = ? WHERE id = ?',
+                                           [(*pointer, cell_id) for cell_id, pointer in moved.items()])
+                self._segments.drop(plan)
+            log.info("segments_compacted", merged=len(plan), cells=len(moved))
+            return len(plan)
+        finally:
+            self._segments.release()
+            self._compacting.release()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._segments.close()
+            if self._tmpdir is not None:
+                self._tmpdir.cleanup()
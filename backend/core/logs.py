@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+import random
+import sys
+from typing import Any
+
+# 结构化日志：每条一行 JSON（event + 字段），按级别过滤；高频事件可按比例采样。
+# LOG_LEVEL 控制级别（默认 INFO）；LOG_SAMPLE_RATE 为 sampled=True 事件的默认采样率（默认 0.01）。
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+ROOT_LOGGER = "research_os"
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 3), "level": record.levelname.lower(), "logger": record.name}
+        entry.update(getattr(record, "fields", None) or {"event": record.getMessage()})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _configure():
+    root = logging.getLogger(ROOT_LOGGER)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(_JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+_configure()
+
+class StructuredLogger:
+    """logger.info("cell_committed", cell_id=..., sampled=True)；级别未开启时不做任何格式化。"""
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+    def _log(self, level: int, event: str, sampled: bool = False, sample_rate: float = None, **fields: Any):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sampled:
+            rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+            if rate < 1.0 and random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+        self._logger.log(level, event, extra={"fields": {"event": event, **fields}})
+
+    def debug(self, event: str, **fields: Any):
+        self._log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields: Any):
+        self._log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields: Any):
+        self._log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields: Any):
+        self._log(logging.ERROR, event, **fields)
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(name)
@@ -0,0 +1,25 @@
+import sqlite3
+from typing import Callable, Sequence
+
+# 一步迁移：在给定游标上把库从版本 i 升到 i+1
+Migration = Callable[[sqlite3.Cursor], None]
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection, steps: Sequence[Migration]) -> int:
+    """
+    按 PRAGMA user_version 依次执行尚未应用的迁移（steps[i] 把库从版本 i 升到 i+1），返回执行的步数。
+    已是最新版本时只读一次 user_version，启动时不再执行任何 DDL。
+    每一步与版本号在同一个事务内提交；库的版本比代码新时拒绝打开。
+    第一步是基线，对引入版本号之前创建的库同样适用，须保持幂等（IF NOT EXISTS / 按列检查）。
+    """
+    version = schema_version(conn)
+    if version > len(steps):
+        raise RuntimeError(f"database schema version {version} is newer than supported version {len(steps)}")
+    for number in range(version, len(steps)):
+        with conn:
+            conn.execute('BEGIN')
+            steps[number](conn.cursor())
+            conn.execute(f'PRAGMA user_version = {number + 1}')
+    return len(steps) - version
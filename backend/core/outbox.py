@@ -0,0 +1,175 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional
+from . import cell_ids
+from .logs import get_logger
+
+log = get_logger("outbox")
+
+# 每批复制的 cell 数、重试退避（秒）、告警阈值（尝试次数）与空闲轮询间隔
+OUTBOX_BATCH_SIZE = 100
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 300.0
+ALERT_ATTEMPTS = 10
+POLL_INTERVAL = 0.5
+
+def init_schema(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS memory_outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            cell_id TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON memory_outbox(next_attempt_at, seq)')
+    # 被远端拒收（4xx）的条目移到死信表，不再阻塞后续复制，留待人工处理；瞬时错误一直按上限退避重试
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS memory_outbox_dead (
+            cell_id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL,
+            failed_at REAL NOT NULL,
+            last_error TEXT
+        )
+    ''')
+
+def enqueue(conn: sqlite3.Connection, client, cells: List[Dict[str, Any]]) -> List[str]:
+    """
+    在调用方的事务内登记待复制的 cell。id 与时间戳在此刻确定（时间戳取自时间有序的 id），
+    因此重试多次也只会产生同一个 cell（下游按 id 去重）。
+    """
+    now = time.time()
+    timestamp = datetime.now().isoformat()
+    rows, ids = [], []
+    for cell in cells:
+        cell_id = cell.get("cell_id") or client.new_cell_id()
+        spec = {**cell, "cell_id": cell_id, "timestamp": cell.get("timestamp") or cell_ids.timestamp_of(cell_id) or timestamp}
+        ids.append(spec['cell_id'])
+        rows.append((spec['cell_id'], json.dumps(spec), now))
+    conn.executemany('INSERT OR IGNORE INTO memory_outbox (cell_id, payload, created_at) VALUES (?, ?, ?)', rows)
+    return ids
+
+def _backoff(attempts: int) -> float:
+    delay = min(RETRY_BASE_DELAY * (2 ** min(attempts, 32)), RETRY_MAX_DELAY)
+    return delay + random.uniform(0, delay * 0.1)
+
+def _permanent(e: Exception) -> bool:
+    """远端明确拒收（4xx，超时/限流除外）的错误重试也不会成功。"""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+def replicate_once(conn: sqlite3.Connection, client, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """取出一批到期的 cell 交给 client.ship_cells；成功则删除，失败则按指数退避安排重试。返回成功条数。"""
+    rows = conn.execute(
+        'SELECT seq, payload, attempts FROM memory_outbox WHERE next_attempt_at <= ? ORDER BY seq LIMIT ?',
+        (time.time(), batch_size)
+    ).fetchall()
+    if not rows:
+        return 0
+    return _ship_rows(conn, client, rows)
+
+def _ship_rows(conn: sqlite3.Connection, client, rows: List[tuple]) -> int:
+    try:
+        client.ship_cells([json.loads(r[1]) for r in rows])
+    except Exception as e:
+        if len(rows) > 1 and _permanent(e):
+            # 批次中有被拒收的 cell：逐条重发，只隔离出问题的那几条
+            return sum(_ship_rows(conn, client, [row]) for row in rows)
+        _record_failure(conn, rows, e)
+        return 0
+    with conn:
+        conn.executemany('DELETE FROM memory_outbox WHERE seq = ?', [(r[0],) for r in rows])
+    return len(rows)
+
+def _record_failure(conn: sqlite3.Connection, rows: List[tuple], e: Exception):
+    now = time.time()
+    error = str(e)[:500]
+    # 只有远端明确拒收才进死信；连接错误、5xx 等瞬时错误不丢弃，按封顶的退避一直重试
+    dead = rows if _permanent(e) else []
+    retry = rows if not dead else []
+    with conn:
+        if retry:
+            log.warning("replication_retry", count=len(retry), error=error)
+            stalled = [r for r in retry if r[2] + 1 >= ALERT_ATTEMPTS]
+            if stalled:
+                log.error("replication_stalled", count=len(stalled), attempts=max(r[2] + 1 for r in stalled), error=error)
+            conn.executemany(
+                'UPDATE memory_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE seq = ?',
+                [(now + _backoff(attempts), error, seq) for seq, _, attempts in retry]
+            )
+        if dead:
+            log.error("dead_lettered", count=len(dead), error=error)
+            conn.executemany('''
+                INSERT OR REPLACE INTO memory_outbox_dead (cell_id, payload, created_at, attempts, failed_at, last_error)
+                SELECT cell_id, payload, created_at, attempts + 1, ?, ? FROM memory_outbox WHERE seq = ?
+            ''', [(now, error, r[0]) for r in dead])
+            conn.executemany('DELETE FROM memory_outbox WHERE seq = ?', [(r[0],) for r in dead])
+
+def stats(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """复制积压：待复制条数、最老一条的滞后秒数、最大重试次数、最近一次错误与死信条数。"""
+    pending, oldest, max_attempts = conn.execute(
+        'SELECT COUNT(*), MIN(created_at), MAX(attempts) FROM memory_outbox'
+    ).fetchone()
+    last_error = conn.execute(
+        'SELECT last_error FROM memory_outbox WHERE last_error IS NOT NULL ORDER BY seq DESC LIMIT 1'
+    ).fetchone()
+    return {
+        "pending": pending,
+        "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+        "max_attempts": max_attempts or 0,
+        "last_error": last_error[0] if last_error else None,
+        "dead_letters": conn.execute('SELECT COUNT(*) FROM memory_outbox_dead').fetchone()[0],
+    }
+
+class OutboxReplicator:
+    """后台复制线程：有积压时连续按批发送，空闲时等待 wake() 或轮询间隔。"""
+    def __init__(self, get_conn: Callable[[], sqlite3.Connection], client, batch_size: int = OUTBOX_BATCH_SIZE):
+        self._get_conn = get_conn
+        self._client = client
+        self._batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="memory-outbox", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                shipped = replicate_once(self._get_conn(), self._client, self._batch_size)
+            except Exception as e:
+                log.error("replicator_error", error=str(e))
+                shipped = 0
+            if shipped == 0:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+        # 退出前尽力再推送一轮积压
+        try:
+            while replicate_once(self._get_conn(), self._client, self._batch_size):
+                pass
+        except Exception as e:
+            log.error("final_drain_failed", error=str(e))
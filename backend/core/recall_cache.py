@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+from . import metrics
+
+class RecallCache:
+    """
+    REAL 模式远端召回结果的 LRU + TTL 缓存，键为 (规范化标签集合, 分页参数)。
+    提交 cell 时只淘汰查询标签是该 cell 标签子集的条目（这些查询的结果可能包含新 cell），其余保持命中。
+    TTL 兜底其他进程/实例的写入。
+    """
+    def __init__(self, maxsize: int = 512, ttl: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, FrozenSet[str], List[Dict[str, Any]]]]" = OrderedDict()
+        # 标签集合 -> 使用该集合的缓存键，失效时按集合判断子集关系
+        self._by_tags: Dict[FrozenSet[str], Set[Hashable]] = {}
+        # 每次失效递增；查询期间发生过失效的结果不写入缓存，避免把旧结果放回去
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(flat_query: Iterable[str], *params: Any) -> Tuple[FrozenSet[str], Tuple[Any, ...]]:
+        return frozenset(flat_query), params
+
+    def get(self, key: Tuple[FrozenSet[str], Tuple[Any, ...]]) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+        """返回 (命中的结果副本或 None, 当前 epoch)；epoch 交给 put。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.EVERMEM_RECALL_CACHE.inc(result="hit")
+                return [dict(c) for c in entry[2]], self._epoch
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            metrics.EVERMEM_RECALL_CACHE.inc(result="miss")
+            return None, self._epoch
+
+    def put(self, key: Tuple[FrozenSet[str], Tuple[Any, ...]], results: List[Dict[str, Any]], epoch: int):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self._clock(), key[0], [dict(c) for c in results])
+            self._by_tags.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, cell_tags: Iterable[str]) -> int:
+        """一个新 cell 带有 cell_tags：淘汰所有标签集合 ⊆ cell_tags 的查询，返回淘汰条数。"""
+        tags = frozenset(cell_tags)
+        with self._lock:
+            self._epoch += 1
+            stale = [k for tag_set, keys in self._by_tags.items() if tag_set <= tags for k in keys]
+            for k in stale:
+                self._drop(k)
+            return len(stale)
+
+    def _drop(self, key: Hashable):
+        _, tag_set, _ = self._entries.pop(key)
+        keys = self._by_tags[tag_set]
+        keys.discard(key)
+        if not keys:
+            del self._by_tags[tag_set]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_tags.clear()
+            self.hits = self.misses = 0
@@ -0,0 +1,239 @@
+import mmap
+import os
+import re
+import threading
+from typing import IO, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，被打开（含 mmap）的文件本身无法删除，drop 时跳过
+    fcntl = None
+
+# 单个段文件写满后封存、开新段；小于 COMPACT_TARGET_BYTES 的封存段由压缩合并
+SEGMENT_MAX_BYTES = int(os.getenv("EVERMEM_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+COMPACT_TARGET_BYTES = 64 * 1024 * 1024
+COMPACT_MIN_SEGMENTS = 4
+
+_NAME = re.compile(r"^seg-(\d{8})\.log$")
+
+Pointer = Tuple[int, int, int]  # (段号, 偏移, 长度)
+
+def _flock(f: IO[bytes], exclusive: bool, blocking: bool) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB))
+        return True
+    except BlockingIOError:
+        return False
+
+def _unlinked(f: IO[bytes]) -> bool:
+    return os.fstat(f.fileno()).st_nlink == 0
+
+class SegmentStore:
+    """
+    cell 正文的冷存储：目录下按序编号的只追加段文件。当前段用普通文件追加写；
+    封存段只读，按需 mmap 后切片读取（由操作系统页缓存决定驻留多少，进程堆不随历史增长）。
+    记录本身不带元数据，(段号, 偏移, 长度) 指针由调用方（LocalCellStore 的 SQLite 行）保存。
+    线程安全由调用方保证，压缩的拷贝阶段除外（见 merge）。
+
+    多个进程可共用同一目录（同一个 EVERMEM_STORE_PATH）：
+    - 每个进程启动时以 O_EXCL 新建自己的当前段，只有它向该段追加，写入偏移不会与其他进程重叠；
+    - 打开段的进程（写入方或 mmap 读取方）对其持共享锁（flock），压缩只合并能拿到排他锁的段，
+      因此不会删除其他进程仍在写入或映射的段。其他进程删除段后，读取方按最新指针重读（见 LocalCellStore）。
+    """
+    def __init__(self, directory: str, max_bytes: int = None):
+        self.directory = directory
+        self.max_bytes = max_bytes or SEGMENT_MAX_BYTES
+        os.makedirs(directory, exist_ok=True)
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._files: Dict[int, IO[bytes]] = {}
+        # 压缩期间持有排他锁的段（待合并的旧段与合并出的新段）
+        self._claimed: Dict[int, IO[bytes]] = {}
+        # 段号分配：写入方滚动与后台压缩都从这里取号；跨进程由 O_EXCL 保证不重号
+        self._alloc = threading.Lock()
+        self._active_no, self._active = self._create(exclusive=False)
+        self._active_size = os.fstat(self._active.fileno()).st_size
+        self._compacting = threading.Lock()
+
+    @property
+    def active_number(self) -> int:
+        return self._active_no
+
+    def _create(self, exclusive: bool) -> Tuple[int, IO[bytes]]:
+        """新建一个段文件（段号取目录中最大段号 + 1）并加锁；加锁前被其他进程的压缩删掉时重试。"""
+        with self._alloc:
+            while True:
+                numbers = self._numbers()
+                number = (numbers[-1] if numbers else 0) + 1
+                try:
+                    fd = os.open(self._path(number), os.O_CREAT | os.O_EXCL | os.O_RDWR | getattr(os, "O_BINARY", 0))
+                except FileExistsError:
+                    continue
+                f = os.fdopen(fd, "a+b")
+                _flock(f, exclusive, blocking=True)
+                if not _unlinked(f):
+                    return number, f
+                f.close()
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, f"seg-{number:08d}.log")
+
+    def _numbers(self) -> List[int]:
+        return sorted(int(m.group(1)) for m in (_NAME.match(n) for n in os.listdir(self.directory)) if m)
+
+    def sealed(self) -> List[Tuple[int, int]]:
+        """本进程当前段以外的段：[(段号, 字节数)]（可能含其他进程的当前段）。与压缩删除旧段并发时跳过刚被删除的段。"""
+        out = []
+        for number in self._numbers():
+            if number == self._active_no:
+                continue
+            try:
+                out.append((number, os.path.getsize(self._path(number))))
+            except FileNotFoundError:
+                pass
+        return out
+
+    def append_many(self, blobs: Iterable[bytes]) -> List[Pointer]:
+        pointers = []
+        for blob in blobs:
+            if self._active_size and self._active_size + len(blob) > self.max_bytes:
+                self._roll()
+            self._active.write(blob)
+            pointers.append((self._active_no, self._active_size, len(blob)))
+            self._active_size += len(blob)
+        self._active.flush()
+        return pointers
+
+    def _roll(self):
+        self._active.close()
+        self._active_no, self._active = self._create(exclusive=False)
+        self._active_size = 0
+
+    def read(self, pointer: Pointer) -> bytes:
+        """按指针读取；段已被（其他进程的）压缩删除时抛 FileNotFoundError。"""
+        number, offset, length = pointer
+        if number == self._active_no:
+            return os.pread(self._active.fileno(), length, offset) if hasattr(os, "pread") else self._read_file(pointer)
+        view = self._maps.get(number)
+        if view is None or offset + length > len(view):
+            # 未映射过，或是其他进程仍在追加的段、映射之后又长了
+            view = self._map(number)
+            if view is None:
+                return self._read_file(pointer)
+        return view[offset:offset + length]
+
+    def _map(self, number: int) -> Optional[mmap.mmap]:
+        """映射封存段并持共享锁；段正在被压缩（拿不到共享锁）或为空时返回 None，由调用方直接读文件。"""
+        self._unmap(number)
+        f = open(self._path(number), "rb")
+        if not _flock(f, exclusive=False, blocking=False) or os.fstat(f.fileno()).st_size == 0:
+            f.close()
+            return None
+        if _unlinked(f):
+            f.close()
+            raise FileNotFoundError(self._path(number))
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files[number], self._maps[number] = f, view
+        return view
+
+    def _unmap(self, number: int):
+        view, f = self._maps.pop(number, None), self._files.pop(number, None)
+        if view is not None:
+            view.close()
+        if f is not None:
+            f.close()
+
+    def _read_file(self, pointer: Pointer) -> bytes:
+        number, offset, length = pointer
+        with open(self._path(number), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def plan_compaction(self) -> Optional[List[int]]:
+        """挑出可合并的封存小段（合计不超过 COMPACT_TARGET_BYTES）；不足 COMPACT_MIN_SEGMENTS 个时返回 None。"""
+        run, total = [], 0
+        for number, size in self.sealed():
+            if size >= COMPACT_TARGET_BYTES:
+                continue
+            if total + size > COMPACT_TARGET_BYTES:
+                break
+            run.append(number)
+            total += size
+        return run if len(run) >= COMPACT_MIN_SEGMENTS else None
+
+    def claim(self, numbers: Iterable[int]) -> List[int]:
+        """
+        对待合并的段加排他锁（先释放本进程自己的映射），返回加锁成功的段号。
+        其他进程仍在写入或映射的段拿不到锁，本轮不合并；锁一直持有到 drop / release。
+        """
+        claimed = []
+        for number in numbers:
+            self._unmap(number)
+            try:
+                f = open(self._path(number), "rb")
+            except FileNotFoundError:
+                continue
+            if _flock(f, exclusive=True, blocking=False) and not _unlinked(f):
+                self._claimed[number] = f
+                claimed.append(number)
+            else:
+                f.close()
+        return claimed
+
+    def merge(self, live: List[Tuple[str, Pointer]]) -> Dict[str, Pointer]:
+        """
+        把 live 中的记录（都位于已 claim 的段）按原顺序拷贝到一个新段，返回新指针。
+        封存段不可变，拷贝阶段无需持有调用方的锁；未被引用的记录（孤儿写入）在此丢弃。
+        新段在调用方切换指针之前一直持有排他锁，不会被其他进程当作无人引用的段合并掉。
+        """
+        moved: Dict[str, Pointer] = {}
+        if not live:
+            return moved
+        with self._compacting:
+            number, out = self._create(exclusive=True)
+            self._claimed[number] = out
+            offset = 0
+            for cell_id, (src, src_offset, length) in sorted(live, key=lambda item: item[1]):
+                f = self._claimed[src]
+                f.seek(src_offset)
+                out.write(f.read(length))
+                moved[cell_id] = (number, offset, length)
+                offset += length
+            out.flush()
+            os.fsync(out.fileno())
+        return moved
+
+    def drop(self, numbers: Iterable[int]):
+        """指针已切换到新段后删除旧段（调用方持锁，保证本进程没有读者仍在使用其 mmap），并释放全部排他锁。"""
+        for number in numbers:
+            self._unmap(number)
+            f = self._claimed.pop(number, None)
+            if fcntl is None and f is not None:
+                # Windows 上仍打开的文件无法删除
+                f.close()
+                f = None
+            try:
+                os.remove(self._path(number))
+            except (FileNotFoundError, PermissionError):
+                pass
+            if f is not None:
+                f.close()
+        self.release()
+
+    def release(self):
+        """释放压缩持有的排他锁（压缩中途失败时由调用方调用；段保持原样）。"""
+        for number in list(self._claimed):
+            self._claimed.pop(number).close()
+
+    def close(self):
+        self.release()
+        for number in list(self._maps):
+            self._unmap(number)
+        # 没写入过的当前段直接删除，避免每次启动都留下一个空段
+        if self._active_size == 0:
+            try:
+                os.remove(self._path(self._active_no))
+            except OSError:
+                pass
+        self._active.close()
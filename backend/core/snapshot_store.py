@@ -0,0 +1,169 @@
+import difflib
+import json
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+# 每隔多少个版本写一次完整 checkpoint（限制重建时需要回放的 delta 数）
+CHECKPOINT_INTERVAL = 10
+# 最近读写过的版本 LRU 上限（缓存按行切分的正文，读取时重新组装，调用方修改不会污染缓存）
+DOC_CACHE_SIZE = 64
+
+_cache: "OrderedDict[Tuple[str, str], Dict[str, List[str]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(db_path: str, version_id: str) -> Optional[Dict[str, List[str]]]:
+    with _cache_lock:
+        lines = _cache.get((db_path, version_id))
+        if lines is not None:
+            _cache.move_to_end((db_path, version_id))
+        return lines
+
+def _cache_put(db_path: str, version_id: str, lines: Dict[str, List[str]]):
+    with _cache_lock:
+        _cache[(db_path, version_id)] = lines
+        _cache.move_to_end((db_path, version_id))
+        while len(_cache) > DOC_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+# ---------- 文档 <-> 按行字段 ----------
+def _to_lines(snapshot: Dict[str, Any]) -> Dict[str, List[str]]:
+    # persona/hypotheses 用缩进 JSON，使局部修改只影响少数行；PRD 按原文行切分
+    return {
+        "persona": json.dumps(snapshot['persona'], ensure_ascii=False, indent=1).split("\n"),
+        "hypotheses": json.dumps(snapshot['hypotheses'], ensure_ascii=False, indent=1).split("\n"),
+        "prd_markdown": (snapshot.get('prd_markdown') or "").split("\n"),
+    }
+
+def _from_lines(lines: Dict[str, List[str]]) -> Dict[str, Any]:
+    return {
+        "persona": json.loads("\n".join(lines['persona'])),
+        "hypotheses": json.loads("\n".join(lines['hypotheses'])),
+        "prd_markdown": "\n".join(lines['prd_markdown']),
+    }
+
+def _diff(base: List[str], new: List[str]) -> List[list]:
+    """行级 delta：["c", i1, i2] 复制 base[i1:i2]，["i", [...]] 插入新行。"""
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(["i", new[j1:j2]])
+    return ops
+
+def _patch(base: List[str], ops: List[list]) -> List[str]:
+    out = []
+    for op in ops:
+        if op[0] == "c":
+            out.extend(base[op[1]:op[2]])
+        else:
+            out.extend(op[1])
+    return out
+
+def _pack(obj: Any) -> bytes:
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+def _unpack(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+# ---------- 读写 ----------
+def init_schema(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot_blobs (
+            version_id TEXT PRIMARY KEY,
+            base_version_id TEXT,
+            depth INTEGER NOT NULL,
+            payload BLOB NOT NULL
+        )
+    ''')
+
+def write_doc(conn: sqlite3.Connection, db_path: str, version_id: str, parent_version_id: Optional[str],
+              snapshot: Dict[str, Any]) -> int:
+    """
+    写入快照正文：父版本可读且距上个 checkpoint 不足 CHECKPOINT_INTERVAL 时存压缩 delta，否则存完整 checkpoint。
+    返回写入的字节数。在调用方的事务内执行，不写缓存：事务提交后再调用 cache_doc，回滚的版本不会进入缓存。
+    """
+    lines = _to_lines(snapshot)
+    depth = 0
+    payload = {"fields": lines}
+    if parent_version_id:
+        row = conn.execute('SELECT depth FROM snapshot_blobs WHERE version_id = ?', (parent_version_id,)).fetchone()
+        parent_depth = row[0] if row else None
+        base = _read_lines(conn, db_path, parent_version_id)
+        if base is not None and (parent_depth is None or parent_depth + 1 < CHECKPOINT_INTERVAL):
+            depth = 1 if parent_depth is None else parent_depth + 1
+            payload = {"base": parent_version_id, "delta": {k: _diff(base[k], lines[k]) for k in lines}}
+    blob = _pack(payload)
+    conn.execute(
+        'INSERT INTO snapshot_blobs (version_id, base_version_id, depth, payload) VALUES (?, ?, ?, ?)',
+        (version_id, payload.get("base"), depth, blob)
+    )
+    return len(blob)
+
+def cache_doc(db_path: str, version_id: str, snapshot: Dict[str, Any]):
+    """write_doc 所在事务提交后调用：把刚写入的版本放进缓存，下一个版本的 delta 无需回放。"""
+    _cache_put(db_path, version_id, _to_lines(snapshot))
+
+def read_doc(conn: sqlite3.Connection, db_path: str, version_id: str) -> Optional[Dict[str, Any]]:
+    """重建某版本的 {persona, hypotheses, prd_markdown}；优先命中 LRU，否则从最近的 checkpoint 回放 delta。"""
+    lines = _read_lines(conn, db_path, version_id)
+    return _from_lines(lines) if lines is not None else None
+
+def _read_lines(conn: sqlite3.Connection, db_path: str, version_id: str) -> Optional[Dict[str, List[str]]]:
+    lines = _cache_get(db_path, version_id)
+    if lines is not None:
+        return lines
+    chain = conn.execute('''
+        WITH RECURSIVE chain(version_id, base_version_id, payload, step) AS (
+            SELECT version_id, base_version_id, payload, 0 FROM snapshot_blobs WHERE version_id = ?
+            UNION ALL
+            SELECT b.version_id, b.base_version_id, b.payload, c.step + 1
+            FROM snapshot_blobs b JOIN chain c ON b.version_id = c.base_version_id
+            WHERE c.step < ?
+        )
+        SELECT version_id, base_version_id, payload FROM chain ORDER BY step
+    ''', (version_id, CHECKPOINT_INTERVAL)).fetchall()
+    if not chain:
+        legacy = _read_legacy(conn, version_id)
+        return _to_lines(legacy) if legacy is not None else None
+
+    # 由新到旧找到起点（缓存命中 / checkpoint / 旧版全量行），再由旧到新回放
+    pending = []
+    lines = None
+    for vid, base_vid, blob in chain:
+        cached = _cache_get(db_path, vid) if vid != version_id else None
+        if cached is not None:
+            lines = cached
+            break
+        payload = _unpack(blob)
+        if "fields" in payload:
+            lines = payload["fields"]
+            break
+        pending.append(payload["delta"])
+    else:
+        base_doc = _read_legacy(conn, chain[-1][1]) if chain[-1][1] else None
+        if base_doc is None:
+            return None
+        lines = _to_lines(base_doc)
+    for delta in reversed(pending):
+        lines = {k: _patch(lines[k], ops) for k, ops in delta.items()}
+    _cache_put(db_path, version_id, lines)
+    return lines
+
+def _read_legacy(conn: sqlite3.Connection, version_id: str) -> Optional[Dict[str, Any]]:
+    # 旧版布局：正文直接存在 requirement_snapshots 的三个列里
+    row = conn.execute(
+        'SELECT persona_json, hypotheses_json, prd_markdown FROM requirement_snapshots WHERE version_id = ?',
+        (version_id,)
+    ).fetchone()
+    if row is None or row[0] is None:
+        return None
+    return {"persona": json.loads(row[0]), "hypotheses": json.loads(row[1]), "prd_markdown": row[2]}
@@ -0,0 +1,93 @@
+import bisect
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+_MAX_ID = "\U0010ffff"
+
+
+class TagIndex:
+    """
+    本地存储的倒排索引：tag -> 按 (timestamp, id) 排序的 cell id 列表（posting list）。
+    新 cell 的 id 本身时间有序（见 cell_ids），同一时间戳内也按 id 排序，游标只需一个 id。
+    只保存 {id, tags, timestamp}，正文由 LocalCellStore 按 id 读取；commit 时增量维护，
+    recall 从最短的 posting list 出发求交集，因此召回开销与命中数成正比，而不是与存储总量成正比。
+    """
+    def __init__(self):
+        self._cells: Dict[str, Dict[str, Any]] = {}
+        self._tag_sets: Dict[str, frozenset] = {}
+        self._postings: Dict[str, List[str]] = {}
+        self._all: List[str] = []
+
+    def state(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, frozenset], Dict[str, List[str]], List[str]]:
+        """可序列化的内部状态（供索引快照使用，调用方持锁）。"""
+        return self._cells, self._tag_sets, self._postings, self._all
+
+    @classmethod
+    def from_state(cls, state) -> "TagIndex":
+        index = cls()
+        index._cells, index._tag_sets, index._postings, index._all = state
+        return index
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def __contains__(self, cell_id: str) -> bool:
+        return cell_id in self._cells
+
+    def timestamp(self, cell_id: str) -> Optional[str]:
+        cell = self._cells.get(cell_id)
+        return cell['timestamp'] if cell is not None else None
+
+    def _key(self, cell_id: str) -> Tuple[str, str]:
+        return self._cells[cell_id]['timestamp'], cell_id
+
+    def _insert(self, posting: List[str], cell_id: str):
+        # 正常情况下按提交顺序追加即有序；并发提交导致的乱序用二分插入修正
+        key = self._key(cell_id)
+        if not posting or self._key(posting[-1]) <= key:
+            posting.append(cell_id)
+        else:
+            bisect.insort_right(posting, cell_id, key=self._key)
+
+    def add(self, cell: Dict[str, Any]):
+        """cell 只需包含 {id, tags, timestamp}"""
+        cell_id = cell['id']
+        if cell_id in self._cells:
+            return
+        self._cells[cell_id] = cell
+        self._tag_sets[cell_id] = frozenset(cell['tags'])
+        self._insert(self._all, cell_id)
+        for tag in self._tag_sets[cell_id]:
+            self._insert(self._postings.setdefault(tag, []), cell_id)
+
+    def iter_ids(self, flat_query: List[str], before: Optional[str] = None, after: Optional[str] = None,
+                 start_after: Optional[Tuple[str, str]] = None) -> Iterator[str]:
+        """
+        按时间倒序产出同时带有全部 flat_query 标签的 cell id。
+        before/after 为 ISO 时间戳（开区间）；start_after=(timestamp, id) 为 keyset 游标，从该 cell 之后继续。
+        时间窗口与游标都在最短 posting list 上二分定位，不扫描窗口外的条目。
+        """
+        if not flat_query:
+            smallest, rest = self._all, frozenset()
+        else:
+            postings = []
+            for tag in set(flat_query):
+                posting = self._postings.get(tag)
+                if not posting:
+                    return
+                postings.append((len(posting), tag, posting))
+            postings.sort(key=lambda p: p[0])
+            smallest = postings[0][2]
+            rest = frozenset(p[1] for p in postings[1:])
+
+        lo, hi = 0, len(smallest)
+        if after is not None:
+            lo = bisect.bisect_right(smallest, (after, _MAX_ID), key=self._key)
+        if before is not None:
+            hi = bisect.bisect_left(smallest, (before, ""), key=self._key)
+        if start_after is not None:
+            hi = min(hi, bisect.bisect_left(smallest, tuple(start_after), key=self._key))
+
+        for pos in range(hi - 1, lo - 1, -1):
+            cell_id = smallest[pos]
+            if rest <= self._tag_sets[cell_id]:
+                yield cell_id
@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, List
+from .logs import get_logger
+
+log = get_logger("write_behind")
+
+_STOP = object()
+
+class WriteBehindQueue:
+    """
+    有界的后台写队列：调用方 put 后立即返回，后台线程按批次（batch_size / linger）调用 ship。
+    队列满时 put 在 timeout 内阻塞（背压），仍满则返回 False，由调用方自行同步写入。
+    ship 不应抛异常；失败处理（如降级到本地存储）由 ship 自己负责。
+    """
+    def __init__(self, ship: Callable[[List[Any]], None], capacity: int = 1000, batch_size: int = 100, linger: float = 0.05):
+        self._ship = ship
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=capacity)
+        self._batch_size = batch_size
+        self._linger = linger
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="evermem-write-behind", daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return self._queue.unfinished_tasks
+
+    def put(self, item: Any, timeout: float = None) -> bool:
+        if self._closed:
+            raise RuntimeError("write-behind queue is closed")
+        try:
+            self._queue.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def put_nowait(self, item: Any) -> bool:
+        """不阻塞的 put（供事件循环线程使用）：队列满时立即返回 False。"""
+        if self._closed:
+            raise RuntimeError("write-behind queue is closed")
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self):
+        """阻塞直到此前入队的所有条目都已交给 ship 处理完毕。"""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self._linger
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._ship(batch)
+            except Exception as e:
+                log.error("ship_failed", dropped=len(batch), error=str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
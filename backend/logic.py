@@ -1,15 +1,99 @@
 
 from __future__ import annotations
 from typing import Dict, Any, List, Tuple
+import hashlib
+import json
+import os
 import re
 
 # ---------- helpers ----------
 def _norm(s: str) -> str:
     return (s or "").strip()
 
-def _contains_any(s: str, keywords: List[str]) -> bool:
-    s=_norm(s)
-    return any(k in s for k in keywords)
+# ---------- diagnosis rules ----------
+# 声明式规则表：field 为被扫描的输入字段，group 决定写入哪个诊断结论。
+# problem_type 按表顺序累积；urgency / controllability 取表中最后一条命中规则的 value。
+DIAGNOSE_RULES: List[Dict[str, Any]] = [
+    {"id": "problem.funnel", "group": "problem_type", "field": "core_problem", "value": "漏斗转化折损",
+     "keywords": ["转化", "CVR", "加购", "弃购", "漏斗", "下单", "支付"]},
+    {"id": "problem.trust", "group": "problem_type", "field": "core_problem", "value": "信任与风险",
+     "keywords": ["品牌", "信任", "公信", "口碑", "声誉", "安全", "合规"]},
+    {"id": "problem.price", "group": "problem_type", "field": "core_problem", "value": "价格与价值锚点",
+     "keywords": ["价格", "贵", "不值", "促销", "折扣", "性价比"]},
+    {"id": "problem.retention", "group": "problem_type", "field": "core_problem", "value": "复购与履约体验",
+     "keywords": ["复购", "留存", "退款", "退货", "满意度", "售后"]},
+    {"id": "problem.messaging", "group": "problem_type", "field": "core_problem", "value": "表达与说服力",
+     "keywords": ["内容", "素材", "文案", "卖点", "表达", "种草"]},
+    {"id": "urgency.problem", "group": "urgency", "field": "core_problem", "value": "高",
+     "keywords": ["暴跌", "大幅", "腰斩", "连续", "极低", "投放烧钱"]},
+    {"id": "urgency.constraints", "group": "urgency", "field": "constraints", "value": "高",
+     "keywords": ["尽快", "两周", "本月", "马上"]},
+    {"id": "urgency.goal", "group": "urgency", "field": "target_goal", "value": "中-高",
+     "keywords": ["首单", "获客", "线索", "转化"]},
+    {"id": "control.external", "group": "controllability", "field": "core_problem", "value": "低-中",
+     "keywords": ["供应链", "缺货", "交付", "物流", "监管"]},
+    {"id": "control.assets", "group": "controllability", "field": "core_problem", "value": "高",
+     "keywords": ["落地页", "详情页", "素材", "文案", "卖点"]},
+]
+
+class RuleEngine:
+    """
+    规则表编译结果：每个字段的全部关键词合并成一个前瞻正则，一次扫描找出所有命中（含重叠）。
+    同一起点只会匹配到最长的词，更短的前缀词由预先算好的前缀关系补齐。
+    """
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = [dict(r, keywords=list(r["keywords"])) for r in rules]
+        # 规则表内容的指纹，用于判断其他进程（批量处理的 worker）手里的规则是否过期
+        self.version = hashlib.sha1(json.dumps(self.rules, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        by_field: Dict[str, Dict[str, List[str]]] = {}
+        for rule in self.rules:
+            for kw in rule["keywords"]:
+                by_field.setdefault(rule["field"], {}).setdefault(kw, []).append(rule["id"])
+        self._matchers: Dict[str, Tuple[re.Pattern, Dict[str, List[str]], Dict[str, List[str]]]] = {}
+        for field, kw_rules in by_field.items():
+            keywords = sorted(kw_rules, key=len, reverse=True)
+            pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in keywords) + "))")
+            prefixes = {k: [p for p in keywords if p != k and k.startswith(p)] for k in keywords}
+            self._matchers[field] = (pattern, kw_rules, prefixes)
+
+    def match(self, inputs: Dict[str, str]) -> Dict[str, List[str]]:
+        """返回 {rule_id: [命中的关键词]}，关键词按规则表中的顺序排列。"""
+        found: Dict[str, set] = {}
+        for field, (pattern, kw_rules, prefixes) in self._matchers.items():
+            text = inputs.get(field) or ""
+            if not text:
+                continue
+            for m in pattern.finditer(text):
+                kw = m.group(1)
+                for hit in [kw] + prefixes[kw]:
+                    for rule_id in kw_rules[hit]:
+                        found.setdefault(rule_id, set()).add(hit)
+        return {r["id"]: [k for k in r["keywords"] if k in found[r["id"]]] for r in self.rules if r["id"] in found}
+
+_rule_engine = RuleEngine(DIAGNOSE_RULES)
+
+def set_diagnose_rules(rules: List[Dict[str, Any]]):
+    """热替换诊断规则：先编译新规则，成功后整体替换（进行中的调用仍使用旧规则）。"""
+    global _rule_engine
+    _rule_engine = RuleEngine(rules)
+
+def diagnose_rules() -> Tuple[str, List[Dict[str, Any]]]:
+    """当前规则表的 (version, rules)，随任务发给子进程。"""
+    engine = _rule_engine
+    return engine.version, engine.rules
+
+def sync_diagnose_rules(version: str, rules: List[Dict[str, Any]]):
+    """子进程侧：版本与本进程不同时才重新编译规则表。"""
+    if _rule_engine.version != version:
+        set_diagnose_rules(rules)
+
+def load_diagnose_rules(path: str):
+    """从 JSON 文件加载规则表（格式同 DIAGNOSE_RULES）。"""
+    with open(path, "r", encoding="utf-8") as f:
+        set_diagnose_rules(json.load(f))
+
+if os.getenv("DIAGNOSE_RULES_PATH"):
+    load_diagnose_rules(os.environ["DIAGNOSE_RULES_PATH"])
 
 # ---------- diagnosis ----------
 def diagnose_client(inp: Dict[str, Any]) -> Dict[str, Any]:
@@ -24,36 +108,23 @@ def diagnose_client(inp: Dict[str, Any]) -> Dict[str, Any]:
     goal = _norm(inp.get("target_goal",""))
     constraints = _norm(inp.get("constraints",""))
 
-    # 问题类型粗分
+    # 问题类型粗分 / 紧急度粗估 / 可控性（能否通过研究+表达/产品改动影响），均由规则表一次扫描得出
+    engine = _rule_engine
+    rule_hits = engine.match({"core_problem": problem, "constraints": constraints, "target_goal": goal})
     problem_types = []
-    if _contains_any(problem, ["转化", "CVR", "加购", "弃购", "漏斗", "下单", "支付"]):
-        problem_types.append("漏斗转化折损")
-    if _contains_any(problem, ["品牌", "信任", "公信", "口碑", "声誉", "安全", "合规"]):
-        problem_types.append("信任与风险")
-    if _contains_any(problem, ["价格", "贵", "不值", "促销", "折扣", "性价比"]):
-        problem_types.append("价格与价值锚点")
-    if _contains_any(problem, ["复购", "留存", "退款", "退货", "满意度", "售后"]):
-        problem_types.append("复购与履约体验")
-    if _contains_any(problem, ["内容", "素材", "文案", "卖点", "表达", "种草"]):
-        problem_types.append("表达与说服力")
-    if not problem_types:
-        problem_types = ["问题类型待澄清（建议补充漏斗数据或典型案例）"]
-
-    # 紧急度粗估（可解释）
     urgent = "中"
-    if _contains_any(problem, ["暴跌", "大幅", "腰斩", "连续", "极低", "投放烧钱"]):
-        urgent = "高"
-    if _contains_any(constraints, ["尽快", "两周", "本月", "马上"]):
-        urgent = "高"
-    if _contains_any(goal, ["首单", "获客", "线索", "转化"]):
-        urgent = "中-高"
-
-    # 可控性（能否通过研究+表达/产品改动影响）
     controllable = "中"
-    if _contains_any(problem, ["供应链", "缺货", "交付", "物流", "监管"]):
-        controllable = "低-中"
-    if _contains_any(problem, ["落地页", "详情页", "素材", "文案", "卖点"]):
-        controllable = "高"
+    for rule in engine.rules:
+        if rule["id"] not in rule_hits:
+            continue
+        if rule["group"] == "problem_type":
+            problem_types.append(rule["value"])
+        elif rule["group"] == "urgency":
+            urgent = rule["value"]
+        elif rule["group"] == "controllability":
+            controllable = rule["value"]
+    if not problem_types:
+        problem_types = ["问题类型待澄清（建议补充漏斗数据或典型案例）"]
 
     # 推荐研究组合（先快后深 / 先漏斗再研究）
     research_route = []
@@ -90,6 +161,7 @@ def diagnose_client(inp: Dict[str, Any]) -> Dict[str, Any]:
         "controllability": controllable,
         "recommended_route": research_route,
         "deliverable_focus": deliver_focus,
+        "rule_hits": rule_hits,
         "notes": "本诊断使用可解释规则生成，后续可在不改变接口的情况下替换为更复杂的打分/模型。"
     }
 
@@ -290,6 +362,17 @@ def generate_quant_survey(inp: Dict[str, Any]) -> Dict[str, Any]:
         }
     }
 
+# ---------- cache keys ----------
+# 上面三个生成器的输出只取决于以下归一化字段，API 以此为键缓存序列化结果；生成器读取的字段变化时需同步修改
+def b2b_questions_key(inp: Dict[str, Any]) -> Tuple:
+    return (tuple(inp.get("growth_driver",[]) or []), _norm(inp.get("target_goal","")), _norm(inp.get("industry","")))
+
+def qual_guide_key(inp: Dict[str, Any]) -> Tuple:
+    return (_norm(inp.get("target_goal","")), _norm(inp.get("core_problem","")))
+
+def quant_survey_key(inp: Dict[str, Any]) -> Tuple:
+    return (_norm(inp.get("target_goal","")),)
+
 # ---------- Text2SQL templates (white-list) ----------
 def sql_metric_templates() -> List[Dict[str, Any]]:
     """
@@ -1,43 +1,132 @@
+import threading
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from ..core.evermem_client import memory_os
 
+# 假设主题 -> 访谈内容中出现即视为触及该假设的关键词
+HYPOTHESIS_TOPICS = {"speed": ("speed",)}
+DEFAULT_TOPIC = "speed"
+# REAL 模式下每次查询额外召回的证伪决策条数上限
+FALSIFIED_RECALL_LIMIT = 50
+
+# 证伪标记类标签，不属于上下文
+_MARKER_PREFIXES = ("FALSIFIED:", "hypothesis:", "type:")
+
+def _topics_in(text: str) -> List[str]:
+    text = text.lower()
+    return [topic for topic, keywords in HYPOTHESIS_TOPICS.items() if any(k in text for k in keywords)]
+
+class FalsificationIndex:
+    """
+    (上下文标签, 假设主题) -> 证伪该假设的 Decision id 列表。
+    与按标签召回的语义一致：决策的上下文标签包含查询的全部上下文标签即命中。
+    按 (tag, 主题) 建 posting list，查询时从最短的一条出发做子集过滤（同 TagIndex）。
+    metrics 轮给出 FALSIFY 时写入；首次使用时从 Memory 中已有的 FALSIFIED:true 决策补齐。
+    索引是进程内的：REAL 模式下每次查询另按上下文召回最近 FALSIFIED_RECALL_LIMIT 条证伪决策，
+    以纳入其他 worker/实例写入的证伪。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._postings: Dict[Tuple[Optional[str], str], List[str]] = {}
+        self._contexts: Dict[str, frozenset] = {}
+        self._recorded = set()
+        self._loaded = False
+
+    def record(self, context_tags: Dict[str, str], topic: str, decision_id: str):
+        context = frozenset(f"{k}:{v}" for k, v in context_tags.items())
+        with self._lock:
+            if (decision_id, topic) in self._recorded:
+                return
+            self._recorded.add((decision_id, topic))
+            self._contexts[decision_id] = context
+            for tag in [None, *context]:
+                self._postings.setdefault((tag, topic), []).append(decision_id)
+
+    def lookup(self, context_tags: Dict[str, str], topic: str) -> List[str]:
+        self._ensure_loaded()
+        if not memory_os.is_mock:
+            query = {**context_tags, "type": "decision", "FALSIFIED": "true"}
+            self._absorb(memory_os.recall_by_tags(query, limit=FALSIFIED_RECALL_LIMIT))
+        query = frozenset(f"{k}:{v}" for k, v in context_tags.items())
+        with self._lock:
+            postings = [self._postings.get((tag, topic), []) for tag in query] or [self._postings.get((None, topic), [])]
+            smallest = min(postings, key=len)
+            return [d for d in smallest if query <= self._contexts[d]]
+
+    def _absorb(self, cells: List[Dict[str, Any]]):
+        for cell in cells:
+            tags = cell.get('tags') or []
+            context = dict(t.split(":", 1) for t in tags if ":" in t and not t.startswith(_MARKER_PREFIXES))
+            topics = [t.split(":", 1)[1] for t in tags if t.startswith("hypothesis:")]
+            if not topics:
+                # 旧数据没有 hypothesis 标签，按 rationale 推断主题
+                topics = _topics_in(str((cell.get('data') or {}).get('rationale', ''))) or [DEFAULT_TOPIC]
+            for topic in topics:
+                self.record(context, topic, cell['id'])
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self._absorb(reversed(memory_os.recall_by_tags({"type": "decision", "FALSIFIED": "true"})))
+            self._loaded = True
+
+    def reset(self):
+        with self._load_lock, self._lock:
+            self._postings.clear()
+            self._contexts.clear()
+            self._recorded.clear()
+            self._loaded = False
+
+falsification_index = FalsificationIndex()
+
 class DecisionService:
     @staticmethod
     def run_evolution_round(input_type: str, content: Any, context_tags: Dict[str, str]) -> Dict[str, Any]:
-        history = memory_os.recall_by_tags({**context_tags, "type": "decision"})
-        falsified_decisions = [c for c in history if "FALSIFIED:true" in (c.get('tags') or [])]
-
         if input_type == "interview":
-            is_conflict = False
-            if "speed" in str(content).lower():
-                for d in falsified_decisions:
-                    rationale = str(d.get('data', {}).get('rationale', ''))
-                    if "speed" in rationale.lower() or "hypothesis" in rationale.lower():
-                        is_conflict = True
-                        break
-
-            if is_conflict:
+            # 直接按 (上下文, 主题) 查证伪索引，命中的决策 id 作为援引
+            conflicts = []
+            for topic in _topics_in(str(content)):
+                conflicts += falsification_index.lookup(context_tags, topic)
+
+            if conflicts:
                 decision_logic = "Conflict Detected: Rejected reverting to speed-focus; maintained quality-focus due to previous falsification."
             else:
                 decision_logic = "Initial requirement generation based on interview."
 
-            ev_id = memory_os.commit_cell("Evidence", {"summary": content, "source_type": "Interview"}, context_tags)
-            dec_id = memory_os.commit_cell("Decision", {"rationale": decision_logic, "decision_type": "Requirement_Gen"}, context_tags, citations=[ev_id])
-            req_id = memory_os.commit_cell("Requirement", {"scope_summary": "PRD Content", "version": "v1.0"}, context_tags, citations=[dec_id])
+            # 本地预分配 id，三个 cell 相互援引后一次批量提交
+            ev_id = memory_os.new_cell_id()
+            dec_id = memory_os.new_cell_id()
+            req_id = memory_os.new_cell_id()
+            memory_os.commit_cells([
+                {"cell_type": "Evidence", "cell_id": ev_id, "data": {"summary": content, "source_type": "Interview"}, "tags": context_tags},
+                {"cell_type": "Decision", "cell_id": dec_id, "data": {"rationale": decision_logic, "decision_type": "Requirement_Gen"}, "tags": context_tags, "citations": [ev_id] + conflicts},
+                {"cell_type": "Requirement", "cell_id": req_id, "data": {"scope_summary": "PRD Content", "version": "v1.0"}, "tags": context_tags, "citations": [dec_id]},
+            ])
 
-            return {"req_id": req_id, "dec_id": dec_id, "ev_id": ev_id, "logic": decision_logic}
+            return {"req_id": req_id, "dec_id": dec_id, "ev_id": ev_id, "logic": decision_logic, "conflicts": conflicts}
 
         elif input_type == "metrics":
             cvr = content.get("cvr", 0) if isinstance(content, dict) else 0
+            topic = content.get("hypothesis", DEFAULT_TOPIC) if isinstance(content, dict) else DEFAULT_TOPIC
             verdict = "FALSIFY" if cvr < 0.02 else "SUPPORT"
 
-            out_id = memory_os.commit_cell("Outcome", {"metrics_delta": content, "verdict": verdict}, context_tags)
             dec_tags = {**context_tags}
             if verdict == "FALSIFY":
                 dec_tags["FALSIFIED"] = "true"
+                dec_tags["hypothesis"] = topic
 
-            dec_id = memory_os.commit_cell("Decision", {"rationale": f"Metrics {verdict} previous speed hypothesis.", "decision_type": "Evolution"}, dec_tags, citations=[out_id])
+            out_id = memory_os.new_cell_id()
+            dec_id = memory_os.new_cell_id()
+            memory_os.commit_cells([
+                {"cell_type": "Outcome", "cell_id": out_id, "data": {"metrics_delta": content, "verdict": verdict}, "tags": context_tags},
+                {"cell_type": "Decision", "cell_id": dec_id, "data": {"rationale": f"Metrics {verdict} previous {topic} hypothesis.", "decision_type": "Evolution"}, "tags": dec_tags, "citations": [out_id]},
+            ])
+            if verdict == "FALSIFY":
+                falsification_index.record(context_tags, topic, dec_id)
 
             return {"dec_id": dec_id, "out_id": out_id, "verdict": verdict}
 
@@ -0,0 +1,107 @@
+"""
+Cell payload codec benchmark: size and encode/decode cost per encoding, plus the
+effect of lazy decoding on a recall that only touches ids/tags.
+
+Cells mimic what DecisionService and the API commit: interview Evidence with
+snippets and claims, Decision rationales with citations, Trace cells with
+full diagnose inputs/outputs.
+
+    python benchmarks/bench_cell_codec.py --cells 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.core import codec
+from backend.core.evermem_client import EverMemClient
+from backend.logic import diagnose_client
+
+
+def make_cells(n, seed=3):
+    rng = random.Random(seed)
+    problems = ["详情页转化大幅下滑，加购后弃购增多", "复购率低，退款率上升", "投放烧钱但首单转化极低", "用户不信任品牌，口碑一般"]
+    for i in range(n):
+        kind = i % 3
+        if kind == 0:
+            yield "Evidence", {
+                "summary": f"访谈 #{i}: 用户在结账页因运费与到货时间不明确而放弃，提到 speed 与 quality 的取舍。",
+                "source_type": "Interview",
+                "atomic_claims": [f"claim {i}-{k}: 价格锚点不清晰" for k in range(rng.randint(2, 6))],
+                "snippets": [f"“我当时就差一步了，但是看到运费 {rng.randint(5, 30)} 元就关掉了。”" for _ in range(rng.randint(1, 4))],
+                "confidence": round(rng.random(), 3),
+            }
+        elif kind == 1:
+            yield "Decision", {
+                "rationale": "Conflict Detected: Rejected reverting to speed-focus; maintained quality-focus due to previous falsification.",
+                "decision_type": rng.choice(["Requirement_Gen", "Evolution"]),
+                "tradeoffs": "短期转化 vs 长期复购",
+            }
+        else:
+            inp = {"company_stage": "1-10", "growth_driver": ["Marketing"], "biz_positioning": "核心业务",
+                   "core_problem": rng.choice(problems), "target_goal": "首单转化", "constraints": "两周内上线"}
+            yield "Trace", {"step_name": "diagnose", "input_data": inp, "output_data": diagnose_client(inp), "score": rng.random()}
+
+
+def bench_encoding(encoding, cells):
+    t0 = time.perf_counter()
+    encoded = [codec.encode(data, encoding)[1] for _, data in cells]
+    encode_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for content in encoded:
+        codec.decode(encoding, content)
+    decode_s = time.perf_counter() - t0
+    # 本地存储保存的是原始字节（二进制编码不经 base64）
+    size = sum(len(codec.raw(encoding, c)) for c in encoded)
+    return {
+        "payload_bytes": size,
+        "avg_payload_bytes": round(size / len(cells), 1),
+        "encode_us_per_cell": round(encode_s / len(cells) * 1e6, 2),
+        "decode_us_per_cell": round(decode_s / len(cells) * 1e6, 2),
+    }
+
+
+def bench_recall(encoding, cells):
+    mem = EverMemClient(base_url=None, encoding=encoding)
+    mem.commit_cells([{"cell_type": t, "data": d, "tags": {"domain": "bench"}} for t, d in cells])
+
+    def timed(touch_data):
+        mem._local.drop_hot()
+        t0 = time.perf_counter()
+        hits = mem.recall_by_tags({"domain": "bench"})
+        if touch_data:
+            for h in hits:
+                h["data"]
+        else:
+            for h in hits:
+                h["id"], h["tags"]
+        return round((time.perf_counter() - t0) * 1000, 2)
+
+    return {"recall_ids_only_ms": timed(False), "recall_with_data_ms": timed(True)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cells", type=int, default=5000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    cells = list(make_cells(args.cells))
+    results = {"params": vars(args), "encodings": {}}
+    for encoding in codec.available_codecs():
+        results["encodings"][encoding] = {**bench_encoding(encoding, cells), **bench_recall(encoding, cells)}
+    if "msgpack" not in results["encodings"]:
+        results["note"] = "msgpack not installed; pip install -r requirements.txt to include the binary encoding"
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
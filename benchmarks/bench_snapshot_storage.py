@@ -0,0 +1,136 @@
+"""
+Snapshot storage benchmark: full-copy layout (legacy) vs delta + checkpoint layout.
+
+Simulates iterative PRD evolution (a few lines change per version) and reports
+bytes written, on-disk size and read latency for both layouts.
+
+    python benchmarks/bench_snapshot_storage.py --versions 200 --lines 300
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.core import database, snapshot_store
+
+
+def evolve(versions, lines, edits, seed=7):
+    rng = random.Random(seed)
+    prd = [f"- [REQ-{i:04d}] 用户在结账页需要看到明确的退换保障与到货时间（v0）" for i in range(lines)]
+    persona = {"segment": "差点买但没买", "pain_points": [f"pain {i}" for i in range(20)]}
+    hypotheses = [{"id": f"H{i}", "text": f"hypothesis {i}", "status": "open"} for i in range(15)]
+    parent = None
+    for v in range(versions):
+        for _ in range(edits):
+            i = rng.randrange(lines)
+            prd[i] = f"- [REQ-{i:04d}] 调整后的需求描述，引用证据 ev_{v}_{i}（v{v}）"
+        hypotheses[rng.randrange(len(hypotheses))]["status"] = rng.choice(["open", "supported", "falsified"])
+        yield {
+            "version_id": f"v{v:05d}", "parent_version_id": parent, "iteration_count": v,
+            "persona": json.loads(json.dumps(persona)), "hypotheses": json.loads(json.dumps(hypotheses)),
+            "prd_markdown": "\n".join(prd),
+        }
+        parent = f"v{v:05d}"
+
+
+def bench_full_copy(path, snapshots):
+    conn = database.sqlite3.connect(path)
+    conn.execute("CREATE TABLE requirement_snapshots (version_id TEXT PRIMARY KEY, parent_version_id TEXT, "
+                 "persona_json TEXT, hypotheses_json TEXT, prd_markdown TEXT, iteration_count INTEGER, timestamp DATETIME)")
+    written = 0
+    t0 = time.perf_counter()
+    for s in snapshots:
+        row = (s['version_id'], s['parent_version_id'], json.dumps(s['persona']), json.dumps(s['hypotheses']),
+               s['prd_markdown'], s['iteration_count'], "")
+        written += sum(len(str(c).encode("utf-8")) for c in row[2:5])
+        with conn:
+            conn.execute("INSERT INTO requirement_snapshots VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+    write_s = time.perf_counter() - t0
+
+    def read(version_id):
+        r = conn.execute("SELECT persona_json, hypotheses_json, prd_markdown FROM requirement_snapshots WHERE version_id = ?",
+                         (version_id,)).fetchone()
+        return json.loads(r[0]), json.loads(r[1]), r[2]
+    return written, write_s, read, conn
+
+
+def bench_delta(path, snapshots):
+    database.DB_PATH = path
+    database.init_db()
+    conn = database.get_connection()
+    written = 0
+    t0 = time.perf_counter()
+    for s in snapshots:
+        with database.transaction() as c:
+            c.execute("INSERT INTO requirement_snapshots (version_id, parent_version_id, iteration_count, timestamp) VALUES (?, ?, ?, ?)",
+                      (s['version_id'], s['parent_version_id'], s['iteration_count'], ""))
+            written += snapshot_store.write_doc(c, path, s['version_id'], s['parent_version_id'], s)
+        snapshot_store.cache_doc(path, s['version_id'], s)
+    write_s = time.perf_counter() - t0
+
+    def read(version_id):
+        return snapshot_store.read_doc(conn, path, version_id)
+    return written, write_s, read, conn
+
+
+def time_reads(read, ids, clear):
+    samples = []
+    for vid in ids:
+        if clear:
+            snapshot_store.clear_cache()
+        t0 = time.perf_counter()
+        read(vid)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {"p50_ms": round(samples[len(samples) // 2], 4), "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--versions", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--edits", type=int, default=3, help="changed PRD lines per version")
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    snapshots = list(evolve(args.versions, args.lines, args.edits))
+    rng = random.Random(11)
+    ids = [rng.choice(snapshots)['version_id'] for _ in range(args.reads)]
+    head = snapshots[-1]['version_id']
+    results = {"params": vars(args), "checkpoint_interval": snapshot_store.CHECKPOINT_INTERVAL}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in (("full_copy", bench_full_copy), ("delta", bench_delta)):
+            path = os.path.join(tmp, f"{name}.db")
+            snapshot_store.clear_cache()
+            written, write_s, read, conn = fn(path, snapshots)
+            if name == "delta":
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            results[name] = {
+                "bytes_written": written,
+                "db_file_bytes": os.path.getsize(path),
+                "write_s": round(write_s, 4),
+                "read_random_cold": time_reads(read, ids, clear=True),
+                "read_head_warm": time_reads(read, [head] * args.reads, clear=False),
+            }
+            if name == "delta":
+                database.close_connection()
+            else:
+                conn.close()
+
+    ratio = results["full_copy"]["bytes_written"] / max(results["delta"]["bytes_written"], 1)
+    results["bytes_written_ratio"] = round(ratio, 2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Async load generator for the Decision Memory API (backend/api/main.py).
+
+A fixed number of concurrent virtual users run a weighted mix of
+
+    evidence   POST /api/v1/evidence
+    decision   POST /api/v1/decision          (cites recently created evidence)
+    search     GET  /api/v1/evidence/search   (tag filter, limit 50)
+    graph      GET  /api/v1/trace_graph       (poller with since_version/epoch + If-None-Match)
+
+for --duration seconds and report per-operation throughput, error counts and
+p50/p95/p99/max latency. --spawn starts a local EverMem stub
+(scripts/evermem_stub.py) and the API under uvicorn so the whole REAL-mode
+path can be exercised on a laptop or in CI:
+
+    python benchmarks/load_api.py --spawn --api-workers 2 --stub-latency-ms 20 --stub-error-rate 0.02
+    python benchmarks/load_api.py --api http://127.0.0.1:8000 --concurrency 64 --mix evidence=30,search=50,graph=20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_MIX = "evidence=35,decision=15,search=35,graph=15"
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("evidence", "decision", "search", "graph"):
+            raise ValueError(f"unknown operation {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def record(self, op, elapsed, status):
+        self.samples.setdefault(op, []).append(elapsed * 1000)
+        self.statuses.setdefault(op, {}).setdefault(str(status), 0)
+        self.statuses[op][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def summary(self, wall_s):
+        def pct(samples, p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+
+        out = {}
+        total = 0
+        for op, samples in sorted(self.samples.items()):
+            samples.sort()
+            total += len(samples)
+            out[op] = {"requests": len(samples), "errors": self.errors.get(op, 0),
+                       "rps": round(len(samples) / wall_s, 1), "p50_ms": pct(samples, 0.50),
+                       "p95_ms": pct(samples, 0.95), "p99_ms": pct(samples, 0.99),
+                       "max_ms": round(samples[-1], 2), "statuses": self.statuses[op]}
+        return {"total_requests": total, "total_rps": round(total / wall_s, 1),
+                "errors": sum(self.errors.values()), "operations": out}
+
+
+class VirtualUser:
+    def __init__(self, client, recorder, rng, evidence_ids):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.evidence_ids = evidence_ids
+        self.graph_version = None
+        self.graph_epoch = None
+        self.graph_etag = None
+
+    async def call(self, op, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+            status = resp.status_code
+        except httpx.HTTPError as e:
+            resp, status = None, type(e).__name__
+        self.recorder.record(op, time.perf_counter() - start, status)
+        return resp
+
+    async def evidence(self):
+        body = {"source_type": "Interview", "summary": f"load test evidence {self.rng.random():.6f}",
+                "atomic_claims": ["users hesitate at checkout"], "snippets": ["运费看不清楚"], "confidence": 0.8}
+        resp = await self.call("evidence", "POST", "/api/v1/evidence", json=body)
+        if resp is not None and resp.status_code == 200:
+            self.evidence_ids.append(resp.json()["evidence_id"])
+
+    async def decision(self):
+        if not self.evidence_ids:
+            return await self.evidence()
+        citations = self.rng.sample(list(self.evidence_ids), min(2, len(self.evidence_ids)))
+        body = {"decision_type": "Evolution", "rationale": "load test decision", "citations": citations}
+        await self.call("decision", "POST", "/api/v1/decision", json=body)
+
+    async def search(self):
+        await self.call("search", "GET", "/api/v1/evidence/search",
+                        params={"tags": "domain:enterprise", "limit": 50})
+
+    async def graph(self):
+        params = {"since_version": self.graph_version, "epoch": self.graph_epoch} if self.graph_version is not None else {}
+        headers = {"If-None-Match": self.graph_etag} if self.graph_etag else {}
+        resp = await self.call("graph", "GET", "/api/v1/trace_graph", params=params, headers=headers)
+        if resp is not None and resp.status_code == 200:
+            body = resp.json()
+            self.graph_version, self.graph_epoch = body.get("version"), body.get("epoch")
+            self.graph_etag = resp.headers.get("ETag")
+
+
+async def run_load(api, api_key, concurrency, duration, mix, seed=0, timeout=10.0):
+    recorder = Recorder()
+    evidence_ids = deque(maxlen=500)
+    ops, weights = zip(*mix.items())
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=api, headers={"X-API-Key": api_key}, timeout=timeout, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(i):
+            rng = random.Random(seed * 1000 + i)
+            user = VirtualUser(client, recorder, rng, evidence_ids)
+            while time.perf_counter() < deadline:
+                await getattr(user, rng.choices(ops, weights)[0])()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+    return recorder.summary(wall)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+@contextmanager
+def spawned_stack(args):
+    """启动 EverMem 替身与 API（REAL 模式，数据库放在临时目录），退出时关闭。"""
+    procs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            stub_port, api_port = free_port(), free_port()
+            # 降级告警每次请求都会记一条，压测时只保留 error 级日志
+            env = {**os.environ, "API_KEY": args.api_key, "LOG_LEVEL": "ERROR"}
+            procs.append(subprocess.Popen([
+                sys.executable, os.path.join(ROOT, "scripts", "evermem_stub.py"), "--port", str(stub_port),
+                "--latency-ms", str(args.stub_latency_ms), "--jitter-ms", str(args.stub_jitter_ms),
+                "--error-rate", str(args.stub_error_rate), "--seed", str(args.seed),
+            ] + (["--max-cells", str(args.stub_max_cells)] if args.stub_max_cells else []), env=env))
+            stub_url = f"http://127.0.0.1:{stub_port}"
+            wait_ready(f"{stub_url}/stub/stats")
+
+            procs.append(subprocess.Popen([
+                sys.executable, "-m", "uvicorn", "backend.api.main:app", "--app-dir", ROOT, "--host", "127.0.0.1",
+                "--port", str(api_port), "--workers", str(args.api_workers), "--log-level", "warning",
+            ], cwd=tmp, env={**env, "EVERMEM_URL": stub_url}))
+            api_url = f"http://127.0.0.1:{api_port}"
+            wait_ready(f"{api_url}/health")
+            yield api_url, stub_url
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                try:
+                    proc.wait(10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://127.0.0.1:8000", help="API base URL (ignored with --spawn)")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", "admin123"))
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operation mix")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--spawn", action="store_true", help="start a local EverMem stub and the API under uvicorn")
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--stub-latency-ms", type=float, default=10.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-max-cells", type=int, default=None)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    params = {k: v for k, v in vars(args).items() if k != "api_key"}
+    if args.spawn:
+        with spawned_stack(args) as (api_url, stub_url):
+            results = asyncio.run(run_load(api_url, args.api_key, args.concurrency, args.duration, mix, args.seed))
+            results["stub"] = httpx.get(f"{stub_url}/stub/stats").json()
+            results["api_health"] = httpx.get(f"{api_url}/health").json()
+    else:
+        results = asyncio.run(run_load(args.api, args.api_key, args.concurrency, args.duration, mix, args.seed))
+    results = {"params": params, **results}
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Performance benchmark suite for the memory, persistence and rule paths.
+
+For each dataset size the suite seeds a fresh in-memory EverMem client and a
+temporary SQLite database with N cells / N traces, then measures:
+
+    recall_by_tags        tag-intersection recall, limit 100
+    trace_graph_full      full citation-graph snapshot (what /api/v1/trace_graph serves)
+    trace_graph_delta     delta snapshot since the previous poll
+    save_trace            single trace insert (+ outbox enqueue)
+    get_all_traces        full trace listing
+    list_traces_page      first page of the keyset-paginated listing
+    run_evolution_round   interview round incl. falsification lookup and batch commit
+    diagnose_client       rule-engine diagnosis
+
+Each path reports p50/p95/p99 latency, throughput and tracemalloc peak.
+Results are written as JSON; --baseline compares p95 against an earlier run
+and exits non-zero when any path regresses beyond --max-regression.
+
+    python benchmarks/run_suite.py --sizes 1000,10000 --json bench.json
+    python benchmarks/run_suite.py --sizes 1000,10000 --baseline bench.json --max-regression 0.3
+    python benchmarks/run_suite.py --sizes 100000 --paths recall_by_tags,get_all_traces
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.core import database, snapshot_store
+from backend.core.evermem_client import EverMemClient
+from backend.logic import diagnose_client
+from backend.services import decision_service as decision_module
+
+DOMAINS = [f"d{i}" for i in range(20)]
+STEPS = ["diagnose", "plan", "interview", "metrics"]
+PROBLEMS = ["详情页转化大幅下滑，加购后弃购增多", "复购率低，退款率上升", "投放烧钱但首单转化极低", "用户不信任品牌，口碑一般"]
+
+
+def quiet():
+    # 播种大量数据时屏蔽标准输出，避免淹没基准结果
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def seed_memory(n, rng):
+    mem = EverMemClient(base_url=None)
+    specs = []
+    types = ["Evidence", "Decision", "Requirement", "Outcome", "Trace"]
+    prev = None
+    for i in range(n):
+        cell_type = types[i % len(types)]
+        cell_id = f"{cell_type.lower()}_{i:08d}"
+        data = {"summary": f"cell {i}: {rng.choice(PROBLEMS)}", "rationale": "seeded"}
+        specs.append({"cell_type": cell_type, "cell_id": cell_id, "data": data,
+                      "tags": {"domain": rng.choice(DOMAINS), "stage": rng.choice(["0-1", "1-10", "10-100"])},
+                      "citations": [prev] if prev and cell_type in ("Decision", "Requirement") else [],
+                      "timestamp": f"2026-01-01T00:00:00.{i:06d}" if i < 10 ** 6 else None})
+        prev = cell_id
+    with quiet():
+        for start in range(0, n, 1000):
+            mem.commit_cells(specs[start:start + 1000])
+    return mem
+
+
+def make_trace(i, rng):
+    inp = {"core_problem": rng.choice(PROBLEMS), "target_goal": "首单转化"}
+    return {"trace_id": f"t{i:08d}", "step_name": rng.choice(STEPS), "input_data": inp,
+            "output_data": {"problem_types": ["漏斗转化折损"]}, "status": rng.choice(["ok", "ok", "ok", "error"]),
+            "score": round(rng.random(), 3)}
+
+
+def seed_database(path, n, rng):
+    database.DB_PATH = path
+    snapshot_store.clear_cache()
+    database.init_db()
+    for start in range(0, n, 1000):
+        database.save_traces_bulk([make_trace(i, rng) for i in range(start, min(n, start + 1000))])
+
+
+def measure(fn, iterations, warmup=3, memory_iterations=5):
+    for _ in range(min(warmup, iterations)):
+        fn()
+    samples = []
+    t_total = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - t_total
+    samples.sort()
+
+    tracemalloc.start()
+    for _ in range(min(memory_iterations, iterations)):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    def pct(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 4)
+    return {"iterations": iterations, "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+            "max_ms": round(samples[-1], 4), "ops_per_s": round(iterations / elapsed, 1),
+            "peak_kb": round(peak / 1024, 1)}
+
+
+def build_paths(n, mem, rng):
+    # 传给各路径的可变状态（轮询版本号、写入序号）
+    state = {"version": mem.get_graph().version, "trace_seq": n}
+
+    def recall():
+        mem.recall_by_tags({"domain": rng.choice(DOMAINS), "type": "evidence"}, limit=100)
+
+    def graph_full():
+        mem.get_graph().snapshot()
+
+    def graph_delta():
+        with quiet():
+            mem.commit_cell("Evidence", {"summary": "poll"}, {"domain": "poll"})
+        graph = mem.get_graph()
+        snap = graph.snapshot(state["version"], graph.epoch)
+        state["version"] = snap["version"]
+
+    def save_trace():
+        state["trace_seq"] += 1
+        database.save_trace(make_trace(state["trace_seq"], rng))
+
+    def all_traces():
+        database.get_all_traces()
+
+    def traces_page():
+        database.list_traces(limit=100)
+
+    def evolution():
+        with quiet():
+            decision_module.decision_service.run_evolution_round(
+                "interview", "Users want speed and cheaper shipping.", {"domain": rng.choice(DOMAINS), "stage": "1-10"})
+
+    def diagnose():
+        diagnose_client({"company_stage": "1-10", "growth_driver": ["Marketing"], "core_problem": rng.choice(PROBLEMS),
+                         "target_goal": "首单转化", "constraints": "两周内上线"})
+
+    return {
+        "recall_by_tags": recall,
+        "trace_graph_full": graph_full,
+        "trace_graph_delta": graph_delta,
+        "save_trace": save_trace,
+        "get_all_traces": all_traces,
+        "list_traces_page": traces_page,
+        "run_evolution_round": evolution,
+        "diagnose_client": diagnose,
+    }
+
+
+def iterations_for(path, n, base):
+    # 全量路径随规模线性增长，按规模减少迭代次数，保证 100k 下也能在合理时间内跑完
+    if path in ("get_all_traces", "trace_graph_full"):
+        return max(5, min(base, base * 1000 // n))
+    return base
+
+
+def run_size(n, iterations, only, tmp):
+    rng = random.Random(n)
+    t0 = time.perf_counter()
+    mem = seed_memory(n, rng)
+    seed_database(os.path.join(tmp, f"bench_{n}.db"), n, rng)
+    seed_s = time.perf_counter() - t0
+
+    # run_evolution_round 与 /api/v1/trace_graph 使用全局客户端，这里换成已播种的实例
+    decision_module.memory_os = mem
+    decision_module.falsification_index.reset()
+    results = {"seed_s": round(seed_s, 2)}
+    for name, fn in build_paths(n, mem, rng).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(fn, iterations_for(name, n, iterations))
+        print(f"[bench] n={n} {name}: p95={results[name]['p95_ms']}ms ops/s={results[name]['ops_per_s']}", file=sys.stderr)
+    database.close_connection()
+    mem._local.close()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(results, baseline, max_regression, min_delta_ms):
+    """返回超过阈值的回归列表（按 p95 比较；绝对差小于 min_delta_ms 的抖动忽略）。"""
+    regressions = []
+    for size, paths in results["results"].items():
+        base_paths = baseline.get("results", {}).get(size, {})
+        for name, stats in paths.items():
+            base = base_paths.get(name)
+            if not isinstance(stats, dict) or not isinstance(base, dict):
+                continue
+            old, new = base["p95_ms"], stats["p95_ms"]
+            if new - old > min_delta_ms and new > old * (1 + max_regression):
+                regressions.append({"size": size, "path": name, "baseline_p95_ms": old, "p95_ms": new,
+                                    "ratio": round(new / old, 2) if old else None})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated dataset sizes, e.g. 1000,10000,100000")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--paths", help="comma-separated subset of paths to run")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed p95 slowdown vs baseline (0.25 = +25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore p95 differences smaller than this")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = set(args.paths.split(",")) if args.paths else None
+    results = {
+        "meta": {"timestamp": datetime.now().isoformat(), "git": git_revision(), "python": platform.python_version(),
+                 "platform": platform.platform(), "iterations": args.iterations},
+        "results": {},
+    }
+    original_db, original_mem = database.DB_PATH, decision_module.memory_os
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for n in sizes:
+                results["results"][str(n)] = run_size(n, args.iterations, only, tmp)
+    finally:
+        database.DB_PATH, decision_module.memory_os = original_db, original_mem
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression, args.min_delta_ms)
+        results["regressions"] = regressions
+        for r in regressions:
+            print(f"[bench] REGRESSION n={r['size']} {r['path']}: p95 {r['baseline_p95_ms']}ms -> {r['p95_ms']}ms",
+                  file=sys.stderr)
+        status = 1 if regressions else 0
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
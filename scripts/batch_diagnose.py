@@ -0,0 +1,46 @@
+"""
+批量诊断+研究计划（离线 CLI）：输入 JSONL（每行一个 DiagnoseIn），输出 JSONL（与 /api/batch/diagnose_plan 相同格式）。
+
+    python scripts/batch_diagnose.py leads.jsonl -o results.jsonl --workers 8
+    cat leads.jsonl | python scripts/batch_diagnose.py > results.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.batch import run_batch, BATCH_CHUNK_SIZE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", default="-", help="输入 JSONL 文件，- 表示标准输入")
+    parser.add_argument("-o", "--output", default="-", help="输出 JSONL 文件，- 表示标准输出")
+    parser.add_argument("--timeline", default="2-4周")
+    parser.add_argument("--budget-level", default="中")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数；0 表示单进程")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    src = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    total = failed = 0
+    try:
+        for line in run_batch(src, timeline=args.timeline, budget_level=args.budget_level,
+                              workers=args.workers, chunk_size=args.chunk_size):
+            total += 1
+            failed += not json.loads(line)["ok"]
+            dst.write(line + "\n")
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    print(f"[batch] {total} records, {failed} failed", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+本地 EverMem 替身服务：实现 /commit、/commit_batch、/recall，可配置延迟、错误率与存储容量，
+用于在没有真实 EVERMEM_URL 的环境（CI、本机）下以 REAL 模式压测 backend/api/main.py。
+
+    python scripts/evermem_stub.py --port 9100 --latency-ms 20 --jitter-ms 10 --error-rate 0.02 --max-cells 200000
+    EVERMEM_URL=http://127.0.0.1:9100 uvicorn backend.api.main:app --port 8000
+
+运行中可通过 POST /stub/config 调整参数（模拟远端变慢或抖动），GET /stub/stats 查看计数。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import Body, FastAPI, HTTPException
+
+from backend.core.evermem_client import decode_cursor
+from backend.core.local_store import LocalCellStore
+
+
+class StubConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 max_cells: Optional[int] = None, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.max_cells = max_cells
+        self.rng = random.Random(seed)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"latency_ms": self.latency_ms, "jitter_ms": self.jitter_ms, "error_rate": self.error_rate,
+                "max_cells": self.max_cells}
+
+
+def create_app(latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+               max_cells: Optional[int] = None, seed: Optional[int] = None, store_path: str = ":memory:") -> FastAPI:
+    """
+    latency_ms/jitter_ms：每个请求附加 latency ± jitter 毫秒的延迟；error_rate：按概率返回 503；
+    max_cells：存储上限，写满后提交返回 507（客户端按服务端错误降级）。
+    """
+    app = FastAPI(title="EverMem stub")
+    config = StubConfig(latency_ms, jitter_ms, error_rate, max_cells, seed)
+    store = LocalCellStore(store_path)
+    counters = {"commits": 0, "recalls": 0, "injected_errors": 0, "rejected_full": 0}
+    app.state.config, app.state.store, app.state.counters = config, store, counters
+
+    async def disturb():
+        delay = config.latency_ms + config.rng.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if config.error_rate and config.rng.random() < config.error_rate:
+            counters["injected_errors"] += 1
+            raise HTTPException(status_code=503, detail="injected failure")
+
+    def save(cells: List[Dict[str, Any]]):
+        if config.max_cells is not None and len(store) + len(cells) > config.max_cells:
+            counters["rejected_full"] += 1
+            raise HTTPException(status_code=507, detail="stub storage full")
+        store.add_many(cells)
+        counters["commits"] += len(cells)
+
+    @app.post("/commit")
+    async def commit(cell: Dict[str, Any] = Body(...)):
+        await disturb()
+        save([cell])
+        return {"id": cell["id"]}
+
+    @app.post("/commit_batch")
+    async def commit_batch(body: Dict[str, Any] = Body(...)):
+        await disturb()
+        cells = body.get("cells") or []
+        save(cells)
+        return {"ids": [c["id"] for c in cells]}
+
+    @app.get("/recall")
+    async def recall(tags: str = "", limit: Optional[int] = None, before: Optional[str] = None,
+                     after: Optional[str] = None, cursor: Optional[str] = None):
+        await disturb()
+        counters["recalls"] += 1
+        try:
+            start_after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        flat_query = [t for t in tags.split(",") if t]
+        return [dict(c.items()) for c in store.query(flat_query, limit, before, after, start_after)]
+
+    @app.get("/stub/stats")
+    def stats():
+        return {"cells": len(store), **counters, "config": config.as_dict()}
+
+    @app.post("/stub/config")
+    def update_config(changes: Dict[str, Any] = Body(...)):
+        for key in ("latency_ms", "jitter_ms", "error_rate", "max_cells"):
+            if key in changes:
+                setattr(config, key, changes[key])
+        return config.as_dict()
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="按概率返回 503，0-1")
+    parser.add_argument("--max-cells", type=int, default=None, help="存储上限，写满后提交返回 507")
+    parser.add_argument("--store-path", default=":memory:", help="SQLite 文件路径，默认只在内存中")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.max_cells, args.seed, args.store_path)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Memory 归档的导出/导入（gzip 压缩的 NDJSON，流式读写，内存占用与批大小成正比），用于每日归档与迁移：
+
+    # 全量导出；--state 记录检查点（变更日志 seq），之后的导出只写入此后写入的 cell
+    python scripts/memory_archive.py export --store /data/evermem.db --out archive/full.ndjson.gz --state archive/state.json
+    python scripts/memory_archive.py export --store /data/evermem.db --out archive/2026-10-18.ndjson.gz --state archive/state.json
+
+    # 按导出顺序导入到新的存储
+    python scripts/memory_archive.py import --store /data/restored.db archive/full.ndjson.gz archive/2026-10-18.ndjson.gz
+
+--store 默认取 EVERMEM_STORE_PATH。格式见 backend/core/archive.py。
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.core.archive import export_archive, import_archive
+from backend.core.local_store import LocalCellStore
+
+
+def read_state(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("checkpoint")
+
+
+def write_state(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"checkpoint": checkpoint}, f)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="stream cells and citation edges to a .ndjson.gz archive")
+    exp.add_argument("--store", default=os.getenv("EVERMEM_STORE_PATH"))
+    exp.add_argument("--out", required=True)
+    exp.add_argument("--since", help="checkpoint (change-log seq; a cell id from a /1 archive also works); only cells written after it are exported")
+    exp.add_argument("--state", help="JSON file holding the last checkpoint; read before and updated after export")
+    imp = sub.add_parser("import", help="bulk-load archives (in export order) into a store")
+    imp.add_argument("--store", default=os.getenv("EVERMEM_STORE_PATH"))
+    imp.add_argument("archives", nargs="+")
+    args = parser.parse_args(argv)
+
+    if not args.store:
+        parser.error("--store (or EVERMEM_STORE_PATH) is required")
+    store = LocalCellStore(args.store)
+    try:
+        if args.command == "export":
+            since = args.since or read_state(args.state)
+            result = export_archive(store, args.out, since=int(since) if str(since).isdigit() else since)
+            if args.state:
+                write_state(args.state, result["checkpoint"])
+        else:
+            result = {"archives": [import_archive(store, path) for path in args.archives], "cells_in_store": len(store)}
+    finally:
+        store.close()
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
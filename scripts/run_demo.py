@@ -32,19 +32,10 @@ def save_demo_outputs(logger):
     with open(f"{output_dir}/decisions.json", "w", encoding="utf-8") as f:
         json.dump(decisions, f, ensure_ascii=False, indent=2)
 
-    nodes = []
-    edges = []
-    all_types = ["evidence", "decision", "requirement", "outcome"]
-    for t in all_types:
-        cells = memory_os.recall_by_tags({"type": t})
-        for cell in cells:
-            nodes.append({
-                "id": cell['id'],
-                "type": cell['type'],
-                "summary": cell['data'].get('rationale', cell['data'].get('summary', '...'))
-            })
-            for ref in cell.get('citations', []):
-                edges.append({"source": ref, "target": cell['id']})
+    # 直接复用 commit 时增量维护的援引图，不再逐类型重新 recall
+    graph = memory_os.get_graph().snapshot()
+    nodes = [{"id": n['id'], "type": n['label'], "summary": n['summary']} for n in graph['nodes']]
+    edges = [{"source": e['source'], "target": e['target']} for e in graph['edges']]
 
     with open(f"{output_dir}/graph.json", "w", encoding="utf-8") as f:
         json.dump({"nodes": nodes, "edges": edges}, f, ensure_ascii=False, indent=2)
@@ -78,8 +69,8 @@ def run_mvp_demo():
         logger.log(f"  - [Hit] ID: {cell['id']} | Tags: {cell.get('tags', [])} | Summary: {summary}")
 
     r3 = decision_service.run_evolution_round("interview", "New user insists on extreme AI speed!", tags)
-    if "Conflict Detected" in r3['logic']:
-        logger.log(f"Conflict Reason: Detected contradiction with Round 2 Falsification (Decision ID: {r2['dec_id']})")
+    if r3['conflicts']:
+        logger.log(f"Conflict Reason: Detected contradiction with Round 2 Falsification (Decision ID: {', '.join(r3['conflicts'])})")
     logger.log(f"Final Decision Rationale: {r3['logic']}\n")
 
     save_demo_outputs(logger)
@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+
+from backend.app import app, response_cache
+from backend.logic import generate_quant_survey, sql_metric_templates
+
+client = TestClient(app)
+
+LEAD = {
+    "industry": "美妆", "market": "北美", "company_stage": "1-10", "growth_driver": ["Marketing"],
+    "biz_positioning": "核心业务", "core_problem": "详情页转化大幅下滑", "target_goal": "首单转化",
+}
+
+
+def test_generator_responses_cached_with_etag():
+    """生成器响应按归一化输入缓存，内容与直接生成一致，If-None-Match 命中返回 304"""
+    response_cache.clear()
+    r = client.post("/api/quant_survey", json=LEAD)
+    assert r.status_code == 200
+    assert r.json() == {"quant_survey": generate_quant_survey(LEAD)}
+    etag = r.headers["ETag"]
+
+    # 不影响输出的字段变化、首尾空白不会打破缓存
+    again = client.post("/api/quant_survey", json={**LEAD, "market": "欧洲", "target_goal": " 首单转化 "},
+                        headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert response_cache.stats()["hits"] == 1
+
+    other = client.post("/api/quant_survey", json={**LEAD, "target_goal": "复购"})
+    assert other.headers["ETag"] != etag
+
+
+def test_sql_templates_precomputed():
+    """SQL 模板为预先序列化的常量，支持 304"""
+    r = client.get("/api/sql_templates")
+    assert r.json() == {"templates": sql_metric_templates()}
+    assert client.get("/api/sql_templates", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+
+def test_metrics_endpoint_uses_route_templates():
+    """/metrics 按路由模板输出请求延迟直方图，并包含 EverMem 指标"""
+    client.get("/api/sql_templates")
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_bucket{app="research",method="GET",route="/api/sql_templates",status="200"' in body
+    assert "# TYPE evermem_commit_duration_seconds histogram" in body
+    assert "evermem_local_store_cells " in body
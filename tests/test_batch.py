@@ -0,0 +1,64 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from backend import batch
+from backend.app import app
+
+LEAD = {
+    "industry": "美妆", "market": "北美", "company_stage": "1-10", "growth_driver": ["Marketing"],
+    "biz_positioning": "核心业务", "core_problem": "详情页转化大幅下滑", "target_goal": "首单转化",
+}
+
+
+def test_batch_endpoint_streams_results_with_per_record_errors():
+    """批量接口按输入顺序流式返回 JSONL，坏记录单独报错"""
+    body = "\n".join([
+        json.dumps({**LEAD, "id": "lead-1"}, ensure_ascii=False),
+        "{not json",
+        json.dumps({"id": "lead-3", "industry": "SaaS"}),
+    ]) + "\n"
+    try:
+        res = TestClient(app).post("/api/batch/diagnose_plan?budget_level=高", content=body.encode("utf-8"))
+    finally:
+        batch.shutdown_pool()
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in res.text.splitlines()]
+    assert [(r["line"], r["ok"]) for r in rows] == [(1, True), (2, False), (3, False)]
+    assert rows[0]["id"] == "lead-1"
+    assert rows[0]["diagnose"]["problem_types"] == ["漏斗转化折损"]
+    assert "validation_metrics" in rows[0]["plan"]
+    assert "invalid JSON" in rows[1]["error"]
+    assert rows[2]["id"] == "lead-3" and rows[2]["details"]
+
+
+def test_run_batch_process_pool_keeps_input_order():
+    """进程池跨多个分块处理，输出顺序与输入一致"""
+    lines = [json.dumps({**LEAD, "id": i}, ensure_ascii=False) for i in range(25)]
+    out = [json.loads(line) for line in batch.run_batch(lines, workers=2, chunk_size=4)]
+    assert [r["id"] for r in out] == list(range(25))
+    assert all(r["ok"] for r in out)
+
+
+def test_batch_pool_picks_up_swapped_rules():
+    """共享进程池建好后替换规则，后续批量任务按新规则诊断"""
+    import asyncio
+    import io
+
+    from backend import logic
+
+    async def collect(body):
+        return [json.loads(line) async for line in batch.arun_batch(io.BytesIO(body))]
+
+    body = (json.dumps(LEAD, ensure_ascii=False) + "\n").encode("utf-8")
+    original = logic.DIAGNOSE_RULES
+    old_workers, batch.BATCH_WORKERS = batch.BATCH_WORKERS, 1
+    try:
+        assert asyncio.run(collect(body))[0]["diagnose"]["problem_types"] == ["漏斗转化折损"]
+        logic.set_diagnose_rules([dict(r, value="详情页问题") if r["id"] == "problem.funnel" else r for r in original])
+        assert asyncio.run(collect(body))[0]["diagnose"]["problem_types"] == ["详情页问题"]
+    finally:
+        logic.set_diagnose_rules(original)
+        batch.shutdown_pool()
+        batch.BATCH_WORKERS = old_workers
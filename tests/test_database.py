@@ -0,0 +1,203 @@
+import pytest
+from backend.core import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "research_os.db"))
+    database.init_db()
+    yield database
+    database.close_connection()
+
+
+def make_trace(i, step="diagnose", status="ok", score=1.0):
+    return {"trace_id": f"t{i}", "step_name": step, "input_data": {"i": i}, "output_data": {"ok": True},
+            "status": status, "score": score}
+
+
+def test_connection_uses_wal_and_is_reused(db):
+    """同一线程复用连接，且开启 WAL"""
+    conn = db.get_connection()
+    assert conn is db.get_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_save_traces_bulk_single_transaction(db):
+    """批量写入后可全部读出；单条失败时整批回滚"""
+    db.save_traces_bulk([make_trace(i) for i in range(3)])
+    assert {t["trace_id"] for t in db.get_all_traces()} == {"t0", "t1", "t2"}
+
+    with pytest.raises(Exception):
+        db.save_traces_bulk([make_trace(10), make_trace(0)])
+    assert len(db.get_all_traces()) == 3
+
+
+def test_list_traces_filters_paginates_and_projects(db):
+    """过滤 + keyset 分页；默认不返回大字段"""
+    db.save_traces_bulk([make_trace(i, step="diagnose" if i % 2 else "plan", score=i / 10) for i in range(6)])
+
+    rows, cursor = db.list_traces(limit=2, step="diagnose")
+    assert "input_data" not in rows[0]
+    more, tail = db.list_traces(limit=2, step="diagnose", cursor=cursor)
+    assert tail is None
+    assert [r["trace_id"] for r in rows + more] == ["t5", "t3", "t1"]
+
+    rows, _ = db.list_traces(min_score=0.2, max_score=0.4, include_payload=True)
+    assert {r["trace_id"] for r in rows} == {"t2", "t3", "t4"}
+    assert rows[0]["input_data"]
+
+
+def test_traces_endpoint_streams_ndjson(db):
+    """format=ndjson 时逐行流式导出"""
+    import json
+    from fastapi.testclient import TestClient
+    from backend.api.main import app
+
+    db.save_traces_bulk([make_trace(i) for i in range(3)])
+    client = TestClient(app)
+    r = client.get("/api/v1/traces", params={"format": "ndjson"}, headers={"X-API-Key": "admin123"})
+    assert r.status_code == 200
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["trace_id"] for row in lines] == ["t2", "t1", "t0"]
+
+
+def make_snapshot(version_id, parent=None, **extra):
+    return {"version_id": version_id, "parent_version_id": parent, "persona": {"v": version_id},
+            "hypotheses": [], "prd_markdown": f"# {version_id}", **extra}
+
+
+def test_snapshot_head_and_history(db):
+    """head 指针随 save_snapshot 更新；history 由新到旧回溯版本链"""
+    db.save_snapshot(make_snapshot("v1"))
+    db.save_snapshot(make_snapshot("v2", "v1"))
+    db.save_snapshot(make_snapshot("v3", "v2"))
+    db.save_snapshot(make_snapshot("x1", lineage="other"))
+
+    assert db.get_latest_snapshot()["version_id"] == "v3"
+    assert db.get_latest_snapshot("other")["version_id"] == "x1"
+    assert [s["version_id"] for s in db.get_snapshot_history()] == ["v3", "v2", "v1"]
+    assert [s["version_id"] for s in db.get_snapshot_history("v2", limit=1)] == ["v2"]
+    assert db.get_snapshot_history(lineage="missing") == []
+
+
+def test_snapshot_delta_roundtrip_across_checkpoints(db, monkeypatch):
+    """delta + checkpoint 存储可透明重建任意版本（含清空缓存后）"""
+    from backend.core import snapshot_store
+
+    monkeypatch.setattr(snapshot_store, "CHECKPOINT_INTERVAL", 3)
+    prd = [f"- requirement {i}" for i in range(50)]
+    parent = None
+    for v in range(7):
+        prd[v] = f"- requirement {v} (rev {v})"
+        db.save_snapshot(make_snapshot(f"v{v}", parent, prd_markdown="\n".join(prd)))
+        parent = f"v{v}"
+
+    depths = [d for (d,) in db.get_connection().execute("SELECT depth FROM snapshot_blobs ORDER BY version_id")]
+    assert depths == [0, 1, 2, 0, 1, 2, 0]
+
+    snapshot_store.clear_cache()
+    history = db.get_snapshot_history()
+    assert [s["version_id"] for s in history] == [f"v{v}" for v in range(6, -1, -1)]
+    assert history[0]["prd_markdown"] == "\n".join(prd)
+    assert "(rev 2)" in history[4]["prd_markdown"] and "(rev 3)" not in history[4]["prd_markdown"]
+    assert history[4]["persona"] == {"v": "v2"}
+
+
+def test_outbox_replicates_with_retry(db):
+    """trace 写入与 outbox 同事务；复制失败按退避重试，成功后清空且幂等"""
+    from backend.core.evermem_client import EverMemClient
+
+    class Down:
+        def ship_cells(self, cells):
+            raise ConnectionError("evermem down")
+
+    db.save_traces_bulk([make_trace(1), make_trace(2)])
+    status = db.replication_status()
+    assert status["pending"] == 2
+
+    assert db.drain_outbox(Down()) == 0
+    status = db.replication_status()
+    assert status["pending"] == 2 and status["max_attempts"] == 1 and "down" in status["last_error"]
+
+    db.get_connection().execute("UPDATE memory_outbox SET next_attempt_at = 0")
+    mem = EverMemClient(base_url=None)
+    assert db.drain_outbox(mem) == 2
+    assert db.replication_status()["pending"] == 0
+    traces = mem.recall_by_tags({"type": "trace", "step": "diagnose"})
+    assert len(traces) == 2
+    mem.ship_cells([{"cell_type": "Trace", "data": {}, "cell_id": traces[0]["id"]}])
+    assert len(mem.recall_by_tags({"type": "trace"})) == 2
+
+
+def test_outbox_dead_letters_rejected_cells(db):
+    """被远端 4xx 拒收的 cell 单独进入死信，同批其余 cell 正常复制；瞬时错误不进死信，按封顶的退避继续重试"""
+    import time
+    from backend.core import outbox
+
+    class Rejected(Exception):
+        def __init__(self):
+            super().__init__("422 Unprocessable Entity")
+            self.response = type("Resp", (), {"status_code": 422})()
+
+    class Picky:
+        def __init__(self):
+            self.shipped = []
+
+        def ship_cells(self, cells):
+            if any(c["data"]["trace_id"] == "t2" for c in cells):
+                raise Rejected()
+            self.shipped += [c["data"]["trace_id"] for c in cells]
+
+    db.save_traces_bulk([make_trace(1), make_trace(2), make_trace(3)])
+    client = Picky()
+    assert db.drain_outbox(client) == 2
+    assert client.shipped == ["t1", "t3"]
+    status = db.replication_status()
+    assert status["pending"] == 0 and status["dead_letters"] == 1
+
+    class Down:
+        def ship_cells(self, cells):
+            raise ConnectionError("evermem down")
+
+    db.save_traces_bulk([make_trace(4)])
+    conn = db.get_connection()
+    conn.execute("UPDATE memory_outbox SET attempts = ?", (outbox.ALERT_ATTEMPTS * 10,))
+    db.drain_outbox(Down())
+    status = db.replication_status()
+    assert status["dead_letters"] == 1 and status["pending"] == 1
+    assert status["max_attempts"] == outbox.ALERT_ATTEMPTS * 10 + 1
+    next_at = conn.execute("SELECT next_attempt_at FROM memory_outbox").fetchone()[0]
+    assert next_at - time.time() <= outbox.RETRY_MAX_DELAY * 1.1 + 1
+
+
+def test_schema_migrations_are_versioned(db):
+    """迁移按 user_version 只执行一次；已是最新版本时不再执行 DDL；版本更新的库拒绝打开"""
+    from backend.core.migrations import migrate, schema_version
+
+    conn = db.get_connection()
+    assert schema_version(conn) == len(db.SCHEMA_MIGRATIONS)
+    assert migrate(conn, db.SCHEMA_MIGRATIONS) == 0
+
+    conn.execute("PRAGMA user_version = 0")
+    assert migrate(conn, db.SCHEMA_MIGRATIONS) == len(db.SCHEMA_MIGRATIONS)
+    conn.execute(f"PRAGMA user_version = {len(db.SCHEMA_MIGRATIONS) + 1}")
+    with pytest.raises(RuntimeError):
+        migrate(conn, db.SCHEMA_MIGRATIONS)
+    conn.execute(f"PRAGMA user_version = {len(db.SCHEMA_MIGRATIONS)}")
+
+
+def test_rolled_back_snapshot_is_not_cached(db):
+    """快照事务回滚时不写入缓存，后续版本的 delta 不会建立在未持久化的版本上"""
+    from backend.core import snapshot_store
+
+    db.save_snapshot(make_snapshot("v0"))
+    assert snapshot_store._cache_get(db.DB_PATH, "v0") is not None
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            snapshot_store.write_doc(conn, db.DB_PATH, "v1", "v0", make_snapshot("v1", "v0"))
+            raise RuntimeError("abort")
+    assert snapshot_store._cache_get(db.DB_PATH, "v1") is None
+
+    db.save_snapshot(make_snapshot("v1", "v0", prd_markdown="persisted"))
+    snapshot_store.clear_cache()
+    assert db.get_snapshot_history()[0]["prd_markdown"] == "persisted"
@@ -28,3 +28,51 @@ def test_trace_graph_returns_nodes_edges():
     assert "edges" in data
     assert isinstance(data["nodes"], list)
     assert isinstance(data["edges"], list)
+
+def test_evidence_search_paginates_with_cursor_header():
+    """evidence/search 支持 limit，下一页游标通过 X-Next-Cursor 返回"""
+    for i in range(3):
+        client.post("/api/v1/evidence", json={"source_type": "Interview", "summary": f"page-{i}"}, headers=HEADERS)
+    r = client.get("/api/v1/evidence/search", params={"limit": 2}, headers=HEADERS)
+    assert r.status_code == 200
+    assert len(r.json()) == 2
+    cursor = r.headers["X-Next-Cursor"]
+    r2 = client.get("/api/v1/evidence/search", params={"limit": 2, "cursor": cursor}, headers=HEADERS)
+    assert r2.status_code == 200
+    assert not {c["id"] for c in r.json()} & {c["id"] for c in r2.json()}
+    assert client.get("/api/v1/evidence/search", params={"cursor": "@@"}, headers=HEADERS).status_code == 400
+
+def test_trace_graph_etag_and_delta():
+    """trace_graph 支持 If-None-Match 304 与 since_version 增量"""
+    r = client.get("/api/v1/trace_graph", headers=HEADERS)
+    etag, version, epoch = r.headers["ETag"], r.json()["version"], r.json()["epoch"]
+    assert client.get("/api/v1/trace_graph", headers={**HEADERS, "If-None-Match": etag}).status_code == 304
+
+    ev = client.post("/api/v1/evidence", json={"source_type": "Interview", "summary": "delta"}, headers=HEADERS).json()["evidence_id"]
+    dec = client.post("/api/v1/decision", json={"decision_type": "Pivot", "rationale": "r", "citations": [ev]}, headers=HEADERS).json()["decision_id"]
+    delta = client.get("/api/v1/trace_graph", params={"since_version": version, "epoch": epoch},
+                       headers={**HEADERS, "If-None-Match": etag}).json()
+    assert delta["delta"] is True
+    assert [n["id"] for n in delta["nodes"]] == [ev, dec]
+    assert delta["edges"] == [{"source": ev, "target": dec, "type": "cites"}]
+
+    # 版本号属于另一个 epoch（重启 / 其他 worker）时返回全量，而不是漏掉节点的增量
+    full = client.get("/api/v1/trace_graph", params={"since_version": version, "epoch": "other"}, headers=HEADERS).json()
+    assert full["delta"] is False and {ev, dec} <= {n["id"] for n in full["nodes"]}
+
+def test_evidence_idempotency_key_deduplicates_retries():
+    """同一个 Idempotency-Key 重复提交只写入一次，返回首次的 id；换了请求体返回 422；键按接口划分"""
+    import uuid
+
+    headers = {**HEADERS, "Idempotency-Key": uuid.uuid4().hex}
+    body = {"source_type": "Interview", "summary": "retried"}
+    first = client.post("/api/v1/evidence", json=body, headers=headers).json()["evidence_id"]
+    again = client.post("/api/v1/evidence", json=body, headers=headers).json()["evidence_id"]
+    assert again == first
+    assert client.post("/api/v1/evidence", json=body, headers=HEADERS).json()["evidence_id"] != first
+
+    res = client.post("/api/v1/evidence", json={**body, "summary": "changed"}, headers=headers)
+    assert res.status_code == 422 and "Idempotency" in res.json()["detail"]
+    decision = client.post("/api/v1/decision", json={"decision_type": "Requirement_Gen", "rationale": "r", "citations": [first]},
+                           headers=headers)
+    assert decision.status_code == 200 and decision.json()["decision_id"] != first
@@ -0,0 +1,33 @@
+from backend.services.decision_service import decision_service, falsification_index
+
+
+def test_interview_cites_falsifying_decision():
+    """证伪后的同上下文访谈直接命中证伪索引，并援引对应决策"""
+    tags = {"domain": "test-falsify", "stage": "1-10"}
+    first = decision_service.run_evolution_round("interview", "Users want speed.", tags)
+    assert first["conflicts"] == []
+
+    falsified = decision_service.run_evolution_round("metrics", {"cvr": 0.01}, tags)
+    again = decision_service.run_evolution_round("interview", "More SPEED please", tags)
+    assert again["conflicts"] == [falsified["dec_id"]]
+    assert "Conflict Detected" in again["logic"]
+
+    other = decision_service.run_evolution_round("interview", "speed", {"domain": "test-other"})
+    assert other["conflicts"] == []
+
+
+def test_falsification_index_rebuilds_from_memory():
+    """索引清空后从 Memory 中的 FALSIFIED 决策重建"""
+    tags = {"domain": "test-rebuild"}
+    falsified = decision_service.run_evolution_round("metrics", {"cvr": 0.0}, tags)
+    falsification_index.reset()
+    assert falsification_index.lookup(tags, "speed") == [falsified["dec_id"]]
+
+
+def test_falsification_matches_context_subset():
+    """更宽的上下文（标签子集）也能命中证伪；不相交的上下文不命中"""
+    falsified = decision_service.run_evolution_round("metrics", {"cvr": 0.01}, {"domain": "test-subset", "stage": "1-10"})
+    assert falsification_index.lookup({"domain": "test-subset"}, "speed") == [falsified["dec_id"]]
+    assert falsification_index.lookup({"domain": "test-subset", "stage": "10-100"}, "speed") == []
+    falsification_index.reset()
+    assert falsification_index.lookup({"domain": "test-subset"}, "speed") == [falsified["dec_id"]]
@@ -0,0 +1,579 @@
+import json
+
+from backend.core.evermem_client import EverMemClient
+
+
+def make_client():
+    return EverMemClient(base_url=None)
+
+
+def test_recall_intersects_tags_newest_first():
+    """多标签召回只返回同时命中全部标签的 cell，且按时间倒序"""
+    mem = make_client()
+    a = mem.commit_cell("Decision", {"rationale": "a"}, {"domain": "fintech", "stage": "1-10"})
+    mem.commit_cell("Decision", {"rationale": "b"}, {"domain": "retail", "stage": "1-10"})
+    c = mem.commit_cell("Decision", {"rationale": "c"}, {"domain": "fintech", "stage": "1-10"})
+    mem.commit_cell("Evidence", {"summary": "d"}, {"domain": "fintech", "stage": "1-10"})
+
+    hits = mem.recall_by_tags({"domain": "fintech", "type": "decision"})
+    assert [h["id"] for h in hits] == [c, a]
+    assert hits[0]["data"] == {"rationale": "c"}
+
+
+def test_recall_unknown_tag_returns_empty():
+    """任一标签没有 posting list 时直接返回空"""
+    mem = make_client()
+    mem.commit_cell("Evidence", {"summary": "x"}, {"domain": "fintech"})
+    assert mem.recall_by_tags({"domain": "fintech", "stage": "nope"}) == []
+
+
+def test_recalled_data_is_decoupled_from_caller():
+    """提交后修改调用方的 dict 不影响已存储的 data"""
+    mem = make_client()
+    data = {"summary": "original"}
+    mem.commit_cell("Evidence", data, {"domain": "fintech"})
+    data["summary"] = "mutated"
+    assert mem.recall_by_tags({"type": "evidence"})[0]["data"] == {"summary": "original"}
+
+
+def test_real_mode_reuses_pooled_clients():
+    """REAL 模式下同步/异步调用各复用同一个 httpx 客户端"""
+    import asyncio
+    import httpx
+
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        if request.url.path == "/recall":
+            return httpx.Response(200, json=[{"id": "evidence_1", "tags": ["type:evidence"]}])
+        return httpx.Response(200, json={"ok": True})
+
+    mem = EverMemClient(base_url="http://evermem.test", transport=httpx.MockTransport(handler))
+    mem.commit_cell("Evidence", {"summary": "a"}, {"domain": "x"})
+    first = mem._client()
+    assert mem.recall_by_tags({"type": "evidence"})[0]["id"] == "evidence_1"
+    assert mem._client() is first
+
+    async def run():
+        await mem.acommit_cell("Evidence", {"summary": "b"}, {"domain": "x"})
+        hits = await asyncio.gather(*(mem.arecall_by_tags({"type": t}) for t in ["evidence", "decision"]))
+        await mem.aclose()
+        return hits
+
+    assert len(asyncio.run(run())) == 2
+    assert seen == ["/commit", "/recall", "/commit", "/recall", "/recall"]
+    assert len(mem._local) == 0
+    mem.close()
+
+
+def test_commit_cells_resolves_in_batch_citations():
+    """批量提交时预分配的 id 可被同批次 cell 援引"""
+    mem = make_client()
+    ev_id = mem.new_cell_id()
+    ids = mem.commit_cells([
+        {"cell_type": "Evidence", "cell_id": ev_id, "data": {"summary": "s"}, "tags": {"domain": "x"}},
+        {"cell_type": "Decision", "data": {"rationale": "r"}, "tags": {"domain": "x"}, "citations": [ev_id]},
+    ])
+    assert ids[0] == ev_id
+    decision = mem.recall_by_tags({"type": "decision"})[0]
+    assert decision["id"] == ids[1]
+    assert decision["citations"] == [ev_id]
+
+
+def test_write_behind_batches_and_flushes():
+    """write-behind 模式下提交立即返回，recall 能读到未送达的 cell，flush 后一次批量送达"""
+    import threading
+    import httpx
+
+    gate = threading.Event()
+    shipped = []
+
+    def handler(request):
+        if request.url.path == "/recall":
+            return httpx.Response(200, json=[])
+        gate.wait(5)
+        if request.url.path == "/commit_batch":
+            return httpx.Response(404)
+        shipped.append(request.url.path)
+        return httpx.Response(200, json={"ok": True})
+
+    mem = EverMemClient(base_url="http://evermem.test", transport=httpx.MockTransport(handler), write_behind=True)
+    ids = mem.commit_cells([
+        {"cell_type": "Evidence", "data": {"summary": "a"}, "tags": {"domain": "x"}},
+        {"cell_type": "Outcome", "data": {"verdict": "b"}, "tags": {"domain": "x"}},
+    ])
+    assert {c["id"] for c in mem.recall_by_tags({"domain": "x"})} == set(ids)
+
+    gate.set()
+    mem.flush()
+    assert shipped == ["/commit", "/commit"]
+    assert mem.recall_by_tags({"domain": "x"}) == []
+    mem.close()
+
+
+def test_local_store_survives_restart(tmp_path):
+    """配置 store_path 后重启客户端，热索引从 SQLite 重建，历史可召回"""
+    path = str(tmp_path / "evermem.db")
+    mem = EverMemClient(base_url=None, store_path=path)
+    ev_id = mem.commit_cell("Evidence", {"summary": "kept"}, {"domain": "fintech"})
+    mem._local.close()
+
+    restarted = EverMemClient(base_url=None, store_path=path)
+    hits = restarted.recall_by_tags({"domain": "fintech", "type": "evidence"})
+    assert [h["id"] for h in hits] == [ev_id]
+    assert hits[0]["data"] == {"summary": "kept"}
+
+
+def test_recall_limit_cursor_and_window():
+    """limit + cursor 分页不重不漏，before/after 按时间窗口裁剪"""
+    from backend.core.evermem_client import next_cursor
+
+    mem = make_client()
+    ids = [mem.commit_cell("Evidence", {"n": i}, {"domain": "x"}) for i in range(5)]
+    newest_first = list(reversed(ids))
+
+    pages, cursor = [], None
+    while True:
+        page = mem.recall_by_tags({"domain": "x"}, limit=2, cursor=cursor)
+        pages.extend(c["id"] for c in page)
+        cursor = next_cursor(page, 2)
+        if not cursor:
+            break
+    assert pages == newest_first
+
+    cells = mem.recall_by_tags({"domain": "x"})
+    window = mem.recall_by_tags({"domain": "x"}, before=cells[0]["timestamp"], after=cells[-1]["timestamp"])
+    assert [c["id"] for c in window] == newest_first[1:-1]
+
+
+def test_server_errors_fall_back_to_local_store():
+    """EverMem 返回 5xx 时，write-behind 与异步队列满两条路径都降级落到本地存储"""
+    import asyncio
+    import httpx
+
+    def handler(request):
+        if request.url.path == "/recall":
+            return httpx.Response(503)
+        return httpx.Response(500)
+
+    mem = EverMemClient(base_url="http://evermem.test", transport=httpx.MockTransport(handler), write_behind=True)
+    mem.commit_cells([{"cell_type": "Evidence", "data": {"summary": "a"}, "tags": {"domain": "x"}}])
+    mem.flush()
+    assert len(mem._local) == 1
+
+    mem._write_queue.put_nowait = lambda item: False
+    asyncio.run(mem.acommit_cell("Outcome", {"verdict": "b"}, {"domain": "x"}))
+    assert {c["type"] for c in mem.recall_by_tags({"domain": "x"})} == {"Evidence", "Outcome"}
+    mem.close()
+
+
+def test_graph_resyncs_from_remote(monkeypatch):
+    """REAL 模式下远端召回失败不标记图已就绪；之后按间隔补入其他进程提交的 cell"""
+    import httpx
+    from backend.core import evermem_client
+
+    remote = []
+    state = {"up": False}
+
+    def handler(request):
+        if not state["up"]:
+            return httpx.Response(503)
+        tag = request.url.params["tags"]
+        return httpx.Response(200, json=[c for c in remote if tag in c["tags"]])
+
+    mem = EverMemClient(base_url="http://evermem.test", transport=httpx.MockTransport(handler))
+    assert len(mem.get_graph()) == 0 and not mem._graph_ready
+
+    state["up"] = True
+    remote.append({"id": "evidence_a", "type": "Evidence", "data": {"summary": "a"}, "tags": ["type:evidence"],
+                   "citations": [], "timestamp": "2026-01-01T00:00:00"})
+    assert len(mem.get_graph()) == 1 and mem._graph_ready
+    version = mem.graph.version
+
+    remote.append({"id": "decision_b", "type": "Decision", "data": {"rationale": "b"}, "tags": ["type:decision"],
+                   "citations": ["evidence_a"], "timestamp": "2026-01-01T00:00:01"})
+    assert len(mem.get_graph()) == 1
+    monkeypatch.setattr(evermem_client, "GRAPH_RESYNC_INTERVAL", 0)
+    assert len(mem.get_graph()) == 2 and mem.graph.version > version
+    mem.close()
+
+
+def test_cell_codec_lazy_decode_and_legacy_rows(tmp_path):
+    """zlib 编码的 cell 带格式标记、召回时延迟解码；旧库（无 encoding 列）按 json 读取"""
+    import json
+    import sqlite3
+
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE cells (id TEXT PRIMARY KEY, type TEXT NOT NULL, content TEXT NOT NULL, "
+                 "tags TEXT NOT NULL, citations TEXT NOT NULL, timestamp TEXT NOT NULL)")
+    conn.execute("INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?)",
+                 ("evidence_old", "Evidence", json.dumps({"summary": "old"}), json.dumps(["domain:x", "type:evidence"]),
+                  "[]", "2020-01-01T00:00:00"))
+    conn.commit()
+    conn.close()
+
+    mem = EverMemClient(base_url=None, store_path=path, encoding="zlib")
+    new_id = mem.commit_cell("Evidence", {"summary": "新的证据"}, {"domain": "x"})
+    assert mem._local._conn.execute("SELECT encoding FROM cells WHERE id = ?", (new_id,)).fetchone() == ("zlib",)
+
+    mem._local.drop_hot()
+    hits = mem.recall_by_tags({"domain": "x"})
+    assert [h["id"] for h in hits] == [new_id, "evidence_old"]
+    assert not hits[0].decoded
+    assert [h["data"]["summary"] for h in hits] == ["新的证据", "old"]
+
+
+
+def test_binary_encoding_stored_as_raw_bytes(tmp_path):
+    """二进制编码的正文在段文件里存原始字节（不经 base64）；导出载荷仍是文本形态；升级前写入的文本形态记录照常读取"""
+    import base64
+    import zlib
+    from backend.core import codec
+    from backend.core.local_store import LocalCellStore
+
+    store = LocalCellStore(str(tmp_path / "raw.db"))
+    encoding, content = codec.encode({"summary": "二进制正文"}, "zlib")
+    store.add({"id": "c1", "type": "Evidence", "encoding": encoding, "content": content,
+               "tags": ["domain:x"], "citations": [], "timestamp": "2026-01-01T00:00:00"})
+    seg, offset, length, raw = store._conn.execute("SELECT seg, seg_offset, seg_length, raw FROM cells").fetchone()
+    assert raw == 1 and store._segments.read((seg, offset, length)) == base64.b64decode(content)
+
+    # 模拟旧版本写入的记录：段里是 base64 文本，raw = 0
+    legacy = base64.b64encode(zlib.compress(b'{"summary":"old"}')).decode("ascii")
+    pointer = store._segments.append_many([legacy.encode("ascii")])[0]
+    with store._conn:
+        store._conn.execute("INSERT INTO cells (id, type, content, tags, citations, timestamp, encoding, seg, seg_offset, seg_length) "
+                            "VALUES ('c0', 'Evidence', '', '[]', '[]', '2025-01-01T00:00:00', 'zlib', ?, ?, ?)", pointer)
+        store._conn.execute("INSERT INTO cell_log (cell_id) VALUES ('c0')")
+    store.drop_hot()
+    assert [c["data"]["summary"] for c in store._fetch(["c0", "c1"])] == ["old", "二进制正文"]
+    payloads = {p["id"]: p["content"] for _, p in store.iter_log()}
+    assert payloads == {"c0": legacy, "c1": content}
+    store.close()
+
+
+def test_real_mode_against_stub_server():
+    """REAL 模式对接本地 EverMem 替身：提交后可召回；注入的 503 触发本地降级"""
+    import asyncio
+    import httpx
+    from scripts.evermem_stub import create_app
+
+    stub = create_app(seed=1)
+    mem = EverMemClient(base_url="http://stub", transport=httpx.ASGITransport(app=stub))
+
+    async def scenario():
+        a = await mem.acommit_cell("Evidence", {"summary": "a"}, {"domain": "x"})
+        b, c = await mem.acommit_cells([{"cell_type": "Evidence", "data": {"summary": s}, "tags": {"domain": "x"}}
+                                        for s in ("b", "c")])
+        hits = await mem.arecall_by_tags({"domain": "x"}, limit=2)
+        stub.state.config.error_rate = 1.0
+        d = await mem.acommit_cell("Evidence", {"summary": "d"}, {"domain": "x"})
+        return a, b, c, d, hits
+
+    a, b, c, d, hits = asyncio.run(scenario())
+    assert len(stub.state.store) == 3
+    assert [h["data"]["summary"] for h in hits] == ["c", "b"]
+    assert d in mem._local and a not in mem._local
+    assert stub.state.counters["injected_errors"] == 1
+
+
+def test_circuit_breaker_opens_and_replays_on_recovery(monkeypatch):
+    """连续失败后熔断，打开期间不再请求远端；半开探测成功后补发降级期间的本地提交"""
+    import httpx
+    from backend.core import evermem_client
+
+    monkeypatch.setattr(evermem_client, "BREAKER_THRESHOLD", 2)
+    state = {"up": False}
+    requests, remote = [], {}
+
+    def handler(request):
+        requests.append(request.url.path)
+        if not state["up"]:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/recall":
+            return httpx.Response(200, json=[])
+        body = json.loads(request.content)
+        for cell in body.get("cells", [body]):
+            remote[cell["id"]] = cell
+        return httpx.Response(200, json={"ok": True})
+
+    mem = EverMemClient(base_url="http://evermem.test", transport=httpx.MockTransport(handler))
+    ids = [mem.commit_cell("Evidence", {"n": i}, {"domain": "x"}) for i in range(3)]
+    assert len(requests) == 2 and mem.status()["circuit"]["state"] == "open"
+    assert [c["id"] for c in mem.recall_by_tags({"domain": "x"})] == ids[::-1]
+    assert len(requests) == 2 and mem.status()["unsynced_cells"] == 3
+
+    state["up"] = True
+    mem._breaker.reset_timeout = 0
+    mem.recall_by_tags({"domain": "x"})
+    mem._replay_thread.join(5)
+    assert mem.status()["circuit"]["state"] == "closed"
+    assert set(remote) == set(ids) and mem.status()["unsynced_cells"] == 0
+    mem.close()
+
+
+def test_recall_cache_tag_aware_invalidation():
+    """REAL 模式重复召回命中缓存；只有标签为查询超集的提交才使对应条目失效"""
+    import httpx
+
+    recalls = []
+
+    def handler(request):
+        if request.url.path == "/recall":
+            recalls.append(request.url.params["tags"])
+            return httpx.Response(200, json=[])
+        return httpx.Response(200, json={"ok": True})
+
+    mem = EverMemClient(base_url="http://evermem.test", transport=httpx.MockTransport(handler))
+    query = {"type": "evidence", "domain": "x"}
+    mem.recall_by_tags(query)
+    mem.recall_by_tags({"domain": "x", "type": "evidence"})
+    mem.commit_cell("Decision", {"rationale": "r"}, {"domain": "x"})
+    mem.commit_cell("Evidence", {"summary": "s"}, {"domain": "y"})
+    mem.recall_by_tags(query)
+    assert len(recalls) == 1
+
+    mem.commit_cell("Evidence", {"summary": "s"}, {"domain": "x", "stage": "1-10"})
+    mem.recall_by_tags(query)
+    assert len(recalls) == 2
+    assert mem.status()["recall_cache"]["hits"] == 2 and mem.status()["recall_cache"]["misses"] == 2
+    mem.close()
+
+
+def test_hot_tier_bounded_and_segments_compacted(tmp_path, monkeypatch):
+    """热层按条数限制；正文落在段文件中，压缩合并小段后所有 cell 仍可召回（含重启后）"""
+    from backend.core import local_store, segment_store
+    from backend.core.local_store import LocalCellStore
+
+    monkeypatch.setattr(local_store, "HOT_MAX_CELLS", 10)
+    monkeypatch.setattr(LocalCellStore, "_maybe_compact", lambda self: None)
+    monkeypatch.setattr(segment_store, "SEGMENT_MAX_BYTES", 512)
+    path = str(tmp_path / "cells.db")
+    mem = EverMemClient(base_url=None, store_path=path)
+    ids = [mem.commit_cell("Evidence", {"summary": f"证据 {i} " + "x" * 100}, {"domain": "x"}) for i in range(60)]
+    store = mem._local
+    assert store.stats()["hot_cells"] == 10
+    assert store.stats()["segments"] > segment_store.COMPACT_MIN_SEGMENTS
+
+    while store.compact():
+        pass
+    assert store.stats()["segments"] < segment_store.COMPACT_MIN_SEGMENTS + 1
+    store.drop_hot()
+    hits = mem.recall_by_tags({"domain": "x"}, limit=100)
+    assert sorted(h["id"] for h in hits) == sorted(ids)
+    assert {h["data"]["summary"][:5] for h in hits} >= {"证据 0 ", "证据 59"}
+    store.close()
+
+    reopened = LocalCellStore(path)
+    assert len(reopened.query(["domain:x"], limit=100)) == 60
+    reopened.close()
+
+
+
+def test_segments_shared_between_processes(tmp_path, monkeypatch):
+    """共用同一路径的两个存储各写各的段，偏移不重叠；压缩不会删除另一方仍在写入或映射的段"""
+    import os
+    from backend.core import segment_store
+    from backend.core.local_store import LocalCellStore
+
+    monkeypatch.setattr(LocalCellStore, "_maybe_compact", lambda self: None)
+    monkeypatch.setattr(segment_store, "SEGMENT_MAX_BYTES", 256)
+    path = str(tmp_path / "shared.db")
+    a, b = LocalCellStore(path), LocalCellStore(path)
+    assert a._segments.active_number != b._segments.active_number
+
+    def cell(i):
+        return {"id": f"c{i:03d}", "type": "Evidence", "encoding": "json", "content": json.dumps({"n": i, "pad": "x" * 60}),
+                "tags": ["domain:x"], "citations": [], "timestamp": f"2026-01-01T00:00:{i % 60:02d}"}
+
+    for i in range(0, 40, 2):
+        a.add(cell(i))
+        b.add(cell(i + 1))
+    # b 映射 a 封存的一个段、a 仍在写自己的当前段：a 的压缩只合并 b 的段，两者都保留
+    a_sealed = min(a._conn.execute("SELECT seg FROM cells WHERE id = 'c000'").fetchone()[0], a._segments.active_number)
+    b.drop_hot()
+    assert b._fetch(["c000"])[0]["data"]["n"] == 0
+    assert a_sealed in b._segments._maps
+    before = set(os.listdir(path + ".segments"))
+    while a.compact():
+        pass
+    assert len(set(os.listdir(path + ".segments")) - before) == 1  # 其余封存段合并成一个新段
+    assert os.path.exists(a._segments._path(a_sealed))
+    assert os.path.exists(b._segments._path(b._segments.active_number))
+
+    reader = LocalCellStore(path)
+    assert sorted(c["data"]["n"] for c in reader.query(["domain:x"], limit=100)) == list(range(40))
+    b.drop_hot()
+    assert [c["data"]["n"] for c in b._fetch([f"c{i:03d}" for i in range(40)])] == list(range(40))
+    for store in (a, b, reader):
+        store.close()
+
+
+def test_cell_ids_sortable_and_idempotent_commits():
+    """cell id 单调且字典序即时间序，游标即 id；幂等键重复的提交只写入一次"""
+    from backend.core import cell_ids
+    from backend.core.evermem_client import next_cursor
+
+    ids = [cell_ids.new_id() for _ in range(1000)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+
+    mem = make_client()
+    first = mem.commit_cells([{"cell_type": "Evidence", "data": {"n": i}, "tags": {"domain": "x"}, "idempotency_key": f"k{i}"}
+                              for i in range(3)])
+    again = mem.commit_cells([{"cell_type": "Evidence", "data": {"n": i}, "tags": {"domain": "x"}, "idempotency_key": f"k{i}"}
+                              for i in range(4)])
+    assert again[:3] == first
+    assert mem.commit_cell("Evidence", {"n": 0}, {"domain": "x"}, idempotency_key="k0") == first[0]
+    hits = mem.recall_by_tags({"domain": "x"})
+    assert [h["id"] for h in hits] == sorted(first + again[3:], reverse=True)
+    assert hits[0]["timestamp"] == cell_ids.timestamp_of(hits[0]["id"])
+
+    page = mem.recall_by_tags({"domain": "x"}, limit=2)
+    assert next_cursor(page, 2) == page[-1]["id"]
+    assert [h["id"] for h in mem.recall_by_tags({"domain": "x"}, cursor=page[-1]["id"])] == [h["id"] for h in hits[2:]]
+
+
+def test_idempotency_keys_scoped_checked_and_released(monkeypatch):
+    """幂等键按 cell 类型划分；同键不同内容抛 IdempotencyConflict；写入失败时撤销登记，重试可用同一个键"""
+    import pytest
+    from backend.core.evermem_client import IdempotencyConflict
+
+    mem = make_client()
+    ev = mem.commit_cell("Evidence", {"n": 1}, {"domain": "x"}, idempotency_key="k")
+    assert mem.commit_cell("Decision", {"n": 1}, {"domain": "x"}, idempotency_key="k") != ev
+    with pytest.raises(IdempotencyConflict):
+        mem.commit_cell("Evidence", {"n": 2}, {"domain": "x"}, idempotency_key="k")
+
+    def broken(payload):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(mem, "_store_mock", broken)
+        with pytest.raises(OSError):
+            mem.commit_cell("Evidence", {"n": 3}, {"domain": "x"}, idempotency_key="retry")
+    retried = mem.commit_cell("Evidence", {"n": 3}, {"domain": "x"}, idempotency_key="retry")
+    assert mem.recall_by_tags({"domain": "x", "type": "evidence"}, limit=10)[0]["id"] == retried
+
+
+def test_archive_incremental_export_and_import(tmp_path):
+    """归档按检查点增量导出（gzip NDJSON），全量 + 增量依次导入新存储后与原存储一致"""
+    import gzip
+    import json
+    from backend.core.archive import read_archive
+    from backend.core.local_store import LocalCellStore
+    from scripts.memory_archive import main
+
+    store_path, state = str(tmp_path / "src.db"), str(tmp_path / "state.json")
+    mem = EverMemClient(base_url=None, store_path=store_path, encoding="zlib")
+    ev = mem.commit_cell("Evidence", {"summary": "证据"}, {"domain": "x"})
+    mem.commit_cell("Decision", {"rationale": "r"}, {"domain": "x"}, citations=[ev])
+    mem._local.close()
+    main(["export", "--store", store_path, "--out", str(tmp_path / "full.ndjson.gz"), "--state", state])
+
+    mem = EverMemClient(base_url=None, store_path=store_path)
+    late = mem.commit_cell("Requirement", {"scope_summary": "v2"}, {"domain": "x"}, citations=[ev])
+    mem._local.close()
+    main(["export", "--store", store_path, "--out", str(tmp_path / "inc.ndjson.gz"), "--state", state])
+
+    inc = list(read_archive(str(tmp_path / "inc.ndjson.gz")))
+    assert [r["kind"] for r in inc] == ["header", "cell", "edge", "checkpoint"]
+    assert inc[-1]["id"] == late and json.load(open(state))["checkpoint"] == inc[-1]["seq"]
+    with gzip.open(tmp_path / "full.ndjson.gz", "rt", encoding="utf-8") as f:
+        assert sum(1 for line in f if '"kind":"edge"' in line) == 1
+
+    restored = str(tmp_path / "restored.db")
+    main(["import", "--store", restored, str(tmp_path / "full.ndjson.gz"), str(tmp_path / "inc.ndjson.gz")])
+    src, dst = LocalCellStore(store_path), LocalCellStore(restored)
+    assert [(c["id"], c["data"]) for c in dst.query(["domain:x"])] == [(c["id"], c["data"]) for c in src.query(["domain:x"])]
+    assert len(dst) == 3
+    src.close()
+    dst.close()
+
+
+def test_archive_checkpoint_keeps_cells_written_with_older_ids(tmp_path):
+    """检查点之后写入、id/时间戳却更早的 cell（如从其他存储导入）仍会进入下一次增量导出"""
+    from backend.core.archive import export_archive, import_archive, read_archive
+    from backend.core.local_store import LocalCellStore
+
+    store = LocalCellStore(str(tmp_path / "src.db"))
+
+    def cell(cell_id, timestamp):
+        return {"id": cell_id, "type": "Evidence", "encoding": "json", "content": '{"summary": "s"}',
+                "tags": ["domain:x"], "citations": [], "timestamp": timestamp}
+
+    store.add(cell(EverMemClient.new_cell_id(), "2026-06-01T00:00:00"))
+    first = export_archive(store, str(tmp_path / "a.ndjson.gz"))
+    old = "0000000000000000000000000A"
+    store.add(cell(old, "2001-01-01T00:00:00"))
+    second = export_archive(store, str(tmp_path / "b.ndjson.gz"), since=first["checkpoint"])
+    assert second["cells"] == 1 and second["checkpoint"] > first["checkpoint"]
+    assert [r["cell"]["id"] for r in read_archive(str(tmp_path / "b.ndjson.gz")) if r["kind"] == "cell"] == [old]
+    assert export_archive(store, str(tmp_path / "c.ndjson.gz"), since=second["checkpoint"])["cells"] == 0
+
+    restored = LocalCellStore(str(tmp_path / "restored.db"))
+    for name in ("a", "b"):
+        import_archive(restored, str(tmp_path / f"{name}.ndjson.gz"))
+    assert old in restored and len(restored) == 2
+    store.close()
+    restored.close()
+
+
+def test_cold_start_from_index_snapshot_within_budget(tmp_path):
+    """重启时从索引快照 + 变更日志恢复热索引与援引图，1 秒内可召回"""
+    import time
+    from backend.core.local_store import LocalCellStore
+
+    path = str(tmp_path / "cells.db")
+    mem = EverMemClient(base_url=None, store_path=path)
+    ids = mem.commit_cells([{"cell_type": "Evidence" if i % 2 else "Trace", "data": {"summary": f"s{i}"},
+                             "tags": {"domain": "x", "shard": str(i % 50)}} for i in range(2000)])
+    mem.commit_cell("Decision", {"rationale": "r"}, {"domain": "x"}, citations=[ids[1]])
+    nodes = len(mem.get_graph())
+    mem.close()
+
+    # 快照之后的写入（如进程崩溃前）由变更日志补齐
+    store = LocalCellStore(path)
+    late = EverMemClient.new_cell_id()
+    store.add({"id": late, "type": "Decision", "content": '{"rationale": "late"}', "tags": ["domain:x", "type:decision"],
+               "citations": [ids[3]], "timestamp": "2099-01-01T00:00:00"})
+    store.close()
+
+    start = time.perf_counter()
+    mem = EverMemClient(base_url=None, store_path=path)
+    hits = mem.recall_by_tags({"domain": "x"}, limit=5)
+    graph = mem.get_graph()
+    elapsed = time.perf_counter() - start
+
+    assert mem._local.loaded_from_snapshot
+    assert hits[0]["id"] == late
+    assert len(mem.recall_by_tags({"shard": "7"})) == 40
+    assert len(graph) == nodes + 1 and graph.cites(late) == [ids[3]]
+    assert elapsed < 1.0, f"cold start took {elapsed:.2f}s"
+    mem._local.close()
+
+
+def test_lazy_client_ready_does_not_block_event_loop():
+    """客户端加载期间 await ready() 在线程池中等待，事件循环照常运行；加载完成后返回同一个实例"""
+    import asyncio
+    import threading
+    from backend.core.evermem_client import LazyClient
+
+    release = threading.Event()
+
+    def factory():
+        release.wait(5)
+        return make_client()
+
+    lazy = LazyClient(factory)
+    lazy.warm_up()
+
+    async def main():
+        waiter = asyncio.ensure_future(lazy.ready())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        release.set()
+        return await waiter
+
+    assert asyncio.run(main()) is lazy._get()
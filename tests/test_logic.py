@@ -0,0 +1,35 @@
+import json
+
+from backend import logic
+
+
+def test_diagnose_reports_rule_hits():
+    """一次扫描得出问题类型/紧急度/可控性，并报告每条规则命中的关键词"""
+    out = logic.diagnose_client({
+        "core_problem": "详情页文案弱，加购后弃购，转化大幅下滑",
+        "constraints": "两周内上线",
+        "target_goal": "",
+    })
+    assert out["problem_types"] == ["漏斗转化折损", "表达与说服力"]
+    assert out["urgency"] == "高"
+    assert out["controllability"] == "高"
+    assert out["rule_hits"]["problem.funnel"] == ["转化", "加购", "弃购"]
+    assert out["rule_hits"]["control.assets"] == ["详情页", "文案"]
+
+
+def test_rules_hot_swap_and_overlapping_keywords(tmp_path):
+    """从 JSON 热替换规则；重叠与前缀关键词都能命中"""
+    rules = [
+        {"id": "a", "group": "problem_type", "field": "core_problem", "value": "A", "keywords": ["转化", "转化率"]},
+        {"id": "b", "group": "problem_type", "field": "core_problem", "value": "B", "keywords": ["化率低"]},
+    ]
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(rules, ensure_ascii=False), encoding="utf-8")
+    try:
+        logic.load_diagnose_rules(str(path))
+        out = logic.diagnose_client({"core_problem": "转化率低"})
+        assert out["problem_types"] == ["A", "B"]
+        assert out["rule_hits"] == {"a": ["转化", "转化率"], "b": ["化率低"]}
+        assert out["urgency"] == "中"
+    finally:
+        logic.set_diagnose_rules(logic.DIAGNOSE_RULES)